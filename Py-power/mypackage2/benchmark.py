@@ -0,0 +1,334 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from datetime import date, timedelta
+from pathlib import Path
+
+from main import BotAssist, Contact
+from test import FileSorter
+
+# Відтворювані виміри гарячих шляхів BotAssist і FileSorter на синтетичних даних.
+# Масштаб - кількість записів (контактів, нотаток, файлів); результати пишуться в JSON для порівняння версій
+DEFAULT_SCALES = (1000, 100000)
+FULL_SCALES = (1000, 100000, 1000000)
+BENCHMARKS = ('add_contact', 'search_contacts', 'fuzzy_search_contacts', 'search_contacts_birthday',
+              'search_notes_by_tags', 'save_data', 'load_data', 'file_sorter')
+
+FIRST_NAMES = ('Anna', 'Bohdan', 'Daria', 'Ivan', 'Kateryna', 'Maksym', 'Olena', 'Petro', 'Sofia', 'Taras',
+               'John', 'Mary', 'Іван', 'Олена', 'Марія', 'Андрій', 'Юлія', 'Євген')
+LAST_NAMES = ('Shevchenko', 'Kovalenko', 'Bondarenko', 'Tkachenko', 'Kravchenko', 'Oliinyk', 'Smith', 'Brown',
+              'Шевченко', 'Коваленко', 'Мельник', 'Ткаченко', 'Лисенко', 'Гончар')
+WORDS = ('meeting', 'project', 'budget', 'report', 'call', 'idea', 'travel', 'family', 'shopping', 'deadline',
+         'зустріч', 'проєкт', 'звіт', 'ідея', 'подорож', 'покупки')
+TAGS = tuple(f'tag{number}' for number in range(200)) + ('work', 'home', 'urgent', 'later', 'робота', 'дім')
+EXTENSIONS = tuple(extension.lower() for category, extensions in FileSorter.CATEGORIES.items()
+                   if category != FileSorter.ARCHIVES for extension in extensions) + ('bin', 'dat', 'log')
+
+
+def make_contacts(count, seed=0):
+    # Імена повторюються, як у справжній книзі; ~1% дат народження не у форматі РРРР-ММ-ДД
+    rng = random.Random(seed)
+    contacts = []
+    for number in range(count):
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+        if rng.random() < 0.5:
+            name = f'{name} {number}'
+        born = date(1940, 1, 1) + timedelta(days=rng.randrange(365 * 65))
+        birthday = born.strftime('%d.%m.%Y') if rng.random() < 0.01 else born.isoformat()
+        contacts.append((name, f'Street {rng.randrange(1000)}, {rng.randrange(200)}', f'{rng.randrange(10 ** 10):010d}',
+                         f'user{number}@example.com', birthday))
+    return contacts
+
+
+def make_notes(count, seed=0):
+    # Популярність тегів спадає за законом Ципфа: кілька тегів на більшості нотаток, решта - рідкісні
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, len(TAGS) + 1)]
+    notes = []
+    for number in range(count):
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randrange(3, 30)))
+        tags = list(dict.fromkeys(rng.choices(TAGS, weights, k=rng.randrange(0, 5))))
+        notes.append((f'note {number}', text, tags))
+    return notes
+
+
+def make_tree(root, count, seed=0):
+    # Вкладені папки з файлами різних типів; ~1% файлів - zip- і tar-архіви з кількома файлами всередині
+    rng = random.Random(seed)
+    folders = [root]
+    for number in range(max(1, count // 50)):
+        folder = rng.choice(folders) / f'folder {number}'
+        folder.mkdir()
+        folders.append(folder)
+    for number in range(count):
+        folder = rng.choice(folders)
+        kind = rng.random()
+        if kind < 0.005:
+            with zipfile.ZipFile(folder / f'archive {number}.zip', 'w') as archive:
+                for member in range(5):
+                    archive.writestr(f'inner {member}.{rng.choice(EXTENSIONS)}', os.urandom(rng.randrange(64, 4096)))
+        elif kind < 0.01:
+            with tarfile.open(folder / f'archive {number}.tar', 'w') as archive:
+                for member in range(5):
+                    data = os.urandom(rng.randrange(64, 4096))
+                    info = tarfile.TarInfo(f'inner {member}.{rng.choice(EXTENSIONS)}')
+                    info.size = len(data)
+                    archive.addfile(info, io.BytesIO(data))
+        else:
+            (folder / f'File №{number} ({rng.choice(FIRST_NAMES)}).{rng.choice(EXTENSIONS)}').write_bytes(
+                os.urandom(rng.randrange(0, 8192)))
+
+
+def filled_assistant(contacts=(), notes=()):
+    assistant = BotAssist()
+    assistant._insert_contacts([Contact(*row) for row in contacts])
+    assistant._put_notes(notes)
+    return assistant
+
+
+def quiet(function, *args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args)
+
+
+def timings(function, arguments):
+    # Час кожного виклику окремо, щоб бачити не лише середнє, а й хвіст розподілу
+    samples = []
+    for argument in arguments:
+        started = time.perf_counter()
+        function(*argument)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def summary(samples):
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {'operations': len(ordered), 'seconds': total, 'ops_per_sec': len(ordered) / total if total else None,
+            'median_us': statistics.median(ordered) * 1e6,
+            'p95_us': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1e6, 'max_us': ordered[-1] * 1e6}
+
+
+def best_of(repeat, function):
+    # Для разових операцій (збереження, сортування) береться найкращий із повторів: він найменше залежить від шуму
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        extra = function()
+        runs.append(time.perf_counter() - started)
+    result = {'seconds': min(runs), 'runs': runs}
+    result.update(extra or {})
+    return result
+
+
+def bench_add_contact(scale, repeat, queries, seed):
+    # Додавання по одному: перевірка полів, пошук дубліката і оновлення індексів для кожного контакту
+    contacts = make_contacts(scale, seed)
+
+    def add_all():
+        assistant = BotAssist()
+        for row in contacts:
+            assistant.add_contact(*row)
+
+    result = best_of(repeat, add_all)
+    result['operations'] = scale
+    result['ops_per_sec'] = scale / result['seconds']
+    return result
+
+
+def bench_search_contacts(scale, repeat, queries, seed):
+    contacts = make_contacts(scale, seed)
+    assistant = filled_assistant(contacts)
+    rng = random.Random(seed + 1)
+    words = [rng.choice(rng.choice(contacts)[0].split()) for _ in range(queries)]
+    prefixes = [(word[:rng.randrange(1, len(word) + 1)],) for word in words]
+    started = time.perf_counter()
+    # Перший пошук окремо: він включає відкладене сортування індексу після масового додавання
+    assistant.search_contacts(prefixes[0][0])
+    first = time.perf_counter() - started
+    result = summary([sample for _ in range(repeat) for sample in timings(assistant.search_contacts, prefixes)])
+    result['first_query_seconds'] = first
+    return result
+
+
+def typo(rng, text):
+    # Одна випадкова помилка: заміна, пропуск або зайва літера
+    position = rng.randrange(len(text))
+    kind = rng.randrange(3)
+    if kind == 0:
+        return text[:position] + rng.choice('aeiouy') + text[position + 1:]
+    if kind == 1:
+        return text[:position] + text[position + 1:]
+    return text[:position] + rng.choice('aeiouy') + text[position:]
+
+
+def bench_fuzzy_search_contacts(scale, repeat, queries, seed):
+    # Запити з помилкою в імені, телефоні, email чи адресі; перший запит окремо - він будує триграмний індекс
+    contacts = make_contacts(scale, seed)
+    assistant = filled_assistant(contacts)
+    rng = random.Random(seed + 4)
+    arguments = [(typo(rng, rng.choice(rng.choice(contacts)[:4])),) for _ in range(queries)]
+    started = time.perf_counter()
+    assistant.fuzzy_search_contacts(arguments[0][0])
+    first = time.perf_counter() - started
+    result = summary([sample for _ in range(repeat) for sample in timings(assistant.fuzzy_search_contacts, arguments)])
+    result['first_query_seconds'] = first
+    return result
+
+
+def bench_search_contacts_birthday(scale, repeat, queries, seed):
+    assistant = filled_assistant(make_contacts(scale, seed))
+    rng = random.Random(seed + 2)
+    arguments = [(rng.choice((0, 1, 7, 30, 365)), date(2024, 1, 1) + timedelta(days=rng.randrange(366)))
+                 for _ in range(queries)]
+    assistant.search_contacts_birthday(*arguments[0])
+    return summary([sample for _ in range(repeat) for sample in timings(assistant.search_contacts_birthday, arguments)])
+
+
+def bench_search_notes_by_tags(scale, repeat, queries, seed):
+    assistant = filled_assistant(notes=make_notes(scale, seed))
+    rng = random.Random(seed + 3)
+    arguments = []
+    for _ in range(queries):
+        # Запити всіх трьох видів: усі теги, будь-який із тегів, виключення; першою береться сторінка з 20 нотаток
+        tags = rng.sample(TAGS[:20], rng.randrange(0, 3))
+        any_tags = rng.sample(TAGS, rng.randrange(0, 3))
+        exclude = rng.sample(TAGS[:10], rng.randrange(0, 2))
+        arguments.append((tags or TAGS[:1], any_tags, exclude, 0, 20))
+    return summary([sample for _ in range(repeat) for sample in timings(assistant.search_notes_by_tags, arguments)])
+
+
+def bench_save_data(scale, repeat, queries, seed):
+    assistant = filled_assistant(make_contacts(scale, seed), make_notes(scale // 10, seed))
+    with tempfile.TemporaryDirectory() as folder:
+        path = Path(folder) / 'save.pickle'
+        result = best_of(repeat, lambda: quiet(assistant.save_data, path))
+        result['file_bytes'] = path.stat().st_size
+    return result
+
+
+def bench_load_data(scale, repeat, queries, seed):
+    # Завантаження окремо від першого запиту: знімок відкривається ліниво, і частина роботи переходить у запити
+    contacts = make_contacts(scale, seed)
+    assistant = filled_assistant(contacts, make_notes(scale // 10, seed))
+    with tempfile.TemporaryDirectory() as folder:
+        path = Path(folder) / 'save.pickle'
+        quiet(assistant.save_data, path)
+        del assistant
+        loaded = []
+
+        def load():
+            state = BotAssist()
+            quiet(state.load_data, path)
+            loaded.append(state)
+
+        result = best_of(repeat, load)
+        state = loaded[-1]
+        started = time.perf_counter()
+        state.find_contact(contacts[len(contacts) // 2][0])
+        state.search_contacts(contacts[0][0][:3])
+        state.search_notes_by_tags(['work'])
+        result['first_queries_seconds'] = time.perf_counter() - started
+    return result
+
+
+def bench_file_sorter(scale, repeat, queries, seed):
+    # Дерево щоразу створюється заново, бо сортування його змінює; створення не входить у вимір
+    runs = []
+    files = 0
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as folder:
+            root = Path(folder)
+            make_tree(root, scale, seed)
+            sorter = FileSorter(root)
+            started = time.perf_counter()
+            quiet(sorter.core)
+            runs.append(time.perf_counter() - started)
+            files = sorter.progress()[0]
+    return {'seconds': min(runs), 'runs': runs, 'files': files, 'files_per_sec': files / min(runs) if min(runs) else None}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=Path(__file__).parent, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scales, names, repeat=3, queries=200, seed=42, report=print):
+    results = []
+    for scale in scales:
+        for name in names:
+            started = time.perf_counter()
+            result = {'benchmark': name, 'scale': scale}
+            result.update(globals()[f'bench_{name}'](scale, repeat, queries, seed))
+            results.append(result)
+            report(f'{name:>26} {scale:>9}: {result["seconds"]:.4f} s ({time.perf_counter() - started:.1f} s total)')
+    return {'meta': {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': git_commit(),
+                     'python': platform.python_version(), 'implementation': platform.python_implementation(),
+                     'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+                     'repeat': repeat, 'queries': queries, 'seed': seed},
+            'results': results}
+
+
+def compare(baseline, current, threshold=1.2):
+    # Повертає рядки звіту і список регресій: бенчмарки, що стали повільнішими більш ніж у threshold разів
+    before = {(result['benchmark'], result['scale']): result for result in baseline['results']}
+    lines, regressions = [], []
+    for result in current['results']:
+        old = before.get((result['benchmark'], result['scale']))
+        if old is None or not old['seconds']:
+            continue
+        # Для запитів порівнюється медіана одного виклику, для разових операцій - найкращий час
+        metric = 'median_us' if 'median_us' in result else 'seconds'
+        ratio = result[metric] / old[metric] if old[metric] else float('inf')
+        line = f'{result["benchmark"]:>26} {result["scale"]:>9}: {old[metric]:.6g} -> {result[metric]:.6g} {metric} (x{ratio:.2f})'
+        # Разові операції коротші за мілісекунду не порівнюються: різниця в них - шум таймера і планувальника
+        if ratio > threshold and (metric != 'seconds' or result[metric] >= 0.001):
+            regressions.append(line)
+            line += '  REGRESSION'
+        lines.append(line)
+    return lines, regressions
+
+
+def start():
+    # python benchmark.py [--scales 1000,100000] [--full] [--only add_contact,file_sorter,...]
+    #                     [--repeat 3] [--queries 200] [--seed 42] [--output benchmark.json]
+    #                     [--compare baseline.json [--threshold 1.2]]
+    def option(name, default=None):
+        return sys.argv[sys.argv.index(name) + 1] if name in sys.argv[1:-1] else default
+
+    if '--full' in sys.argv[1:]:
+        scales = FULL_SCALES
+    else:
+        scales = tuple(int(scale) for scale in option('--scales', ','.join(map(str, DEFAULT_SCALES))).split(','))
+    names = option('--only', ','.join(BENCHMARKS)).split(',')
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        sys.exit(f'Unknown benchmarks: {", ".join(sorted(unknown))}. Available: {", ".join(BENCHMARKS)}')
+    data = run(scales, names, int(option('--repeat', 3)), int(option('--queries', 200)), int(option('--seed', 42)))
+    output = Path(option('--output', 'benchmark.json'))
+    output.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding='utf-8')
+    print(f'Results written to {output}')
+    baseline = option('--compare')
+    if baseline:
+        lines, regressions = compare(json.loads(Path(baseline).read_text(encoding='utf-8')), data,
+                                     float(option('--threshold', 1.2)))
+        print('\n'.join(lines))
+        if regressions:
+            sys.exit(f'{len(regressions)} benchmarks regressed')
+
+
+if __name__ == "__main__":
+    start()
@@ -0,0 +1,149 @@
+import csv
+import json
+import os
+import re
+from itertools import islice
+from operator import itemgetter
+from pathlib import Path
+
+from index import ContactIndex
+
+BATCH_SIZE = 10000
+# Приблизний розмір рядка контакту у файлі: за ним кількість рядків оцінюється ще до читання
+ROW_BYTES = 80
+CONTACT_FIELDS = ('name', 'address', 'phone', 'email', 'birthday')
+NOTE_FIELDS = ('name', 'text', 'tags')
+# Ті самі правила, що й BotAssist.validate_phone та validate_email, але шаблони компілюються один раз
+PHONE = re.compile(r'\d{10}')
+EMAIL = re.compile(r'.*@[^@]*\.[^@]*', re.DOTALL)
+
+
+def file_format(path):
+    suffix = Path(path).suffix.lower()
+    if suffix == '.csv':
+        return 'csv'
+    if suffix in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    raise ValueError(f"Unsupported file format '{suffix}', use .csv or .jsonl")
+
+
+def estimated_rows(path):
+    try:
+        return os.path.getsize(path) // ROW_BYTES
+    except OSError:
+        return 0
+
+
+def read_rows(path, fields):
+    # Потокове читання файлу будь-якого розміру: (номер рядка, кортеж рядків у порядку fields або None,
+    # причина відхилення). Відсутні колонки та поля стають порожніми рядками
+    if file_format(path) == 'csv':
+        with open(path, newline='', encoding='utf-8') as file:
+            reader = csv.reader(file)
+            header = next(reader, [])
+            width = len(header)
+            # Відсутні колонки читаються з додаткової порожньої комірки в кінці рядка
+            select = itemgetter(*(header.index(field) if field in header else width for field in fields))
+            for row in reader:
+                if len(row) < width:
+                    row.extend([''] * (width - len(row)))
+                row[width:] = ['']
+                yield reader.line_num, select(row), None
+        return
+    with open(path, encoding='utf-8') as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield number, None, 'invalid JSON'
+                continue
+            if not isinstance(row, dict):
+                yield number, None, 'not a JSON object'
+                continue
+            yield number, tuple(text(row.get(field)) for field in fields), None
+
+
+def batches(rows, size=BATCH_SIZE):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def text(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ', '.join(map(str, value))
+    return str(value)
+
+
+def check_contacts(batch, seen):
+    # Пачка перевіряється списковими виразами з готовими шаблонами; seen - ключі (ім'я, дата народження)
+    # наявних контактів, до яких додаються прийняті, тож дублікати в самому файлі теж відкидаються
+    rejected = [(number, error) for number, row, error in batch if row is None]
+    numbers = [number for number, row, error in batch if row is not None]
+    values = [(name.strip(), address.strip(), phone.strip(), email.strip(), birthday.strip())
+              for name, address, phone, email, birthday in [row for number, row, error in batch if row is not None]]
+    phones = list(map(PHONE.fullmatch, [fields[2] for fields in values]))
+    emails = list(map(EMAIL.fullmatch, [fields[3] for fields in values]))
+    keys = [(ContactIndex.key(fields[0]), fields[4].lower()) for fields in values]
+    accepted = []
+    for number, fields, phone, email, key in zip(numbers, values, phones, emails, keys):
+        if not fields[0]:
+            rejected.append((number, 'name is obligatory'))
+        elif phone is None:
+            rejected.append((number, f"invalid phone '{fields[2]}'"))
+        elif email is None:
+            rejected.append((number, f"invalid email '{fields[3]}'"))
+        elif key in seen:
+            rejected.append((number, f"duplicate contact '{fields[0]}'"))
+        else:
+            seen.add(key)
+            accepted.append(fields)
+    return accepted, rejected
+
+
+def note_tags(value):
+    # Теги записані через кому (списки з JSONL уже зведені до такого рядка)
+    return list(dict.fromkeys(filter(None, map(str.strip, value.split(',')))))
+
+
+def check_notes(batch, seen):
+    rejected = [(number, error) for number, row, error in batch if row is None]
+    accepted = []
+    for number, row, error in batch:
+        if row is None:
+            continue
+        name, note_text, tags = row
+        name = name.strip()
+        if not name:
+            rejected.append((number, 'name is obligatory'))
+        elif name in seen:
+            rejected.append((number, f"duplicate note '{name}'"))
+        else:
+            seen.add(name)
+            accepted.append((name, note_text, note_tags(tags)))
+    return accepted, rejected
+
+
+def write_rows(path, fields, rows):
+    # Потоковий запис; повертає кількість записаних рядків
+    count = 0
+    if file_format(path) == 'csv':
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(fields)
+            for row in rows:
+                writer.writerow([', '.join(value) if isinstance(value, list) else value for value in row])
+                count += 1
+        return count
+    with open(path, 'w', encoding='utf-8') as file:
+        for row in rows:
+            file.write(json.dumps(dict(zip(fields, row)), ensure_ascii=False) + '\n')
+            count += 1
+    return count
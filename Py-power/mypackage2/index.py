@@ -0,0 +1,694 @@
+import heapq
+import math
+import re
+import sys
+from array import array
+from bisect import bisect_left, insort
+from calendar import isleap
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from functools import lru_cache, partial
+from itertools import islice
+from operator import itemgetter
+
+WORD = re.compile(r'\w+')
+SEPARATORS = re.compile(r'[\W_]+')
+
+
+class SortedIndex:
+    # Відсортований список пар (ключ, серійний номер) для пошуку за префіксом і діапазоном
+    def __init__(self):
+        self.keys = []
+        # Серійний номер - позиція об'єкта в списку items (список компактніший за словник)
+        self.items = []
+        self.serials = {}
+        self.removed = 0
+        self.unsorted = False
+
+    def serial(self, item):
+        serial = self.serials.get(id(item))
+        if serial is None:
+            serial = self.serials[id(item)] = len(self.items)
+            self.items.append(item)
+        return serial
+
+    def ordered(self):
+        if self.unsorted:
+            self.keys.sort()
+            self.unsorted = False
+        return self.keys
+
+    def add(self, key, item):
+        insort(self.ordered(), (key, self.serial(item)))
+
+    def add_many(self, groups):
+        # Масове додавання груп (ключі, об'єкт): ключі дописуються в кінець,
+        # а список сортується один раз - перед наступним пошуком
+        serials, items, extend = self.serials, self.items, self.keys.extend
+        for keys, item in groups:
+            serial = serials.get(id(item))
+            if serial is None:
+                serial = serials[id(item)] = len(items)
+                items.append(item)
+            extend([(key, serial) for key in keys])
+        self.unsorted = True
+
+    def remove(self, key, item):
+        serial = self.serials.get(id(item))
+        if serial is None:
+            return
+        keys = self.ordered()
+        position = bisect_left(keys, (key, serial))
+        if position < len(keys) and keys[position] == (key, serial):
+            del keys[position]
+
+    def forget(self, item):
+        # Викликається після видалення всіх ключів об'єкта. Звільнені позиції items ущільнюються,
+        # коли їх стає більше, ніж живих
+        serial = self.serials.pop(id(item), None)
+        if serial is not None:
+            self.items[serial] = None
+            self.removed += 1
+            if self.removed > max(len(self.serials), 1000):
+                self.compact()
+
+    def compact(self):
+        # Живі об'єкти отримують нові серійні номери за тим самим порядком, тож порядок ключів не змінюється
+        renumbered = {}
+        live = []
+        for serial, item in enumerate(self.items):
+            if item is not None:
+                renumbered[serial] = len(live)
+                live.append(item)
+        self.keys = [(key, renumbered[serial]) for key, serial in self.keys]
+        self.items = live
+        self.serials = {id(item): serial for serial, item in enumerate(live)}
+        self.removed = 0
+
+    def range(self, low, high):
+        keys = self.ordered()
+        start = bisect_left(keys, (low,))
+        stop = bisect_left(keys, (high,))
+        for key, serial in keys[start:stop]:
+            yield self.items[serial]
+
+    def prefix(self, prefix):
+        return self.range(prefix, prefix + chr(0x10FFFF))
+
+    def clear(self):
+        self.keys.clear()
+        self.items.clear()
+        self.serials.clear()
+        self.removed = 0
+        self.unsorted = False
+
+
+class ItemList:
+    # Об'єкти в порядку додавання з видаленням за сталий час: словник id -> об'єкт зберігає порядок вставки,
+    # тож видалення не зсуває решту, як list.remove
+    def __init__(self, items=()):
+        self.items = {id(item): item for item in items}
+
+    def append(self, item):
+        self.items[id(item)] = item
+
+    def extend(self, items):
+        self.items.update((id(item), item) for item in items)
+
+    def remove(self, item):
+        del self.items[id(item)]
+
+    def __iter__(self):
+        return iter(self.items.values())
+
+    def __len__(self):
+        return len(self.items)
+
+
+class ContactIndex:
+    def __init__(self):
+        self.names = {}
+        self.prefixes = SortedIndex()
+
+    @staticmethod
+    def key(name):
+        return name.casefold().strip()
+
+    @staticmethod
+    def words(name):
+        return ContactIndex.key_words(ContactIndex.key(name))
+
+    @staticmethod
+    def key_words(key):
+        # Слова інтернуються: однакові імена та прізвища різних контактів - один рядок у пам'яті
+        words = set(map(sys.intern, key.split()))
+        words.add(sys.intern(key))
+        return words
+
+    def add(self, contact):
+        self.names.setdefault(sys.intern(self.key(contact.name)), []).append(contact)
+        for word in self.words(contact.name):
+            self.prefixes.add(word, contact)
+
+    def add_many(self, contacts):
+        # Ключ імені обчислюється один раз для словника імен і для слів
+        names, groups = self.names, []
+        for contact in contacts:
+            key = sys.intern(self.key(contact.name))
+            names.setdefault(key, []).append(contact)
+            groups.append((self.key_words(key), contact))
+        self.prefixes.add_many(groups)
+
+    def remove(self, contact):
+        key = self.key(contact.name)
+        same_name = self.names.get(key, [])
+        if contact in same_name:
+            same_name.remove(contact)
+            if not same_name:
+                del self.names[key]
+        for word in self.words(contact.name):
+            self.prefixes.remove(word, contact)
+        self.prefixes.forget(contact)
+
+    def lookup(self, name):
+        return list(self.names.get(self.key(name), ()))
+
+    def find(self, name, birthday=None):
+        for contact in self.names.get(self.key(name), ()):
+            if birthday is None or contact.birthday.lower() == birthday.lower():
+                return contact
+        return None
+
+    def search(self, query):
+        # Пошук за початком імені, прізвища або повного імені
+        found = {}
+        for contact in self.prefixes.prefix(self.key(query)):
+            found.setdefault(id(contact), contact)
+        return list(found.values())
+
+    def rebuild(self, contacts):
+        self.names.clear()
+        self.prefixes.clear()
+        self.add_many(contacts)
+
+
+@lru_cache(maxsize=65536)
+def birthday_key(birthday):
+    # Ключ MMDD, 29 лютого має власний ключ 229; дати повторюються, тож результат кешується
+    try:
+        year, month, day = map(int, birthday.split('-'))
+        date(2000, month, day)
+    except (AttributeError, ValueError):
+        return None
+    return month * 100 + day
+
+
+def birthday_window(days, today):
+    if days < 0:
+        return []
+    start_key = today.month * 100 + today.day
+    if days >= 365:
+        return [(start_key, 1231), (101, start_key - 1)]
+    end = today + timedelta(days=days)
+    end_key = end.month * 100 + end.day
+    # У невисокосний рік день народження 29 лютого святкують 28 лютого
+    if end_key == 228 and not isleap(end.year):
+        end_key = 229
+    if end.year == today.year:
+        return [(start_key, end_key)]
+    return [(start_key, 1231), (101, end_key)]
+
+
+class BirthdayIndex:
+    def __init__(self):
+        self.days = SortedIndex()
+
+    def add(self, contact):
+        key = birthday_key(contact.birthday)
+        if key is not None:
+            self.days.add(key, contact)
+
+    def add_many(self, contacts):
+        keys = ((birthday_key(contact.birthday), contact) for contact in contacts)
+        self.days.add_many(((key,), contact) for key, contact in keys if key is not None)
+
+    def remove(self, contact):
+        key = birthday_key(contact.birthday)
+        if key is not None:
+            self.days.remove(key, contact)
+        self.days.forget(contact)
+
+    def upcoming(self, days, today=None):
+        today = today or date.today()
+        results = []
+        for low, high in birthday_window(days, today):
+            results.extend(self.days.range(low, high + 1))
+        return results
+
+    def rebuild(self, contacts):
+        self.days.clear()
+        self.add_many(contacts)
+
+
+@lru_cache(maxsize=65536)
+def word_trigrams(word):
+    # Слово доповнюється двома пробілами спереду й одним ззаду, тож початок слова важить більше за кінець;
+    # слова запитів повторюються, тому результат кешується
+    padded = f'  {word} '
+    return tuple({padded[position:position + 3] for position in range(len(padded) - 2)})
+
+
+class FuzzyIndex:
+    # Нечіткий пошук контактів: кожне слово запиту порівнюється з кожним словом полів після транслітерації
+    # за коефіцієнтом Дайса між їхніми триграмами (як word_similarity у pg_trgm), тож помилка в імені чи
+    # прізвищі не губиться серед решти повного імені. Оцінка контакту - середня по словах запиту найкраща
+    # схожість серед його слів. Будується під час першого пошуку (rebuild), далі add/remove оновлюють його
+    FIELDS = ('name', 'phone', 'email', 'address')
+    # Скільки найсхожіших слів словника розглядається для кожного слова запиту
+    CANDIDATES = 50
+
+    def __init__(self, translation=None):
+        self.translation = translation or {}
+        # Словник слів усіх контактів: слово -> номер. Триграма -> номери слів за зростанням (нові номери лише
+        # більші, тож наявність слова перевіряється бінарним пошуком), номер слова -> серійні номери контактів
+        self.vocabulary = {}
+        self.postings = defaultdict(partial(array, 'I'))
+        self.sizes = array('H')
+        self.owners = []
+        self.items = []
+        self.serials = {}
+        self.removed = 0
+        self.ready = False
+
+    def words(self, texts):
+        # Унікальні слова текстів; транслітерація потрібна лише не-ASCII тексту,
+        # а поле з одного слова (телефон, більшість імен) не розбивається
+        words = set()
+        for text in texts:
+            text = text.casefold()
+            if not text.isascii():
+                text = text.translate(self.translation)
+            if text.isalnum():
+                words.add(text)
+            else:
+                words.update(SEPARATORS.sub(' ', text).split())
+        return words
+
+    def word_number(self, word):
+        number = self.vocabulary.get(word)
+        if number is None:
+            number = self.vocabulary[word] = len(self.owners)
+            grams = word_trigrams(word)
+            self.sizes.append(min(len(grams), 0xFFFF))
+            for posting in map(self.postings.__getitem__, grams):
+                posting.append(number)
+            self.owners.append(array('I'))
+        return number
+
+    def _add(self, item, fields):
+        serial = self.serials[item] = len(self.items)
+        self.items.append(item)
+        owners = self.owners
+        for word in self.words(fields):
+            owners[self.word_number(word)].append(serial)
+
+    def add(self, item, fields):
+        if self.ready:
+            self._add(item, fields)
+
+    def add_many(self, rows):
+        # rows - пари (об'єкт, поля в порядку FIELDS)
+        if self.ready:
+            for item, fields in rows:
+                self._add(item, fields)
+
+    def remove(self, item):
+        # Серійні номери видаленого лишаються у списках і пропускаються під час пошуку,
+        # доки їх не стане більше, ніж живих - тоді індекс ущільнюється
+        serial = self.serials.pop(item, None)
+        if serial is None:
+            return
+        self.items[serial] = None
+        self.removed += 1
+        if self.removed > max(len(self.serials), 1000):
+            self.compact()
+
+    def compact(self):
+        # Живі контакти отримують нові серійні номери за тим самим порядком, а слова без власників
+        # зникають зі словника і списків триграм (їхні номери більше не використовуються)
+        renumbered = array('I', bytes(4 * len(self.items)))
+        live = []
+        for serial, item in enumerate(self.items):
+            if item is not None:
+                renumbered[serial] = len(live)
+                live.append(item)
+        items = self.items
+        for number, owners in enumerate(self.owners):
+            if owners:
+                self.owners[number] = array('I', [renumbered[serial] for serial in owners if items[serial] is not None])
+        owners = self.owners
+        for word, number in list(self.vocabulary.items()):
+            if not owners[number]:
+                del self.vocabulary[word]
+        for gram, posting in list(self.postings.items()):
+            alive = array('I', [number for number in posting if owners[number]])
+            if alive:
+                self.postings[gram] = alive
+            else:
+                del self.postings[gram]
+        self.items = live
+        self.serials = {item: serial for serial, item in enumerate(live)}
+        self.removed = 0
+
+    def scores(self, counts, size):
+        # Коефіцієнт Дайса слів словника, що мають власників, за кількостями спільних з запитом триграм
+        owners, sizes = self.owners, self.sizes
+        return {number: 2 * shared / (size + sizes[number]) for number, shared in counts.items() if owners[number]}
+
+    @staticmethod
+    def contains(posting, number):
+        position = bisect_left(posting, number)
+        return position < len(posting) and posting[position] == number
+
+    def floor(self, counts, postings, size, limit):
+        # Точні оцінки поточних лідерів (решта списків перевіряється бінарним пошуком);
+        # limit-та з них - нижня межа оцінки, потрібної для потрапляння в результат
+        leaders = heapq.nlargest(2 * limit, counts, key=counts.get)
+        exact = {number: counts[number] + sum(self.contains(posting, number) for posting in postings)
+                 for number in leaders}
+        scores = self.scores(exact, size)
+        if len(scores) < limit:
+            return 0.0
+        return heapq.nlargest(limit, scores.values())[-1]
+
+    def similar(self, word, limit, threshold):
+        # [(номер слова словника, схожість)] - до limit найсхожіших на word слів зі схожістю не нижче threshold
+        grams = word_trigrams(word)
+        size = len(grams)
+        postings = sorted((self.postings.get(gram, ()) for gram in grams), key=len)
+        counts = Counter()
+        floor = threshold
+        position = 0
+        # Рідкісні триграми першими. Слово, якого ще не було в жодному з перших position списків, має
+        # не більше size - position спільних триграм; коли навіть це не дає пройти поріг чи обійти limit-го
+        # лідера, нові кандидати більше не додаються, а найдовші списки лише уточнюють оцінки наявних
+        while position < size:
+            remaining = size - position
+            if 2 * remaining / (size + remaining) < floor:
+                break
+            if len(counts) >= limit:
+                floor = max(floor, self.floor(counts, postings[position:], size, limit))
+                if 2 * remaining / (size + remaining) < floor:
+                    break
+            counts.update(postings[position])
+            position += 1
+        if position < size:
+            counts = self.refine(counts, postings[position:], size, floor)
+        scores = [(number, score) for number, score in self.scores(counts, size).items() if score >= threshold]
+        return heapq.nlargest(limit, scores, key=itemgetter(1))
+
+    def refine(self, counts, postings, size, floor):
+        # Кандидати, що не досягнуть floor навіть з усіма рештою триграм, відкидаються одразу. Короткий список
+        # перетинається з кандидатами цілком, у довгому кожен кандидат шукається бінарним пошуком
+        sizes, remaining = self.sizes, len(postings)
+        counts = Counter({number: shared for number, shared in counts.items()
+                          if 2 * min(shared + remaining, sizes[number]) / (size + sizes[number]) >= floor})
+        for posting in postings:
+            if len(posting) <= 16 * len(counts):
+                counts.update(counts.keys() & posting)
+            else:
+                counts.update([number for number in counts if self.contains(posting, number)])
+        return counts
+
+    def reach(self, similar):
+        # Скільки контактів мають хоч одне зі схожих слів (з повтореннями)
+        owners = self.owners
+        return sum(len(owners[number]) for number, score in similar)
+
+    def lookup(self, serial, similar):
+        # Схожість найсхожішого слова контакту серед similar (відсортованих за спаданням схожості)
+        owners = self.owners
+        for number, score in similar:
+            if self.contains(owners[number], serial):
+                return score
+        return 0.0
+
+    def search(self, query, limit=10, threshold=0.2):
+        # Повертає [(об'єкт, схожість від 0 до 1)], найсхожіші першими. Слово запиту зараховується контакту,
+        # лише якщо схоже на одне з його слів щонайменше на threshold; поріг низький, бо в коротких словах
+        # одна помилка руйнує більшість триграм ("bbo" і "bob" мають спільну лише "  b")
+        words = self.words((query,))
+        if not words or limit <= 0:
+            return []
+        # Слова запиту з найменшою кількістю контактів - першими. Контакт, не знайдений за оброблені слова,
+        # набере щонайбільше суму найкращих схожостей решти; коли limit-й лідер уже не нижчий, загальні слова
+        # ("com", "street") лише уточнюють оцінки лідерів бінарним пошуком і не перебираються цілком
+        lists = sorted((self.similar(word, self.CANDIDATES, threshold) for word in words), key=self.reach)
+        minimum = threshold * len(words)
+        partial = Counter()
+        leaders = None
+        position = 0
+        while position < len(lists):
+            pending = lists[position:]
+            if sum(similar[0][1] for similar in pending if similar) < minimum:
+                break
+            if len(partial) >= limit:
+                # Перевірка лідерів не дорожча за перебір наступного слова, інакше воно перебирається
+                budget = self.reach(lists[position]) // sum(map(len, pending))
+                leaders = self.leaders(partial, pending, limit, budget)
+                if leaders is not None and len(leaders) == limit and leaders[-1][0] >= sum(
+                        similar[0][1] for similar in pending if similar):
+                    break
+                leaders = None
+            best = {}
+            for number, score in reversed(lists[position]):
+                # Від найменш схожого слова до найсхожішого: пізніші значення перезаписують менші
+                best.update(dict.fromkeys(self.owners[number], score))
+            partial.update(best)
+            position += 1
+        if leaders is None:
+            leaders = self.leaders(partial, lists[position:], limit)
+        return [(self.items[serial], total / len(words)) for total, serial in leaders if total >= minimum]
+
+    def leaders(self, partial, pending, limit, budget=None):
+        # [(сума схожостей, серійний номер)] limit найкращих живих контактів за спаданням. Оцінки за слова
+        # pending шукаються лише для кандидатів, що ще можуть обійти лідерів; None, якщо таких більше за budget
+        rest = sum(similar[0][1] for similar in pending if similar)
+        items, top = self.items, []
+        evaluated, size = 0, 4 * limit
+        while True:
+            ranked = heapq.nlargest(size, partial.items(), key=itemgetter(1))
+            for serial, score in ranked[evaluated:]:
+                if len(top) == limit and score + rest <= top[0][0]:
+                    return sorted(top, reverse=True)
+                if budget is not None and evaluated >= budget:
+                    return None
+                evaluated += 1
+                if items[serial] is None:
+                    continue
+                entry = (score + sum(self.lookup(serial, similar) for similar in pending), serial)
+                if len(top) < limit:
+                    heapq.heappush(top, entry)
+                elif entry > top[0]:
+                    heapq.heapreplace(top, entry)
+            if len(ranked) < size:
+                return sorted(top, reverse=True)
+            size *= 4
+
+    def rebuild(self, rows):
+        self.vocabulary.clear()
+        self.postings.clear()
+        self.sizes = array('H')
+        self.owners.clear()
+        self.items.clear()
+        self.serials.clear()
+        self.removed = 0
+        self.ready = True
+        self.add_many(rows)
+
+
+def tokenize(text):
+    return WORD.findall(text.casefold())
+
+
+def parse_text_query(query):
+    # "a b OR c*" -> [[('a', False), ('b', False)], [('c', True)]]: групи через OR, у групі всі слова обов'язкові
+    groups = [[]]
+    for word in query.split():
+        if word == 'OR':
+            groups.append([])
+            continue
+        prefix = word.endswith('*')
+        for term in tokenize(word):
+            groups[-1].append((term, prefix))
+    return [group for group in groups if group]
+
+
+class NoteTextIndex:
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.terms = []
+        self.documents = {}
+        self.total_length = 0
+
+    def _add(self, name, text, new_terms):
+        if name in self.documents:
+            self.remove(name)
+        frequencies = Counter(tokenize(text))
+        self.documents[name] = frequencies
+        self.total_length += sum(frequencies.values())
+        for term, frequency in frequencies.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                new_terms.append(term)
+            posting[name] = frequency
+
+    def add(self, name, text):
+        new_terms = []
+        self._add(name, text, new_terms)
+        for term in new_terms:
+            insort(self.terms, term)
+
+    def add_many(self, items):
+        # Нові слова збираються для всіх нотаток і словник сортується один раз
+        new_terms = []
+        for name, text in items:
+            if new_terms and name in self.documents:
+                # remove шукає слова в self.terms, тому відкладені слова спершу потрапляють туди
+                self.terms.extend(new_terms)
+                self.terms.sort()
+                new_terms = []
+            self._add(name, text, new_terms)
+        self.terms.extend(new_terms)
+        self.terms.sort()
+
+    def remove(self, name):
+        frequencies = self.documents.pop(name, None)
+        if frequencies is None:
+            return
+        self.total_length -= sum(frequencies.values())
+        for term in frequencies:
+            posting = self.postings[term]
+            del posting[name]
+            if not posting:
+                del self.postings[term]
+                del self.terms[bisect_left(self.terms, term)]
+
+    def expand(self, term, prefix):
+        if not prefix:
+            return [term] if term in self.postings else []
+        start = bisect_left(self.terms, term)
+        stop = bisect_left(self.terms, term + chr(0x10FFFF))
+        return self.terms[start:stop]
+
+    def matching(self, term, prefix):
+        names = set()
+        for expanded in self.expand(term, prefix):
+            names.update(self.postings[expanded])
+        return names
+
+    def score(self, name, terms):
+        frequencies = self.documents[name]
+        length = sum(frequencies.values())
+        average = self.total_length / len(self.documents)
+        score = 0.0
+        for term in terms:
+            frequency = frequencies.get(term)
+            if not frequency:
+                continue
+            df = len(self.postings[term])
+            idf = math.log(1 + (len(self.documents) - df + 0.5) / (df + 0.5))
+            score += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * (1 - self.b + self.b * length / average))
+        return score
+
+    def search(self, query, limit=10):
+        # Повертає [(назва нотатки, оцінка BM25)], найрелевантніші першими
+        groups = parse_text_query(query)
+        found = set()
+        terms = set()
+        for group in groups:
+            sets = sorted((self.matching(term, prefix) for term, prefix in group), key=len)
+            names = sets[0]
+            for other in sets[1:]:
+                if not names:
+                    break
+                names = names & other
+            found |= names
+            for term, prefix in group:
+                terms.update(self.expand(term, prefix))
+        ranked = ((name, self.score(name, terms)) for name in found)
+        return heapq.nlargest(limit, ranked, key=lambda item: item[1])
+
+    def rebuild(self, notes):
+        self.postings.clear()
+        self.terms.clear()
+        self.documents.clear()
+        self.total_length = 0
+        self.add_many((name, note.text) for name, note in notes.items())
+
+
+class TagIndex:
+    def __init__(self):
+        self.tags = {}
+
+    def add(self, name, tag):
+        self.tags.setdefault(tag, set()).add(name)
+
+    def remove(self, name, tags):
+        for tag in tags:
+            names = self.tags.get(tag)
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del self.tags[tag]
+
+    def posting(self, tag):
+        return self.tags.get(tag, set())
+
+    def query(self, everything, all_tags=(), any_tags=(), exclude=()):
+        # Перетин починається з найменшої множини; everything потрібне лише без позитивних умов
+        if all_tags:
+            postings = sorted((self.posting(tag) for tag in set(all_tags)), key=len)
+            names = set(postings[0])
+            for posting in postings[1:]:
+                if not names:
+                    break
+                names &= posting
+        else:
+            names = None
+        if any_tags:
+            alternatives = set()
+            for tag in set(any_tags):
+                alternatives.update(self.posting(tag))
+            names = alternatives if names is None else names & alternatives
+        if names is None:
+            names = set(everything)
+        for tag in set(exclude):
+            if not names:
+                break
+            names -= self.posting(tag)
+        return names
+
+    def facets(self, names, notes):
+        counts = Counter()
+        for name in names:
+            counts.update(notes[name].tags)
+        return counts.most_common()
+
+    def rebuild(self, notes):
+        self.tags.clear()
+        for name, note in notes.items():
+            for tag in note.tags:
+                self.add(name, tag)
+
+
+def ordered_page(items, key, offset=0, limit=None):
+    # Купа замість повного сортування: O(n + (offset + limit) log n) для однієї сторінки
+    heap = [(key(item), position, item) for position, item in enumerate(items)]
+    heapq.heapify(heap)
+    stop = None if limit is None else offset + limit
+    popped = (heapq.heappop(heap)[2] for _ in range(len(heap)))
+    return list(islice(popped, offset, stop))
@@ -1,28 +1,101 @@
-from datetime import datetime, timedelta
-import pickle
+import asyncio
+import copy
+import os
+import sys
+import threading
+import time
+from datetime import date
+from functools import lru_cache
 from pathlib import Path
 from test import FileSorter 
+import bulk
+from index import (BirthdayIndex, ContactIndex, FuzzyIndex, ItemList, NoteTextIndex, TagIndex, birthday_window,
+                   ordered_page)
+from metrics import METRICS, timed
+from packed import (LazyTextIndex, PackedBirthdayIndex, PackedContactIndex, PackedContacts, PackedNotes,
+                    PackedTagIndex)
+from sqlite_store import ContactTable, NoteTable, SqliteStore
+from storage import Journal, read_snapshot, write_snapshot
+
+@lru_cache(maxsize=65536)
+def pack_birthday(birthday):
+    # Дата у форматі РРРР-ММ-ДД зберігається як порядковий номер дня (int), будь-який інший рядок - як є.
+    # Кеш повертає той самий об'єкт int для однакових дат, тож контакти з однією датою його поділяють
+    try:
+        day = date.fromisoformat(birthday)
+    except (TypeError, ValueError):
+        return birthday
+    return day.toordinal() if day.isoformat() == birthday else birthday
+
+
+def unpack_birthday(packed):
+    return date.fromordinal(packed).isoformat() if isinstance(packed, int) else packed
+
 
 class Contact:
+    # __slots__ замість __dict__ у кожного об'єкта; стан для pickle - словник, як і раніше, тож старі збереження
+    # у форматі pickle читаються. Нові зберігаються у форматі packed, і стара версія програми їх не прочитає
+    __slots__ = ('name', 'address', 'phone', 'email', 'packed_birthday')
+
     def __init__(self, name, address, phone, email, birthday):
         self.name = name
         self.address = address
         self.phone = phone
         self.email = email
         self.birthday = birthday
+
+    @property
+    def birthday(self):
+        return unpack_birthday(self.packed_birthday)
+
+    @birthday.setter
+    def birthday(self, birthday):
+        self.packed_birthday = pack_birthday(birthday)
+
+    def __getstate__(self):
+        return {'name': self.name, 'address': self.address, 'phone': self.phone, 'email': self.email,
+                'birthday': self.birthday}
+
+    def __setstate__(self, state):
+        self.__init__(state['name'], state['address'], state['phone'], state['email'], state['birthday'])
+
     def __str__(self):
         return f"Name: {self.name} | Adress: {self.address} | Phone number: {self.phone} | Email: {self.email} | Date of birth: {self.birthday}"
 
+def contact_fields(contact):
+    # Поля для нечіткого пошуку в порядку FuzzyIndex.FIELDS
+    return contact.name, contact.phone, contact.email, contact.address
+
+
+def fuzzy_index():
+    # Та сама таблиця, що нормалізує назви файлів у FileSorter: "Олена" знаходиться за "olena", а "José" за "jose"
+    return FuzzyIndex(FileSorter.NORMALIZER.table)
+
+
 class Note:
-    def __init__(self, text):
+    # Теги інтернуються: однакові теги різних нотаток - один рядок у пам'яті
+    __slots__ = ('text', 'tags')
+
+    def __init__(self, text, tags=()):
         self.text = text
-        self.tags = []
+        self.tags = [sys.intern(tag) for tag in tags]
+
+    def __getstate__(self):
+        return {'text': self.text, 'tags': self.tags}
+
+    def __setstate__(self, state):
+        self.__init__(state['text'], state.get('tags', ()))
 
 class BotAssist:
     def __init__(self):
-        self.contacts = []
+        self.contacts = ItemList()
         self.notes = {}
-        self.tags = {}
+        self.tag_index = TagIndex()
+        self.contact_index = ContactIndex()
+        self.birthday_index = BirthdayIndex()
+        self.text_index = NoteTextIndex()
+        self.fuzzy_index = fuzzy_index()
+        self.journal = None
 
     def validate_phone(self, phone):
         return phone.isdigit() and len(phone) == 10
@@ -30,123 +103,169 @@ class BotAssist:
     def validate_email(self, email):
         return '@' in email and '.' in email.split('@')[-1]
 
+    def validate_contact(self, name, phone, email):
+        # Перевірка без запитів до користувача: повторне введення - справа інтерфейсу
+        if not name:
+            raise ValueError("Name is obligatory.")
+        if not self.validate_phone(phone):
+            raise ValueError("Invalid phone number format. Please enter a 10-digit number.")
+        if not self.validate_email(email):
+            raise ValueError("Invalid email format.")
+
+    @timed('botassist.add_contact')
     def add_contact(self, name, address, phone, email, birthday):
-        while True:
-          if not name:
-            name = input("Name is obligatory, enter the name for new contact: ")
-            continue
-          
-          if not self.validate_phone(phone):
-            phone = input("Invalid phone number format. Please enter a 10-digit number: ")
-            continue
+        self.validate_contact(name, phone, email)
+        if self.find_contact(name, birthday) is not None:
+            return f"Contact with name '{name}' and birthday '{birthday}' already exists. Can not duplicate contact."
 
-          if not self.validate_email(email):
-            email = input("Invalid email format. Please enter email again: ")
-            continue
-          break
-        for contact in self.contacts:
-          if contact.name.lower() == name.lower() and contact.birthday.lower() == birthday.lower():
-             print(f"Contact with name '{name}' and birthday '{birthday}' already exists. Can not duplicate contact.")
-             return
+        self._insert_contact(Contact(name, address, phone, email, birthday))
+        return "Contact added successfully."
 
-        contact = Contact(name, address, phone, email, birthday)
+    def _log(self, *record):
+        if self.journal is not None:
+            self.journal.append(record)
+
+    def _insert_contact(self, contact):
         self.contacts.append(contact)
-        print("Contact added successfully.")
+        self.contact_index.add(contact)
+        self.birthday_index.add(contact)
+        self.fuzzy_index.add(contact, contact_fields(contact))
+        self._log('add_contact', contact.name, contact.address, contact.phone, contact.email, contact.birthday)
+
+    def _insert_contacts(self, contacts):
+        # Масове додавання: індекси сортуються один раз, у журнал іде один запис на пачку
+        self.contacts.extend(contacts)
+        self.contact_index.add_many(contacts)
+        self.birthday_index.add_many(contacts)
+        self.fuzzy_index.add_many((contact, contact_fields(contact)) for contact in contacts)
+        if self.journal is not None:
+            self._log('add_contacts', [(c.name, c.address, c.phone, c.email, c.birthday) for c in contacts])
+
+    def _remove_contact(self, contact):
+        self._log('delete_contact', contact.name, contact.birthday)
+        self.contact_index.remove(contact)
+        self.birthday_index.remove(contact)
+        self.fuzzy_index.remove(contact)
+        self.contacts.remove(contact)
+
+    def _update_contact(self, contact, name, address, phone, email, birthday):
+        self._log('edit_contact', contact.name, contact.birthday, name, address, phone, email, birthday)
+        # Ключі індексів залежать від імені та дати народження, тому контакт переіндексовується
+        self.contact_index.remove(contact)
+        self.birthday_index.remove(contact)
+        self.fuzzy_index.remove(contact)
+        contact.name = name
+        contact.address = address
+        contact.phone = phone
+        contact.email = email
+        contact.birthday = birthday
+        self.contact_index.add(contact)
+        self.birthday_index.add(contact)
+        self.fuzzy_index.add(contact, contact_fields(contact))
+
+    def find_contact(self, name, birthday=None):
+        return self.contact_index.find(name, birthday)
+
+    def find_contacts(self, name):
+        return self.contact_index.lookup(name)
         
-    def search_contacts_birthday(self, days):
-        upcoming_birthday_contacts = []
-        today = datetime.now()
-
-        for contact in self.contacts:
-            birthday_month, birthday_day = map(int, contact.birthday.split('-')[1:])
-            birthday_date = datetime(today.year, birthday_month, birthday_day)
-
-        # Check if the birthday has already passed this year
-            if birthday_date < today:
-            # If yes, consider the birthday for the next year
-                birthday_date = datetime(today.year + 1, birthday_month, birthday_day)
+    @timed('botassist.search_contacts_birthday')
+    def search_contacts_birthday(self, days, today=None):
+        # Контакти з днями народження від сьогодні до today + days, у порядку настання
+        return self.birthday_index.upcoming(days, today)
 
-            days_until_birthday = (birthday_date - today).days
-
-            if -1 <= days_until_birthday <= days:
-                upcoming_birthday_contacts.append(contact)
+    @timed('botassist.search_contacts')
+    def search_contacts(self, query):
+        if not query.strip():
+            return list(self.contacts)
+        return self.contact_index.search(query)
 
-        if upcoming_birthday_contacts:
-            print("Contacts with upcoming birthdays:")
-            for contact in upcoming_birthday_contacts:
-                print(contact.name, "|", contact.address, "|", contact.phone, "|", contact.email, "|", contact.birthday, "|")
-        else:
-            print("No contacts with upcoming birthdays.")
+    @timed('botassist.fuzzy_search_contacts')
+    def fuzzy_search_contacts(self, query, limit=10):
+        # Пошук з помилками та іншою транслітерацією за ім'ям, телефоном, email та адресою:
+        # [(контакт, схожість від 0 до 1)], найсхожіші першими. Індекс будується під час першого пошуку
+        if not self.fuzzy_index.ready:
+            self.fuzzy_index.rebuild(self.fuzzy_rows())
+        results = ((self.fuzzy_contact(item), score) for item, score in self.fuzzy_index.search(query, limit))
+        return [(contact, score) for contact, score in results if contact is not None]
 
-    
+    def fuzzy_rows(self):
+        return ((contact, contact_fields(contact)) for contact in self.contacts)
 
-
-    def search_contacts(self, query):
-        results = []
-        for contact in self.contacts:
-            if query.lower() in contact.name.lower():
-                results.append(contact)
-        return results
+    def fuzzy_contact(self, item):
+        return item
 
         
 
+    @timed('botassist.edit_contact')
     def edit_contact(self, old_contact_name, new_name, new_address, new_phone, new_email, new_birthday):
-      contact_found = False
-      while True:
-          if not new_name:
-            new_name= input("Name is obligatory, enter the name for new contact: ")
-            continue
-          
-          if not self.validate_phone(new_phone):
-            new_phone = input("Invalid phone number format. Please enter a 10-digit number: ")
-            continue
-
-          if not self.validate_email(new_email):
-            new_email = input("Invalid email format. Please enter email again: ")
-            continue
-          break
-      for contact in self.contacts:
-        if contact.name.lower() == old_contact_name.lower():
-            contact_found = True
-            contact.name = new_name
-            if not new_address==None:
-                contact.address = new_address
-            contact.phone = new_phone
-            contact.email = new_email
-            if not new_birthday==None:
-                contact.birthday = new_birthday
-            break
-
-      if not contact_found:
+      self.validate_contact(new_name, new_phone, new_email)
+      contact = self.find_contact(old_contact_name)
+      if contact is None:
          return f'Contact not found'
 
+      address = contact.address if new_address is None else new_address
+      birthday = contact.birthday if new_birthday is None else new_birthday
+      self._update_contact(contact, new_name, address, new_phone, new_email, birthday)
+
       return f'Contact {old_contact_name} successfully edited.'
 
 
+    @timed('botassist.delete_contact')
     def delete_contact(self, contact_name):
+        matches = self.find_contacts(contact_name)
+        if not matches:
+            print("Contact not found")
+        for contact in matches:
+            self._remove_contact(contact)
+            print(f'{contact.name} removed')
+
 
-        for contact in self.contacts:
-            if contact_name.lower() in contact.name.lower():
-                self.contacts.remove(contact)
-                print(f'{contact_name} removed')
-            elif not contact_name.lower() in contact.name.lower():
-                print("Contact not found")
-                
-                
-    
-      
 
+    @timed('botassist.add_note')
     def add_note(self, note_name, note_text):
         if note_name in self.notes:  # Перевірка, чи назва нотатки вже існує
-            choice = input(f"Note '{note_name}' already exists. Do you want to edit it? enter yes or no: ").lower()
-            if choice == 'yes':
-                self.edit_note(note_name, note_text)  # Виклик методу для редагування нотатки
-            else:
-                print("Note creation aborted.")
+            print(f"Note '{note_name}' already exists.")
         else:
-            self.notes[note_name] = Note(note_text)  # Створення нової нотатки в словнику notes
+            self._put_note(note_name, note_text)  # Створення нової нотатки в словнику notes
             print(f"Note '{note_name}' created successfully.")
 
+    def _put_note(self, note_name, note_text):
+        if note_name in self.notes:
+            self.tag_index.remove(note_name, self.notes[note_name].tags)
+        self.notes[note_name] = Note(note_text)
+        self.text_index.add(note_name, note_text)
+        self._log('add_note', note_name, note_text)
+
+    def _put_notes(self, rows):
+        # rows - [(назва, текст, теги)] нових нотаток
+        for note_name, note_text, tags in rows:
+            note = self.notes[note_name] = Note(note_text, tags)
+            for tag in note.tags:
+                self.tag_index.add(note_name, tag)
+        self.text_index.add_many((note_name, note_text) for note_name, note_text, tags in rows)
+        self._log('add_notes', rows)
+
+    def _set_note_text(self, note_name, new_text):
+        self.notes[note_name].text = new_text
+        self.text_index.add(note_name, new_text)
+        self._log('edit_note', note_name, new_text)
+
+    def _remove_note(self, note_name):
+        self.tag_index.remove(note_name, self.notes.pop(note_name).tags)
+        self.text_index.remove(note_name)
+        self._log('delete_note', note_name)
+
+    def _tag_note(self, title, new_tags):
+        note = self.notes[title]
+        for tag in new_tags:
+            if tag not in note.tags:
+                tag = sys.intern(tag)
+                note.tags.append(tag)
+                self.tag_index.add(title, tag)
+        self._log('add_tags', title, list(new_tags))
+
+    @timed('botassist.search_notes')
     def search_notes(self, note_name):
         if not self.notes:  # Перевірка, чи словник notes пустий
             print("Notes not found. Please create a note using command '6'.")
@@ -155,69 +274,228 @@ class BotAssist:
         else:
             print(f"Note '{note_name}' does not exist.")
 
+    @timed('botassist.search_notes_text')
+    def search_notes_text(self, query, limit=10):
+        # Пошук за текстом нотаток: "слово1 слово2" - усі слова, "OR" - будь-яка група, "слов*" - префікс
+        return [(note_name, self.notes[note_name]) for note_name, score in self.text_index.search(query, limit)]
+
+    @timed('botassist.edit_note')
     def edit_note(self, note_name, new_text):
         if note_name in self.notes:  # Перевірка, чи існує нотатка з вказаною назвою
-            self.notes[note_name].text = new_text  # Зміна тексту нотатки
+            self._set_note_text(note_name, new_text)  # Зміна тексту нотатки
             print(f"Edited note '{note_name}' successfully.")
         else:
             print(f"Note '{note_name}' does not exist. Cannot edit.")
 
+    @timed('botassist.delete_note')
     def delete_note(self, note_name):
         if not self.notes:  # Перевірка, чи словник notes пустий
             print("No notes found. Please create a note using command '6'.")
         elif note_name in self.notes:  # Перевірка, чи існує нотатка з вказаною назвою
-            print(f"Note '{note_name}': {self.notes[note_name].text}")
-            choice = input(f"Are you sure you want to delete note '{note_name}'? (1 - Yes, 2 - No): ")
-            if choice == '1':
-                del self.notes[note_name]  # Видалення нотатки за вказаною назвою
-                print(f"Note '{note_name}' deleted successfully.")
-            else:
-                print("Deletion aborted.")
+            self._remove_note(note_name)  # Видалення нотатки за вказаною назвою
+            print(f"Note '{note_name}' deleted successfully.")
         else:
             print(f"Note '{note_name}' does not exist.")
             
             
+    @timed('botassist.add_tags_to_note')
     def add_tags_to_note(self, title, new_tags):
         if title in self.notes:
-            self.notes[title].tags.extend(new_tags)
-            for tag in new_tags:
-                if tag in self.tags:
-                    self.tags[tag].append(title)
-                else:
-                    self.tags[tag] = [title]
+            self._tag_note(title, new_tags)
             print("Tags added successfully.")
         else:
             print("Note not found.")
             
-    def search_notes_by_tags(self, tags):
-        results = []
-        for note_name, note in self.notes.items():
-            if all(tag in note.tags for tag in tags):
-                results.append(note)
-        sorted_results = sorted(results, key=lambda x: x.text)
-        return sorted_results
+    @timed('botassist.search_notes_by_tags')
+    def search_notes_by_tags(self, tags, any_tags=(), exclude=(), offset=0, limit=None):
+        # tags - усі обов'язкові, any_tags - хоча б один, exclude - жодного; результати впорядковані за текстом
+        names = self.tag_index.query(self.notes, tags, any_tags, exclude)
+        notes = (self.notes[note_name] for note_name in names)
+        return ordered_page(notes, lambda note: note.text, offset, limit)
+
+    @timed('botassist.tag_facets')
+    def tag_facets(self, tags, any_tags=(), exclude=()):
+        # Скільки знайдених нотаток має кожен тег: [(тег, кількість)]
+        names = self.tag_index.query(self.notes, tags, any_tags, exclude)
+        return self.tag_index.facets(names, self.notes)
+
+
+    def apply_record(self, record):
+        # Повторення однієї зміни з журналу без повторного запису в журнал
+        operation, *args = record
+        if operation == 'add_contact':
+            name, address, phone, email, birthday = args
+            if self.find_contact(name, birthday) is None:
+                self._insert_contact(Contact(name, address, phone, email, birthday))
+        elif operation == 'add_contacts':
+            contacts = [Contact(*row) for row in args[0] if self.find_contact(row[0], row[4]) is None]
+            self._insert_contacts(contacts)
+        elif operation == 'edit_contact':
+            contact = self.find_contact(args[0], args[1])
+            if contact is not None:
+                self._update_contact(contact, *args[2:])
+        elif operation == 'delete_contact':
+            contact = self.find_contact(*args)
+            if contact is not None:
+                self._remove_contact(contact)
+        elif operation == 'add_note':
+            self._put_note(*args)
+        elif operation == 'add_notes':
+            self._put_notes([row for row in args[0] if row[0] not in self.notes])
+        elif operation == 'edit_note':
+            if args[0] in self.notes:
+                self._set_note_text(*args)
+        elif operation == 'delete_note':
+            if args[0] in self.notes:
+                self._remove_note(*args)
+        elif operation == 'add_tags':
+            if args[0] in self.notes:
+                self._tag_note(*args)
+
+    def contact_keys(self):
+        # Ключі (ім'я, дата народження) усіх контактів для перевірки дублікатів за один прохід
+        return {(ContactIndex.key(contact.name), contact.birthday.lower()) for contact in self.contacts}
+
+    @timed('botassist.import_contacts')
+    def import_contacts(self, path):
+        # CSV або JSONL читається пачками; повертає (кількість доданих, [(номер рядка, причина відхилення)])
+        seen = self.contact_keys()
+        imported, rejected = 0, []
+        for batch in bulk.batches(bulk.read_rows(path, bulk.CONTACT_FIELDS)):
+            rows, errors = bulk.check_contacts(batch, seen)
+            self._insert_contacts([Contact(*row) for row in rows])
+            imported += len(rows)
+            rejected.extend(errors)
+        return imported, rejected
+
+    @timed('botassist.import_notes')
+    def import_notes(self, path):
+        seen = set(self.notes)
+        imported, rejected = 0, []
+        for batch in bulk.batches(bulk.read_rows(path, bulk.NOTE_FIELDS)):
+            rows, errors = bulk.check_notes(batch, seen)
+            self._put_notes(rows)
+            imported += len(rows)
+            rejected.extend(errors)
+        return imported, rejected
+
+    @timed('botassist.export_contacts')
+    def export_contacts(self, path):
+        rows = ((c.name, c.address, c.phone, c.email, c.birthday) for c in self.contacts)
+        return bulk.write_rows(path, bulk.CONTACT_FIELDS, rows)
+
+    @timed('botassist.export_notes')
+    def export_notes(self, path):
+        rows = ((note_name, note.text, list(note.tags)) for note_name, note in self.notes.items())
+        return bulk.write_rows(path, bulk.NOTE_FIELDS, rows)
+
+    def snapshot(self):
+        return {"contacts": self.contacts, "notes": self.notes}
+
+    def snapshot_copy(self):
+        # Копії об'єктів, щоб фонова серіалізація не бачила змін, зроблених тим часом
+        # (копія Note отримує власний список тегів через __setstate__)
+        notes = {note_name: copy.copy(note) for note_name, note in self.notes.items()}
+        return {"contacts": [copy.copy(contact) for contact in self.contacts], "notes": notes}
+
+    def restore(self, data):
+        packed = data.get('packed')
+        if packed is not None:
+            # Знімок packed: індекси імен, днів народження і тегів читаються з файлу, записи декодуються
+            # при першому зверненні, а текстовий індекс будується під час першого пошуку за текстом
+            self.contacts = PackedContacts(packed, Contact)
+            self.notes = PackedNotes(packed, Note)
+            self.tag_index = PackedTagIndex(packed)
+            self.contact_index = PackedContactIndex(packed, self.contacts)
+            self.birthday_index = PackedBirthdayIndex(packed, self.contacts)
+            self.text_index = LazyTextIndex(self.notes)
+            self.fuzzy_index = fuzzy_index()
+            return
+        self.contacts = ItemList(data.get('contacts', []))
+        self.notes = data.get('notes', {})
+        # Теги завжди перебудовуються з нотаток: старі збереження могли містити застарілі списки
+        self.tag_index = TagIndex()
+        self.tag_index.rebuild(self.notes)
+        self.contact_index = ContactIndex()
+        self.contact_index.rebuild(self.contacts)
+        self.birthday_index = BirthdayIndex()
+        self.birthday_index.rebuild(self.contacts)
+        self.text_index = NoteTextIndex()
+        self.text_index.rebuild(self.notes)
+        self.fuzzy_index = fuzzy_index()
+
+    def open_journal(self, filename="save.pickle"):
+        journal = Journal(filename)
+        if journal.open(self):
+            print("Data loaded successfully.")
+        else:
+            print("File not found. No data loaded.")
+        self.journal = journal
 
+    def close_journal(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
 
+    def close(self):
+        self.close_journal()
+
+    @timed('botassist.save_data')
     def save_data(self, filename="save.pickle"):
-        with open(filename, "wb") as file:
-            data = {"contacts": self.contacts, "notes": self.notes, "tags": self.tags}
-            pickle.dump(data, file)
+        if self.journal is not None and Path(filename).resolve() == self.journal.snapshot_path.resolve():
+            self.journal.checkpoint(self.snapshot())
+        else:
+            write_snapshot(filename, self.snapshot())
         print("Data saved successfully.")
 
+    def save_job(self, filename="save.pickle"):
+        # Стан копіюється одразу, а повернена функція лише серіалізує копію, тож її можна виконати у фоновому потоці
+        data = self.snapshot_copy()
+        if self.journal is not None and Path(filename).resolve() == self.journal.snapshot_path.resolve():
+            seq = self.journal.reserve()
+            return timed('botassist.save')(lambda: self.journal.checkpoint(data, seq))
+        return timed('botassist.save')(lambda: write_snapshot(filename, data))
+
+    @timed('botassist.read_state')
+    def read_state(self, filename="save.pickle"):
+        # Читання файлу і побудова індексів у новому екземплярі; поточний стан не змінюється,
+        # тому метод можна виконати у фоновому потоці, а результат передати в adopt_state
+        data = read_snapshot(filename)
+        if data is None:
+            return None
+        state = BotAssist()
+        state.restore(data)
+        return state
+
+    def adopt_state(self, state):
+        self.contacts = state.contacts
+        self.notes = state.notes
+        self.tag_index = state.tag_index
+        self.contact_index = state.contact_index
+        self.birthday_index = state.birthday_index
+        self.text_index = state.text_index
+        self.fuzzy_index = state.fuzzy_index
+
+    @timed('botassist.load_data')
     def load_data(self, filename="save.pickle"):
-        try:
-            with open(filename, 'rb') as file:
-                data = pickle.load(file)
-                self.contacts = data.get('contacts', [])
-                self.notes = data.get('notes', {})
-                self.tags = data.get('tags', {})
-            print("Data loaded successfully.")
-        except FileNotFoundError:
+        state = self.read_state(filename)
+        if state is None:
             print("File not found. No data loaded.")
-
-    def sort_files(self, folder_path):
-        file_sorter = FileSorter(folder_path)
+            return
+        self.adopt_state(state)
+        if self.journal is not None:
+            # Завантажені дані не записані в журнал, тому фіксуються новим знімком
+            self.journal.checkpoint(self.snapshot())
+        print("Data loaded successfully.")
+
+    def file_sorter(self, folder_path, workers=None, incremental=False, dedup=None):
+        return FileSorter(folder_path, workers, incremental, dedup)
+
+    @timed('botassist.sort_files')
+    def sort_files(self, folder_path, workers=None, incremental=False, dedup=None):
+        file_sorter = self.file_sorter(folder_path, workers, incremental, dedup)
         file_sorter.core()
+        return file_sorter.report()
 
     def show_all_contacts(self):
         if self.contacts:
@@ -230,23 +508,240 @@ class BotAssist:
         else:
             return "Note list is empty."
 
-def main():
-   assistant =  BotAssist()
-   assistant.load_data()
+class SqliteBotAssist(BotAssist):
+    # Контакти та нотатки зберігаються у файлі SQLite, фільтрація виконується запитами з індексами
+    def __init__(self, filename="assistant.db"):
+        super().__init__()
+        self.store = SqliteStore(filename, Contact, Note)
+        self.contacts = ContactTable(self.store)
+        self.notes = NoteTable(self.store)
+
+    @staticmethod
+    def fuzzy_key(name, birthday):
+        # Рядки бази щоразу стають новими об'єктами, тому нечіткий індекс зберігає ключ контакту
+        return ContactIndex.key(name), birthday.lower()
+
+    def _insert_contact(self, contact):
+        self.store.insert_contact(contact)
+        self.fuzzy_index.add(self.fuzzy_key(contact.name, contact.birthday), contact_fields(contact))
+
+    def _insert_contacts(self, contacts):
+        self.store.insert_contacts(contacts)
+        self.fuzzy_index.add_many((self.fuzzy_key(c.name, c.birthday), contact_fields(c)) for c in contacts)
+
+    def _remove_contact(self, contact):
+        self.store.delete_contact(contact.name, contact.birthday)
+        self.fuzzy_index.remove(self.fuzzy_key(contact.name, contact.birthday))
+
+    def _update_contact(self, contact, name, address, phone, email, birthday):
+        self.store.update_contact(contact.name, contact.birthday, name, address, phone, email, birthday)
+        self.fuzzy_index.remove(self.fuzzy_key(contact.name, contact.birthday))
+        self.fuzzy_index.add(self.fuzzy_key(name, birthday), (name, phone, email, address))
+
+    def find_contact(self, name, birthday=None):
+        for contact in self.store.find_contacts(name):
+            if birthday is None or contact.birthday.lower() == birthday.lower():
+                return contact
+        return None
+
+    def find_contacts(self, name):
+        return self.store.find_contacts(name)
+
+    @timed('botassist.search_contacts')
+    def search_contacts(self, query):
+        if not query.strip():
+            return list(self.contacts)
+        return self.store.search_contacts(query)
+
+    def fuzzy_rows(self):
+        return ((self.fuzzy_key(c.name, c.birthday), contact_fields(c)) for c in self.store.iter_contacts())
+
+    def fuzzy_contact(self, item):
+        return self.find_contact(*item)
+
+    @timed('botassist.search_contacts_birthday')
+    def search_contacts_birthday(self, days, today=None):
+        results = []
+        for low, high in birthday_window(days, today or date.today()):
+            results.extend(self.store.birthdays_between(low, high))
+        return results
+
+    def _put_note(self, note_name, note_text):
+        self.store.put_note(note_name, note_text)
+
+    def _put_notes(self, rows):
+        self.store.put_notes(rows)
+
+    def _set_note_text(self, note_name, new_text):
+        self.store.set_note_text(note_name, new_text)
+
+    def _remove_note(self, note_name):
+        self.store.delete_note(note_name)
+
+    def _tag_note(self, title, new_tags):
+        self.store.add_tags(title, new_tags)
+
+    @timed('botassist.search_notes_text')
+    def search_notes_text(self, query, limit=10):
+        return self.store.search_notes_text(query, limit)
+
+    @timed('botassist.search_notes_by_tags')
+    def search_notes_by_tags(self, tags, any_tags=(), exclude=(), offset=0, limit=None):
+        return self.store.notes_with_tags(tags, any_tags, exclude, offset, limit)
+
+    @timed('botassist.tag_facets')
+    def tag_facets(self, tags, any_tags=(), exclude=()):
+        return self.store.tag_facets(tags, any_tags, exclude)
+
+    def contact_keys(self):
+        return self.store.contact_keys()
+
+    def import_contacts(self, path):
+        # Файл, за розміром не менший за таблицю, вигідніше вставити без вторинних індексів і побудувати їх потім
+        try:
+            with self.store.bulk_import(bulk.estimated_rows(path) >= self.store.count_contacts()):
+                return super().import_contacts(path)
+        except BaseException:
+            # База відкотилася до стану перед імпортом, а нечіткий індекс вже містить частину рядків
+            self.fuzzy_index = fuzzy_index()
+            raise
+
+    def snapshot(self):
+        return {"contacts": list(self.contacts), "notes": dict(self.notes.items()), "tags": self.store.tags()}
+
+    def restore(self, data):
+        packed = data.get('packed')
+        if packed is not None:
+            data = {'contacts': PackedContacts(packed, Contact), 'notes': PackedNotes(packed, Note)}
+        self.store.replace_all(data.get('contacts', []), data.get('notes', {}))
+        self.fuzzy_index = fuzzy_index()
+
+    def snapshot_copy(self):
+        # Об'єкти і так створюються заново з рядків бази
+        return self.snapshot()
+
+    @timed('botassist.read_state')
+    def read_state(self, filename="save.pickle"):
+        # З'єднання з базою використовується лише в основному потоці, тому у фоні виконується тільки читання файлу
+        return read_snapshot(filename)
+
+    def adopt_state(self, data):
+        self.restore(data)
+
+    def close(self):
+        self.store.close()
+
+async def ask(prompt):
+    # input() виконується в окремому потоці-демоні, тож цикл подій не блокується,
+    # а незавершений запит не заважає виходу з програми
+    loop = asyncio.get_running_loop()
+    answer = loop.create_future()
+
+    def read():
+        try:
+            value = input(prompt)
+        except BaseException as error:
+            loop.call_soon_threadsafe(answer.set_exception, error)
+        else:
+            loop.call_soon_threadsafe(answer.set_result, value)
+
+    threading.Thread(target=read, daemon=True).start()
+    return await answer
+
+
+async def ask_contact(assistant, name, phone, email):
+    # Повторні запити, доки поля не пройдуть перевірку BotAssist.validate_contact
+    while True:
+        if not name:
+            name = await ask("Name is obligatory, enter the name for new contact: ")
+        elif not assistant.validate_phone(phone):
+            phone = await ask("Invalid phone number format. Please enter a 10-digit number: ")
+        elif not assistant.validate_email(email):
+            email = await ask("Invalid email format. Please enter email again: ")
+        else:
+            return name, phone, email
+
+
+async def show_progress(title, progress, interval=2.0):
+    while True:
+        await asyncio.sleep(interval)
+        print(f"\n[{title}] {progress()}")
+
+
+def start_background(tasks, title, job, finished, progress=None):
+    # Тривала робота виконується в потоці; finished отримує результат уже в циклі подій
+    async def run():
+        started = time.perf_counter()
+        reporter = asyncio.create_task(show_progress(title, progress)) if progress else None
+        try:
+            result = await asyncio.to_thread(job)
+        except Exception as error:
+            print(f"\n[{title}] failed: {error}")
+            return
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+        print(f"\n[{title}] finished in {time.perf_counter() - started:.1f} s.")
+        finished(result)
+
+    task = asyncio.create_task(run())
+    tasks[title] = task
+    task.add_done_callback(lambda done: tasks.pop(title, None) if tasks.get(title) is done else None)
+    return task
+
+
+def running_sort(tasks, folder):
+    # Папка, яку вже сортує фонове завдання і яка збігається з folder або містить одна одну:
+    # два запуски ділили б журнал, маніфест і резервування вільних назв
+    for title in tasks:
+        if title.startswith('sort '):
+            running = Path(title[len('sort '):])
+            if running == folder or running in folder.parents or folder in running.parents:
+                return running
+    return None
+
+
+def main(database=None):
+   if database:
+       assistant = SqliteBotAssist(database)
+   else:
+       assistant =  BotAssist()
+       assistant.open_journal()
+   try:
+       return asyncio.run(command_loop(assistant))
+   finally:
+       # Журнал і з'єднання з базою закриваються за будь-якого виходу: команда exit, Ctrl+C, кінець вводу чи помилка
+       assistant.close()
+
+
+async def command_loop(assistant):
+   # Збереження, завантаження і сортування йдуть у фоні, поки користувач вводить інші команди
+   tasks = {}
+
+   def loaded(state):
+       if state is None:
+           print("File not found. No data loaded.")
+           return
+       assistant.adopt_state(state)
+       print("Data loaded successfully.")
+       if assistant.journal is not None:
+           # Завантажені дані не записані в журнал, тому фіксуються новим знімком
+           start_background(tasks, 'save', assistant.save_job(assistant.journal.snapshot_path), lambda result: None)
 
    while True:
-       command = input("\nEnter your command for start(for menu-press 'menu'): ").lower()
+       command = (await ask("\nEnter your command for start(for menu-press 'menu'): ")).lower()
     
        if command == '1':
-          name = input('Enter your name:')
-          address = input('Enter your adress:')
-          phone = input('Enter your phone (10-digits) : ')
-          email = input('Enter your email:')
-          birthday = input('Enter your birthday in YYYY-MM-DD:')
-          assistant.add_contact(name, address, phone, email, birthday)
+          name = await ask('Enter your name:')
+          address = await ask('Enter your adress:')
+          phone = await ask('Enter your phone (10-digits) : ')
+          email = await ask('Enter your email:')
+          birthday = await ask('Enter your birthday in YYYY-MM-DD:')
+          name, phone, email = await ask_contact(assistant, name, phone, email)
+          print(assistant.add_contact(name, address, phone, email, birthday))
 
        elif command == '2':
-          search_query = input("Enter first name or last name: ")
+          search_query = await ask("Enter first name or last name: ")
 
           results = assistant.search_contacts(search_query)
           if results:
@@ -255,91 +750,232 @@ def main():
                  print("Name:", result.name, "|", "Address:", result.address, "|", "Phone number:", result.phone, "|", "Email:", result.email, "|", "Date of birth:", result.birthday, "|")
           else:
            print("No contacts found.")
+           # Нічого не знайдено за початком імені - можливо, ім'я написане з помилкою
+           similar = assistant.fuzzy_search_contacts(search_query, 5) if search_query.strip() else []
+           if similar:
+               print("Did you mean:")
+               for result, score in similar:
+                   print("Name:", result.name, "|", "Phone number:", result.phone, "|", "Email:", result.email, "|", f"similarity {score:.0%}")
+
+       elif command == '12':
+          search_query = await ask("Enter name, phone, email or address (typos are allowed): ")
+          results = assistant.fuzzy_search_contacts(search_query)
+          if results:
+             print("Search Results:")
+             for result, score in results:
+                 print("Name:", result.name, "|", "Address:", result.address, "|", "Phone number:", result.phone, "|", "Email:", result.email, "|", "Date of birth:", result.birthday, "|", f"similarity {score:.0%}")
+          else:
+           print("No contacts found.")
 
        elif command == '3':
-          contact_name = input('Enter the contact name you want to delete:')
+          contact_name = await ask('Enter the contact name you want to delete:')
           if contact_name =='':
               print ("No contacts found.")
           else:
               assistant.delete_contact(contact_name)
 
        elif command == '4':
-          old_contact_name = input('Enter the contact old name you want to edit: ')
-          contact_exists = any(contact.name.lower() == old_contact_name.lower() for contact in assistant.contacts)
-
-          if not contact_exists:
+          old_contact_name = await ask('Enter the contact old name you want to edit: ')
+          if assistant.find_contact(old_contact_name) is None:
             print(f'Contact "{old_contact_name}" does not exist. Please, try again.')
             continue
 
-          new_name = input('Enter the new name: ')
-          new_address = input('Enter the new address: ')
-          new_phone = input('Enter the new phone: ')
-          new_email = input('Enter the new email: ')
-          new_birthday = input('Enter the new birthday in YYYY-MM-DD: ')
+          new_name = await ask('Enter the new name: ')
+          new_address = await ask('Enter the new address: ')
+          new_phone = await ask('Enter the new phone: ')
+          new_email = await ask('Enter the new email: ')
+          new_birthday = await ask('Enter the new birthday in YYYY-MM-DD: ')
+          new_name, new_phone, new_email = await ask_contact(assistant, new_name, new_phone, new_email)
 
           print(assistant.edit_contact(old_contact_name, new_name, new_address, new_phone, new_email, new_birthday))
 
        elif command == '5':
-            day_to_birthday = int(input("Enter the number of days until the birthday: "))
-            assistant.search_contacts_birthday(day_to_birthday)
+            day_to_birthday = int(await ask("Enter the number of days until the birthday: "))
+            results = assistant.search_contacts_birthday(day_to_birthday)
+            if results:
+                print("Contacts with upcoming birthdays:")
+                for contact in results:
+                    print(contact.name, "|", contact.address, "|", contact.phone, "|", contact.email, "|", contact.birthday, "|")
+            else:
+                print("No contacts with upcoming birthdays.")
         
        elif command == '6':
-            note_name = input("Enter note name: ")
-            note_text = input("Enter note text: ")
-            assistant.add_note(note_name, note_text)  # Виклик методу для створення нотатки
+            note_name = await ask("Enter note name: ")
+            note_text = await ask("Enter note text: ")
+            if note_name in assistant.notes:  # Перевірка, чи назва нотатки вже існує
+                choice = (await ask(f"Note '{note_name}' already exists. Do you want to edit it? enter yes or no: ")).lower()
+                if choice == 'yes':
+                    assistant.edit_note(note_name, note_text)  # Виклик методу для редагування нотатки
+                else:
+                    print("Note creation aborted.")
+            else:
+                assistant.add_note(note_name, note_text)  # Виклик методу для створення нотатки
 
        elif command == '7':
-            note_name = input("Enter note name to search: ")
+            note_name = await ask("Enter note name to search: ")
             assistant.search_notes(note_name)  # Виклик методу для пошуку нотатки
 
        elif command == '8':
-            edit_or_delete = input("Enter 'edit' to edit a note or 'delete' to delete a note: ").lower()
+            edit_or_delete = (await ask("Enter 'edit' to edit a note or 'delete' to delete a note: ")).lower()
 
             if edit_or_delete == 'edit':
-                note_name = input("Enter note name to edit: ")
-                new_text = input("Enter new text for the note: ")
+                note_name = await ask("Enter note name to edit: ")
+                new_text = await ask("Enter new text for the note: ")
                 assistant.edit_note(note_name, new_text)  # Виклик методу для редагування нотатки
             elif edit_or_delete == 'delete':
-                note_name = input("Enter note name to delete: ")
-                assistant.delete_note(note_name)  # Виклик методу для видалення нотатки
+                note_name = await ask("Enter note name to delete: ")
+                if note_name in assistant.notes:
+                    print(f"Note '{note_name}': {assistant.notes[note_name].text}")
+                    choice = await ask(f"Are you sure you want to delete note '{note_name}'? (1 - Yes, 2 - No): ")
+                    if choice == '1':
+                        assistant.delete_note(note_name)  # Виклик методу для видалення нотатки
+                    else:
+                        print("Deletion aborted.")
+                else:
+                    assistant.delete_note(note_name)
             else:
                 print("Invalid command. Please enter 'edit' or 'delete'.")
     
                 
        elif command == '9': # Виклик методу для додавання тегів до нотатків
-            title = input("Enter note name:")
-            new_tags = input("Enter tags:").split(",")
+            title = await ask("Enter note name:")
+            new_tags = [tag.strip() for tag in (await ask("Enter tags:")).split(",") if tag.strip()]
             assistant.add_tags_to_note(title, new_tags)
        elif command == "10": # пошук нотатків за тегами
-            tags = input("Enter tags for search (comma separated):").split(",")
-            results = assistant.search_notes_by_tags(tags)
-            if results:
+            query = (await ask("Enter tags for search (comma separated, |tag - any of, -tag - without):")).split(",")
+            tags, any_tags, exclude = [], [], []
+            for tag in filter(None, map(str.strip, query)):
+                if tag.startswith('|'):
+                    any_tags.append(tag[1:].strip())
+                elif tag.startswith('-'):
+                    exclude.append(tag[1:].strip())
+                else:
+                    tags.append(tag)
+            offset = 0
+            while True:
+                results = assistant.search_notes_by_tags(tags, any_tags, exclude, offset, 20)
                 for result in results:
                     print(result.tags, "|", result.text)
+                if not results and offset == 0:
+                    print("Not found.")
+                if len(results) < 20 or (await ask("Show more? (yes/no): ")).lower() != 'yes':
+                    break
+                offset += 20
+            if offset or results:
+                facets = assistant.tag_facets(tags, any_tags, exclude)
+                print("Tags in results:", ", ".join(f"{tag}({count})" for tag, count in facets))
+       elif command == "11": # пошук нотатків за текстом
+            query = await ask("Enter words to search in notes (OR between alternatives, * for prefix):")
+            results = assistant.search_notes_text(query)
+            if results:
+                for note_name, note in results:
+                    print(note_name, "|", note.text)
             else:
                 print("Not found.")
        elif command == 'show all':
             print(assistant.show_all_contacts())
        elif command == 'show all notes':
             print(assistant.show_all_notes())        
+       elif command in ('import', 'export'):
+            kind = (await ask("Enter 'contacts' or 'notes': ")).strip().lower()
+            if kind not in ('contacts', 'notes'):
+                print("Invalid, Try Again:")
+                continue
+            filename = await ask(f"Enter the .csv or .jsonl filename to {command} {kind}: ")
+            started = time.perf_counter()
+            try:
+                if command == 'export':
+                    count = getattr(assistant, f'export_{kind}')(filename)
+                    print(f"Exported {count} {kind} in {time.perf_counter() - started:.1f} s.")
+                    continue
+                imported, rejected = getattr(assistant, f'import_{kind}')(filename)
+            except (OSError, ValueError) as error:
+                print(f"{command.capitalize()} failed: {error}")
+                continue
+            print(f"Imported {imported} {kind} in {time.perf_counter() - started:.1f} s, rejected {len(rejected)} rows.")
+            for number, reason in rejected[:20]:
+                print(f"  line {number}: {reason}")
+            if len(rejected) > 20:
+                print(f"  ... and {len(rejected) - 20} more")
+       elif command in ("save", "load") and ('save' in tasks or 'load' in tasks):
+           print("Previous save or load is still running, try again later.")
        elif command == "save":
-           filename = input("Enter the filename to save data: ")
-           assistant.save_data(filename)
+           filename = await ask("Enter the filename to save data: ")
+           start_background(tasks, 'save', assistant.save_job(filename), lambda result: print("Data saved successfully."))
+           print("Saving in background...")
 
        elif command == 'load':
-            filename = input("Enter the filename to load data: ")
-            assistant.load_data(filename) 
+            filename = await ask("Enter the filename to load data: ")
+            start_background(tasks, 'load', lambda: assistant.read_state(filename), loaded)
+            print("Loading in background...")
        elif command == 'sort':
-           folder_path = Path(input("Enter the folder path to sort (absolute path):"))
-           assistant.sort_files(folder_path)
-           print("Folder is sorted successfully!")
+           folder_path = Path(await ask("Enter the folder path to sort (absolute path):")).resolve()
+           running = running_sort(tasks, folder_path)
+           if running is not None:
+               print(f"{running} is still being sorted, try again when it finishes.")
+               continue
+           workers = (await ask("Enter the number of parallel workers (press Enter to sort sequentially):")).strip()
+           file_sorter = assistant.file_sorter(folder_path, int(workers) if workers.isdigit() else None)
+
+           def sorted_folder(result, file_sorter=file_sorter):
+               print("Folder is sorted successfully!")
+               print(file_sorter.report())
+
+           def progress(file_sorter=file_sorter):
+               files, size = file_sorter.progress()
+               return f"{files} files, {size / 1048576:.1f} MB sorted"
+
+           start_background(tasks, f'sort {folder_path}', file_sorter.core, sorted_folder, progress)
+           print("Sorting in background...")
+       elif command == 'stats':
+            action = (await ask("Enter on, off, reset, json or prometheus (press Enter to show): ")).strip().lower()
+            if action == 'on':
+                METRICS.enable(METRICS.profile_mode)
+                print("Metrics enabled.")
+            elif action == 'off':
+                METRICS.disable()
+                print("Metrics disabled.")
+            elif action == 'reset':
+                METRICS.reset()
+                print("Metrics cleared.")
+            elif action in ('json', 'prometheus'):
+                filename = (await ask("Enter the filename (press Enter to print): ")).strip()
+                if filename:
+                    # Формат файлу визначає розширення, тому для JSON потрібне .json
+                    if (action == 'json') != filename.lower().endswith('.json'):
+                        print("Use the .json extension for json and any other for prometheus.")
+                        continue
+                    METRICS.export(filename)
+                    print(f"Metrics written to {filename}.")
+                else:
+                    print(METRICS.to_json() if action == 'json' else METRICS.to_prometheus())
+            elif action in ('', 'show'):
+                if not METRICS.enabled:
+                    print("Metrics are disabled, enable them with 'stats' and 'on'.")
+                print(METRICS.summary())
+            else:
+                print("Invalid, Try Again:")
+       elif command == 'profile':
+            # Профілюється кожна наступна команда; звіт останнього виклику кожної операції показує 'stats'
+            mode = (await ask("Enter cpu or memory to profile next commands, off to stop profiling: ")).strip().lower()
+            if mode in ('cpu', 'memory'):
+                METRICS.enable(mode)
+                print(f"Profiling ({mode}) enabled, see the reports with 'stats'.")
+            elif mode == 'off':
+                METRICS.enable()
+                print("Profiling disabled, metrics are still collected.")
+            else:
+                print("Invalid, Try Again:")
 
            
        elif command == 'menu':
-            print("\n---------------------------\nHello, I'm your ' Personal Assistant '.\nI save all information automatically. I can make next comand:\n---------------------------\n 1-add contact\n 2-search contact\n 3-delete contact\n 4-edit contact\n 5-find birthday\n 6-add note \n 7-search note \n 8-edit or delete note\n 9-add tag \n 10-search note by tag\n--------------------------- \n show all-Show all contacts \n show all notes-Show all notes \n sort-if you want sort folder\n save-if you want save information handler\n load-if you want to continue with the previously saved information\n show all notes- Show all notes\n exit, close, end-if you want exit\n---------------------------")
+            print("\n---------------------------\nHello, I'm your ' Personal Assistant '.\nI save all information automatically. I can make next comand:\n---------------------------\n 1-add contact\n 2-search contact\n 3-delete contact\n 4-edit contact\n 5-find birthday\n 6-add note \n 7-search note \n 8-edit or delete note\n 9-add tag \n 10-search note by tag\n 11-search note by text\n 12-fuzzy search contact (name, phone, email, address)\n--------------------------- \n import-import contacts or notes from CSV/JSONL\n export-export contacts or notes to CSV/JSONL\n show all-Show all contacts \n show all notes-Show all notes \n sort-if you want sort folder\n stats-show, export or switch metrics\n profile-profile next commands (cpu or memory)\n save-if you want save information handler\n load-if you want to continue with the previously saved information\n show all notes- Show all notes\n exit, close, end-if you want exit\n---------------------------")
           
 
        elif command in ['end', 'close', 'exit']:
+          while tasks:
+              print("Waiting for background tasks:", ", ".join(tasks))
+              await asyncio.gather(*tasks.values())
           break
        else:
           print("Invalid, Try Again:")
@@ -348,8 +984,17 @@ def main():
            
 if __name__ == "__main__":
     try:
-        assistant = main()  
-        if assistant:
-            assistant.save_data()  
+        # python main.py --sqlite assistant.db — зберігання у SQLite замість журналу
+        database = sys.argv[sys.argv.index('--sqlite') + 1] if '--sqlite' in sys.argv[1:-1] else None
+        # --metrics вмикає метрики з запуску, --profile cpu|memory - ще й профілювання кожної команди
+        profile_mode = sys.argv[sys.argv.index('--profile') + 1] if '--profile' in sys.argv[1:-1] else None
+        if '--metrics' in sys.argv[1:] or profile_mode:
+            METRICS.enable(profile_mode)
+        main(database)
+    except KeyboardInterrupt:
+        print("\nInterrupted, all changes are saved.", flush=True)
+        # Потік ask() досі чекає на input() і тримає stdin, тож звичайне завершення інтерпретатора аварійне;
+        # журнал і база вже закриті в main()
+        os._exit(130)
     except Exception as error:
         print(f"An error occurred: {error}")
\ No newline at end of file
@@ -0,0 +1,245 @@
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from functools import wraps
+
+# Межі кошиків гістограм затримок у секундах, як у клієнтах Prometheus: від 50 мкс до хвилини
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PREFIX = 'pypower_'
+PROFILE_LINES = 20
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        # Верхня межа кошика, у який потрапляє квантиль; точніше гістограма з фіксованими кошиками не скаже
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    # Реєстр метрик процесу. Поки enabled вимкнено, інструментований код лише перевіряє цей прапорець
+    def __init__(self):
+        self.enabled = False
+        self.profile_mode = None
+        self.lock = threading.Lock()
+        # Профілювальник один на процес, тому профілюється лише один виклик одночасно, а вкладені - ні
+        self.profiling = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.profiles = {}
+
+    def enable(self, profile_mode=None):
+        if profile_mode not in (None, 'cpu', 'memory'):
+            raise ValueError(f"Unknown profile mode '{profile_mode}', use cpu or memory")
+        self.profile_mode = profile_mode
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        self.profile_mode = None
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.gauges.clear()
+            self.profiles.clear()
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name, value, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def add(self, name, value=1, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.gauges[key] = value
+
+    def call(self, operation, function, args, kwargs):
+        profile = self.profile_mode is not None and self.profiling.acquire(blocking=False)
+        if profile:
+            profiler = self.start_profile()
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except BaseException:
+            self.add('operation_errors_total', operation=operation)
+            raise
+        finally:
+            self.observe('operation_seconds', time.perf_counter() - started, operation=operation)
+            if profile:
+                try:
+                    report = self.stop_profile(profiler)
+                    with self.lock:
+                        self.profiles[operation] = report
+                finally:
+                    self.profiling.release()
+
+    def start_profile(self):
+        if self.profile_mode == 'cpu':
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return profiler
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        return started, tracemalloc.take_snapshot()
+
+    def stop_profile(self, profiler):
+        stream = io.StringIO()
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            stream.write('cpu profile\n')
+            pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(PROFILE_LINES)
+            return stream.getvalue()
+        started, before = profiler
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if started:
+            tracemalloc.stop()
+        stream.write(f'memory profile, peak traced memory: {peak / 1048576:.1f} MB\n')
+        own = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        for difference in after.filter_traces(own).compare_to(before.filter_traces(own), 'lineno')[:PROFILE_LINES]:
+            stream.write(f'{difference}\n')
+        return stream.getvalue()
+
+    def snapshot(self):
+        with self.lock:
+            histograms = [{'name': name, 'labels': dict(labels), 'count': histogram.count, 'sum': histogram.total,
+                           'max': histogram.max, 'p50': histogram.quantile(0.5), 'p95': histogram.quantile(0.95),
+                           'p99': histogram.quantile(0.99),
+                           'buckets': {str(bound): count for bound, count in zip(BUCKETS + ('+Inf',), histogram.counts)}}
+                          for (name, labels), histogram in sorted(self.histograms.items())]
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            gauges = [{'name': name, 'labels': dict(labels), 'value': value}
+                      for (name, labels), value in sorted(self.gauges.items())]
+            profiles = dict(self.profiles)
+        return {'enabled': self.enabled, 'profile_mode': self.profile_mode, 'histograms': histograms,
+                'counters': counters, 'gauges': gauges, 'profiles': profiles}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2, ensure_ascii=False)
+
+    def to_prometheus(self):
+        # Текстовий формат експозиції Prometheus 0.0.4; гістограми - з накопичувальними кошиками le
+        data = self.snapshot()
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f'# TYPE {name} {kind}')
+
+        for histogram in data['histograms']:
+            name = PREFIX + histogram['name']
+            declare(name, 'histogram')
+            cumulative = 0
+            for bound, count in histogram['buckets'].items():
+                cumulative += count
+                lines.append(f'{name}_bucket{prometheus_labels(histogram["labels"], le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{prometheus_labels(histogram["labels"])} {histogram["sum"]}')
+            lines.append(f'{name}_count{prometheus_labels(histogram["labels"])} {histogram["count"]}')
+        for kind, items in (('counter', data['counters']), ('gauge', data['gauges'])):
+            for item in items:
+                name = PREFIX + item['name']
+                declare(name, kind)
+                lines.append(f'{name}{prometheus_labels(item["labels"])} {item["value"]}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path):
+        # Файл .json - у форматі JSON, будь-який інший - у текстовому форматі Prometheus
+        text = self.to_json() if str(path).lower().endswith('.json') else self.to_prometheus()
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+
+    def summary(self):
+        # Таблиця для команди stats
+        data = self.snapshot()
+        lines = [f'{"operation":<46} {"count":>8} {"errors":>6} {"mean ms":>10} {"p50 ms":>10} {"p95 ms":>10} {"max ms":>10}']
+        errors = {item['labels'].get('operation'): item['value'] for item in data['counters']
+                  if item['name'] == 'operation_errors_total'}
+        for histogram in data['histograms']:
+            operation = histogram['labels'].get('operation') or describe(histogram['name'], histogram['labels'])
+            lines.append(f'{operation:<46} {histogram["count"]:>8} {errors.get(operation, 0):>6} '
+                         f'{histogram["sum"] / histogram["count"] * 1000:>10.3f} {histogram["p50"] * 1000:>10.3f} '
+                         f'{histogram["p95"] * 1000:>10.3f} {histogram["max"] * 1000:>10.3f}')
+        for item in data['counters'] + data['gauges']:
+            if item['name'] != 'operation_errors_total':
+                lines.append(f'{describe(item["name"], item["labels"])}: {format_value(item["value"])}')
+        for operation, report in data['profiles'].items():
+            lines.append(f'\n--- {operation}: {report.rstrip()}')
+        return '\n'.join(lines)
+
+
+def describe(name, labels):
+    if not labels:
+        return name
+    return f'{name} ({", ".join(f"{key}={value}" for key, value in labels.items())})'
+
+
+def format_value(value):
+    return f'{value:.2f}' if isinstance(value, float) else str(value)
+
+
+def prometheus_labels(labels, **extra):
+    labels = {**labels, **extra}
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+METRICS = Metrics()
+
+
+def timed(operation):
+    # Вимкнені метрики коштують одну перевірку прапорця на виклик
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not METRICS.enabled:
+                return function(*args, **kwargs)
+            return METRICS.call(operation, function, args, kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,438 @@
+import heapq
+import json
+import mmap
+import os
+import pickle
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from datetime import date
+from itertools import accumulate, chain
+from operator import itemgetter
+
+from index import BirthdayIndex, ContactIndex, ItemList, NoteTextIndex, TagIndex, birthday_key, birthday_window
+
+# Формат збереження з індексом зсувів: MAGIC, секції (вирівняні на 8 байтів), каталог секцій у JSON
+# і 8 байтів зі зсувом каталогу в кінці файлу. Записи кодуються окремо, тож файл відкривається через mmap
+# за сталий час, а контакт чи нотатка декодуються лише тоді, коли до них звертаються
+MAGIC = b'BOTPACK1'
+TRAILER = struct.Struct('<Q')
+VERSION = 1
+# Windows не дає замінити файл, поки він відображений у пам'ять, а збереження замінює той самий знімок,
+# з якого ліниво читаються записи; там файл читається в пам'ять цілком, хоч і без декодування записів
+MAP_FILES = os.name != 'nt'
+
+
+def string_table(strings):
+    # Рядки підряд в одному блоці плюс масив зсувів (n + 1 значень)
+    encoded = [text.encode('utf-8', 'surrogatepass') for text in strings]
+    return array('Q', accumulate(map(len, encoded), initial=0)), b''.join(encoded)
+
+
+def record_table(records):
+    blobs = [pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL) for record in records]
+    return array('Q', accumulate(map(len, blobs), initial=0)), b''.join(blobs)
+
+
+def posting_table(sections, name, postings, typecode=None):
+    # Відсортовані унікальні ключі (рядки або числа з typecode) і для кожного - суцільний відрізок номерів
+    # записів, тож пошук за префіксом чи діапазоном ключів - один зріз масиву records
+    keys = sorted(postings)
+    if typecode is None:
+        sections[f'{name}.offsets'], sections[name] = string_table(keys)
+    else:
+        sections[name] = array(typecode, keys)
+    sections[f'{name}.starts'] = array('Q', accumulate((len(postings[key]) for key in keys), initial=0))
+    sections[f'{name}.records'] = array('I', chain.from_iterable(postings[key] for key in keys))
+
+
+def write_packed(file, contacts, notes, seq=0):
+    sections = {}
+    fields, names, words, days = [], {}, {}, {}
+    for record, contact in enumerate(contacts):
+        birthday = contact.birthday
+        fields.append((contact.name, contact.address, contact.phone, contact.email, birthday))
+        names.setdefault(ContactIndex.key(contact.name), []).append(record)
+        for word in ContactIndex.words(contact.name):
+            words.setdefault(word, []).append(record)
+        day = birthday_key(birthday)
+        if day is not None:
+            days.setdefault(day, []).append(record)
+    sections['contacts.offsets'], sections['contacts'] = record_table(fields)
+    posting_table(sections, 'names', names)
+    posting_table(sections, 'words', words)
+    posting_table(sections, 'birthdays', days, 'I')
+
+    notes = list(notes.items())
+    tags = {}
+    for record, (name, note) in enumerate(notes):
+        for tag in note.tags:
+            tags.setdefault(tag, []).append(record)
+    sections['notes.offsets'], sections['notes'] = record_table((note.text, list(note.tags)) for name, note in notes)
+    sections['note_names.offsets'], sections['note_names'] = string_table(name for name, note in notes)
+    sections['note_names.order'] = array('I', sorted(range(len(notes)), key=lambda record: notes[record][0]))
+    posting_table(sections, 'tags', tags)
+
+    directory = {'version': VERSION, 'seq': seq, 'byteorder': sys.byteorder, 'sections': {}}
+    position = file.write(MAGIC)
+    for name, data in sections.items():
+        position += file.write(b'\0' * (-position % 8))
+        data = memoryview(data).cast('B')
+        directory['sections'][name] = [position, len(data)]
+        position += file.write(data)
+    file.write(json.dumps(directory).encode())
+    file.write(TRAILER.pack(position))
+
+
+def is_packed(path):
+    with open(path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+class StringTable:
+    # Послідовність рядків із файлу; bisect працює з нею напряму, декодуючи лише порівнювані рядки
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position):
+        return str(self.blob[self.offsets[position]:self.offsets[position + 1]], 'utf-8', 'surrogatepass')
+
+
+class Postings:
+    # Таблиця з posting_table: keys - послідовність ключів, records[starts[i]:starts[i + 1]] - записи ключа i
+    def __init__(self, keys, starts, records):
+        self.keys = keys
+        self.starts = starts
+        self.records = records
+
+    def get(self, key):
+        position = bisect_left(self.keys, key)
+        if position == len(self.keys) or self.keys[position] != key:
+            return []
+        return self.records[self.starts[position]:self.starts[position + 1]].tolist()
+
+    def between(self, low, high):
+        # Записи всіх ключів low <= ключ < high
+        start = bisect_left(self.keys, low)
+        stop = bisect_left(self.keys, high)
+        return self.records[self.starts[start]:self.starts[stop]].tolist()
+
+    def pairs(self, low, high):
+        # [(ключ, запис)] для low <= ключ < high у порядку ключів
+        pairs = []
+        for position in range(bisect_left(self.keys, low), bisect_left(self.keys, high)):
+            key = self.keys[position]
+            pairs.extend((key, record) for record in self.records[self.starts[position]:self.starts[position + 1]])
+        return pairs
+
+
+class SortedNames:
+    # Назви нотаток у порядку сортування, хоча у файлі вони лежать у порядку записів
+    def __init__(self, names, order):
+        self.names = names
+        self.order = order
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, position):
+        return self.names[self.order[position]]
+
+
+class PackedFile:
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if MAP_FILES else file.read()
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a packed save file')
+        start, = TRAILER.unpack_from(self.map, len(self.map) - TRAILER.size)
+        directory = json.loads(self.map[start:len(self.map) - TRAILER.size])
+        if directory['version'] > VERSION:
+            raise ValueError(f'{path} was saved by a newer version (format {directory["version"]})')
+        if directory['byteorder'] != sys.byteorder:
+            raise ValueError(f'{path} was saved on a machine with a different byte order')
+        self.seq = directory['seq']
+        self.sections = directory['sections']
+        self.view = memoryview(self.map)
+        self.contact_offsets = self.array('contacts.offsets', 'Q')
+        self.contact_data = self.section('contacts')
+        self.names = self.postings('names', self.strings('names'))
+        self.words = self.postings('words', self.strings('words'))
+        self.birthday_days = self.postings('birthdays', self.array('birthdays', 'I'))
+        self.note_offsets = self.array('notes.offsets', 'Q')
+        self.note_data = self.section('notes')
+        self.note_names = self.strings('note_names')
+        self.sorted_note_names = SortedNames(self.note_names, self.array('note_names.order', 'I'))
+        self.tags = self.postings('tags', self.strings('tags'))
+
+    def section(self, name):
+        start, length = self.sections[name]
+        return self.view[start:start + length]
+
+    def array(self, name, typecode):
+        return self.section(name).cast(typecode)
+
+    def strings(self, name):
+        return StringTable(self.array(f'{name}.offsets', 'Q'), self.section(name))
+
+    def postings(self, name, keys):
+        return Postings(keys, self.array(f'{name}.starts', 'Q'), self.array(f'{name}.records', 'I'))
+
+    @property
+    def contact_count(self):
+        return len(self.contact_offsets) - 1
+
+    @property
+    def note_count(self):
+        return len(self.note_offsets) - 1
+
+    def contact(self, record):
+        # (ім'я, адреса, телефон, email, дата народження)
+        return pickle.loads(self.contact_data[self.contact_offsets[record]:self.contact_offsets[record + 1]])
+
+    def note(self, record):
+        # (текст, теги)
+        return pickle.loads(self.note_data[self.note_offsets[record]:self.note_offsets[record + 1]])
+
+    def named(self, key):
+        # Номери контактів із точним ключем імені
+        return self.names.get(key)
+
+    def prefixed(self, prefix):
+        # Номери контактів, ім'я, прізвище або повне ім'я яких починається з prefix
+        return list(dict.fromkeys(self.words.between(prefix, prefix + chr(0x10FFFF))))
+
+    def birthdays(self, low, high):
+        # [(ключ MMDD, номер контакту)] для low <= ключ < high у порядку ключів
+        return self.birthday_days.pairs(low, high)
+
+    def note_record(self, name):
+        position = bisect_left(self.sorted_note_names, name)
+        if position < len(self.sorted_note_names) and self.sorted_note_names[position] == name:
+            return self.sorted_note_names.order[position]
+        return None
+
+    def tagged(self, tag):
+        return [self.note_names[record] for record in self.tags.get(tag)]
+
+
+class PackedContacts:
+    # Контакти з файлу, декодовані при першому зверненні, плюс додані після завантаження.
+    # Видалений контакт файлу лише позначається, тож номери записів не зсуваються
+    def __init__(self, packed, factory):
+        self.packed = packed
+        self.factory = factory
+        self.decoded = {}
+        self.records = {}
+        self.deleted = set()
+        self.added = ItemList()
+
+    def at(self, record):
+        contact = self.decoded.get(record)
+        if contact is None:
+            contact = self.decoded[record] = self.factory(*self.packed.contact(record))
+            self.records[id(contact)] = record
+        return contact
+
+    def record(self, contact):
+        return self.records.get(id(contact))
+
+    def __iter__(self):
+        for record in range(self.packed.contact_count):
+            if record not in self.deleted:
+                yield self.at(record)
+        yield from self.added
+
+    def __len__(self):
+        return self.packed.contact_count - len(self.deleted) + len(self.added)
+
+    def append(self, contact):
+        self.added.append(contact)
+
+    def extend(self, contacts):
+        self.added.extend(contacts)
+
+    def remove(self, contact):
+        record = self.record(contact)
+        if record is None:
+            self.added.remove(contact)
+        else:
+            self.deleted.add(record)
+
+
+class PackedNotes:
+    # Словник назва -> Note поверх файлу: нотатки декодуються при першому зверненні,
+    # змінені та нові живуть у decoded, видалені з файлу - у deleted
+    def __init__(self, packed, factory):
+        self.packed = packed
+        self.factory = factory
+        self.decoded = {}
+        self.deleted = set()
+        self.added = set()
+
+    def in_file(self, name):
+        return self.packed.note_record(name) is not None
+
+    def __contains__(self, name):
+        return name in self.decoded or name not in self.deleted and self.in_file(name)
+
+    def __getitem__(self, name):
+        note = self.decoded.get(name)
+        if note is not None:
+            return note
+        record = None if name in self.deleted else self.packed.note_record(name)
+        if record is None:
+            raise KeyError(name)
+        note = self.decoded[name] = self.factory(*self.packed.note(record))
+        return note
+
+    def __setitem__(self, name, note):
+        # Нотатка з файлу, видалена й додана знову, лишається записом файлу: досить прибрати її з deleted
+        if not self.in_file(name):
+            self.added.add(name)
+        self.decoded[name] = note
+        self.deleted.discard(name)
+
+    def __delitem__(self, name):
+        self.pop(name)
+
+    def pop(self, name):
+        note = self[name]
+        del self.decoded[name]
+        if name in self.added:
+            self.added.discard(name)
+        else:
+            self.deleted.add(name)
+        return note
+
+    def __iter__(self):
+        for record in range(self.packed.note_count):
+            name = self.packed.note_names[record]
+            if name not in self.deleted:
+                yield name
+        yield from [name for name in self.decoded if name in self.added]
+
+    def __len__(self):
+        return self.packed.note_count - len(self.deleted) + len(self.added)
+
+    def items(self):
+        for name in self:
+            yield name, self[name]
+
+
+class PackedContactIndex:
+    # Пошук за іменем через таблиці файлу; контакти, додані чи змінені після завантаження,
+    # індексуються звичайним ContactIndex, а їхні старі записи у файлі приховуються
+    def __init__(self, packed, contacts):
+        self.packed = packed
+        self.contacts = contacts
+        self.changes = ContactIndex()
+        self.hidden = set()
+
+    def visible(self, records):
+        return [self.contacts.at(record) for record in records if record not in self.hidden]
+
+    def add(self, contact):
+        self.changes.add(contact)
+
+    def add_many(self, contacts):
+        self.changes.add_many(contacts)
+
+    def remove(self, contact):
+        record = self.contacts.record(contact)
+        if record is not None:
+            self.hidden.add(record)
+        self.changes.remove(contact)
+
+    def lookup(self, name):
+        return self.visible(self.packed.named(ContactIndex.key(name))) + self.changes.lookup(name)
+
+    def find(self, name, birthday=None):
+        for contact in self.lookup(name):
+            if birthday is None or contact.birthday.lower() == birthday.lower():
+                return contact
+        return None
+
+    def search(self, query):
+        found = {}
+        for contact in self.visible(self.packed.prefixed(ContactIndex.key(query))) + self.changes.search(query):
+            found.setdefault(id(contact), contact)
+        return list(found.values())
+
+
+class PackedBirthdayIndex:
+    def __init__(self, packed, contacts):
+        self.packed = packed
+        self.contacts = contacts
+        self.changes = BirthdayIndex()
+        self.hidden = set()
+
+    def add(self, contact):
+        self.changes.add(contact)
+
+    def add_many(self, contacts):
+        self.changes.add_many(contacts)
+
+    def remove(self, contact):
+        record = self.contacts.record(contact)
+        if record is not None:
+            self.hidden.add(record)
+        self.changes.remove(contact)
+
+    def upcoming(self, days, today=None):
+        today = today or date.today()
+        results = []
+        for low, high in birthday_window(days, today):
+            stored = ((key, self.contacts.at(record)) for key, record in self.packed.birthdays(low, high + 1)
+                      if record not in self.hidden)
+            changed = ((birthday_key(contact.birthday), contact) for contact in self.changes.days.range(low, high + 1))
+            results.extend(contact for key, contact in heapq.merge(stored, changed, key=itemgetter(0)))
+        return results
+
+
+class PackedTagIndex(TagIndex):
+    # self.tags містить лише теги, додані після завантаження; hidden - нотатки, чиї теги у файлі вже неактуальні
+    def __init__(self, packed):
+        super().__init__()
+        self.packed = packed
+        self.hidden = set()
+
+    def remove(self, name, tags):
+        super().remove(name, tags)
+        self.hidden.add(name)
+
+    def posting(self, tag):
+        names = {name for name in self.packed.tagged(tag) if name not in self.hidden}
+        names.update(self.tags.get(tag, ()))
+        return names
+
+
+class LazyTextIndex:
+    # Повнотекстовий індекс будується з нотаток під час першого пошуку; доти зміни можна не відстежувати,
+    # бо побудова однаково читає поточний стан нотаток
+    def __init__(self, notes):
+        self.notes = notes
+        self.index = None
+
+    def add(self, name, text):
+        if self.index is not None:
+            self.index.add(name, text)
+
+    def add_many(self, items):
+        if self.index is not None:
+            self.index.add_many(items)
+
+    def remove(self, name):
+        if self.index is not None:
+            self.index.remove(name)
+
+    def search(self, query, limit=10):
+        if self.index is None:
+            self.index = NoteTextIndex()
+            self.index.rebuild(self.notes)
+        return self.index.search(query, limit)
@@ -0,0 +1,347 @@
+import contextlib
+import sqlite3
+
+from index import ContactIndex, birthday_key, parse_text_query
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    address TEXT,
+    phone TEXT,
+    email TEXT,
+    birthday TEXT,
+    birthday_key INTEGER
+);
+CREATE TABLE IF NOT EXISTS contact_words (
+    word TEXT NOT NULL,
+    contact_id INTEGER NOT NULL REFERENCES contacts (id) ON DELETE CASCADE,
+    PRIMARY KEY (word, contact_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS notes (
+    name TEXT PRIMARY KEY,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS note_tags (
+    tag TEXT NOT NULL,
+    note_name TEXT NOT NULL REFERENCES notes (name) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (tag, note_name, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS note_tags_note ON note_tags (note_name, position);
+"""
+
+# Вторинні індекси контактів окремо: масовий імпорт може видалити їх і побудувати заново одним проходом
+CONTACT_INDEXES = {
+    'contacts_name_key': "CREATE INDEX IF NOT EXISTS contacts_name_key ON contacts (name_key)",
+    'contacts_birthday_key': "CREATE INDEX IF NOT EXISTS contacts_birthday_key ON contacts (birthday_key)",
+    'contact_words_contact': "CREATE INDEX IF NOT EXISTS contact_words_contact ON contact_words (contact_id)",
+}
+
+TEXT_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5 (text, content = 'notes', content_rowid = 'rowid');
+CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+    INSERT INTO notes_fts (rowid, text) VALUES (new.rowid, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+    INSERT INTO notes_fts (notes_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE OF text ON notes BEGIN
+    INSERT INTO notes_fts (notes_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+    INSERT INTO notes_fts (rowid, text) VALUES (new.rowid, new.text);
+END;
+"""
+
+CONTACT_COLUMNS = "contacts.name, contacts.address, contacts.phone, contacts.email, contacts.birthday"
+INSERT_CONTACT = ("INSERT INTO contacts (name, name_key, address, phone, email, birthday, birthday_key) "
+                  "VALUES (?, ?, ?, ?, ?, ?, ?)")
+INSERT_CONTACT_ROW = ("INSERT INTO contacts (id, name, name_key, address, phone, email, birthday, birthday_key) "
+                      "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+NEXT_CONTACT_ID = "SELECT COALESCE(MAX(id), 0) + 1 FROM contacts"
+INSERT_WORD = "INSERT OR IGNORE INTO contact_words (word, contact_id) VALUES (?, ?)"
+FIND_CONTACT_ID = "SELECT id FROM contacts WHERE name_key = ? AND birthday IS ? LIMIT 1"
+FIND_CONTACTS = f"SELECT {CONTACT_COLUMNS} FROM contacts WHERE name_key = ? ORDER BY id"
+DELETE_CONTACT = "DELETE FROM contacts WHERE id = ?"
+DELETE_WORDS = "DELETE FROM contact_words WHERE contact_id = ?"
+UPDATE_CONTACT = ("UPDATE contacts SET name = ?, name_key = ?, address = ?, phone = ?, email = ?, birthday = ?, "
+                  "birthday_key = ? WHERE id = ?")
+SEARCH_CONTACTS = (f"SELECT {CONTACT_COLUMNS} FROM contacts WHERE id IN "
+                   "(SELECT contact_id FROM contact_words WHERE word >= ? AND word < ?) ORDER BY name_key, id")
+BIRTHDAYS_BETWEEN = (f"SELECT {CONTACT_COLUMNS} FROM contacts WHERE birthday_key BETWEEN ? AND ? "
+                     "ORDER BY birthday_key, id")
+ALL_CONTACTS = f"SELECT {CONTACT_COLUMNS} FROM contacts ORDER BY id"
+COUNT_CONTACTS = "SELECT COUNT(*) FROM contacts"
+CONTACT_KEYS = "SELECT name_key, birthday FROM contacts"
+
+GET_NOTE = "SELECT text FROM notes WHERE name = ?"
+HAS_NOTE = "SELECT 1 FROM notes WHERE name = ?"
+GET_NOTE_TAGS = "SELECT tag FROM note_tags WHERE note_name = ? ORDER BY position"
+PUT_NOTE = "INSERT INTO notes (name, text) VALUES (?, ?)"
+SET_NOTE_TEXT = "UPDATE notes SET text = ? WHERE name = ?"
+DELETE_NOTE = "DELETE FROM notes WHERE name = ?"
+NEXT_TAG_POSITION = "SELECT COALESCE(MAX(position) + 1, 0) FROM note_tags WHERE note_name = ?"
+INSERT_TAG = ("INSERT INTO note_tags (tag, note_name, position) SELECT ?, ?, ? "
+              "WHERE NOT EXISTS (SELECT 1 FROM note_tags WHERE tag = ? AND note_name = ?)")
+ALL_NOTE_NAMES = "SELECT name FROM notes ORDER BY rowid"
+COUNT_NOTES = "SELECT COUNT(*) FROM notes"
+ALL_TAGS = "SELECT tag, note_name FROM note_tags ORDER BY note_name, position"
+SEARCH_NOTES_TEXT = ("SELECT notes.name FROM notes_fts JOIN notes ON notes.rowid = notes_fts.rowid "
+                     "WHERE notes_fts MATCH ? ORDER BY bm25(notes_fts) LIMIT ?")
+
+
+def tag_filter(all_tags, any_tags, exclude):
+    # Умова WHERE для notes.name та її параметри: усі теги, хоча б один, жодного
+    conditions, parameters = [], []
+    if all_tags:
+        all_tags = list(set(all_tags))
+        conditions.append(f"notes.name IN (SELECT note_name FROM note_tags WHERE tag IN ({', '.join('?' * len(all_tags))}) "
+                          "GROUP BY note_name HAVING COUNT(DISTINCT tag) = ?)")
+        parameters += [*all_tags, len(all_tags)]
+    if any_tags:
+        any_tags = list(set(any_tags))
+        conditions.append(f"notes.name IN (SELECT note_name FROM note_tags WHERE tag IN ({', '.join('?' * len(any_tags))}))")
+        parameters += any_tags
+    if exclude:
+        exclude = list(set(exclude))
+        conditions.append(f"notes.name NOT IN (SELECT note_name FROM note_tags WHERE tag IN ({', '.join('?' * len(exclude))}))")
+        parameters += exclude
+    return " AND ".join(conditions) or "1", parameters
+
+
+def fts_query(query):
+    # Той самий синтаксис запиту, що й у NoteTextIndex, у вигляді виразу FTS5
+    groups = []
+    for group in parse_text_query(query):
+        terms = [f'"{term}"' + (' *' if prefix else '') for term, prefix in group]
+        groups.append('(' + ' AND '.join(terms) + ')')
+    return ' OR '.join(groups)
+
+
+class SqliteStore:
+    def __init__(self, filename, contact_factory, note_factory):
+        self.contact_factory = contact_factory
+        self.note_factory = note_factory
+        self.connection = sqlite3.connect(filename, check_same_thread=False, cached_statements=256)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+        for statement in CONTACT_INDEXES.values():
+            self.connection.execute(statement)
+        self.importing = False
+        has_text_index = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'notes_fts'").fetchone() is not None
+        self.connection.executescript(TEXT_SCHEMA)
+        if not has_text_index:
+            with self.connection:
+                self.connection.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+
+    def contact(self, row):
+        return self.contact_factory(*row)
+
+    def _insert_contact(self, contact):
+        cursor = self.connection.execute(INSERT_CONTACT, (
+            contact.name, ContactIndex.key(contact.name), contact.address, contact.phone, contact.email,
+            contact.birthday, birthday_key(contact.birthday)))
+        self.connection.executemany(INSERT_WORD, ((word, cursor.lastrowid) for word in ContactIndex.words(contact.name)))
+
+    def insert_contact(self, contact):
+        with self.connection:
+            self._insert_contact(contact)
+
+    def transaction(self):
+        # Під час масового імпорту пачки не фіксуються окремо - весь імпорт одна транзакція
+        return contextlib.nullcontext() if self.importing else self.connection
+
+    @contextlib.contextmanager
+    def bulk_import(self, rebuild_indexes=False):
+        # Імпорт цілком або нічого. З rebuild_indexes вторинні індекси контактів видаляються на час вставки
+        # і будуються наприкінці сортуванням, а не оновлюються для кожного рядка; DDL у SQLite теж
+        # транзакційний, тож після помилки індекси повертаються разом з відкатом
+        with self.connection:
+            self.connection.execute("BEGIN")
+            if rebuild_indexes:
+                for name in CONTACT_INDEXES:
+                    self.connection.execute(f"DROP INDEX IF EXISTS {name}")
+            self.importing = True
+            try:
+                yield
+            finally:
+                self.importing = False
+            if rebuild_indexes:
+                for statement in CONTACT_INDEXES.values():
+                    self.connection.execute(statement)
+
+    def insert_contacts(self, contacts):
+        # Уся пачка - два executemany в одній транзакції; ідентифікатори призначаються наперед,
+        # щоб слова імен можна було вставити без lastrowid для кожного рядка
+        with self.transaction():
+            first = self.connection.execute(NEXT_CONTACT_ID).fetchone()[0]
+            self.connection.executemany(INSERT_CONTACT_ROW, (
+                (contact_id, contact.name, ContactIndex.key(contact.name), contact.address, contact.phone,
+                 contact.email, contact.birthday, birthday_key(contact.birthday))
+                for contact_id, contact in enumerate(contacts, first)))
+            self.connection.executemany(INSERT_WORD, (
+                (word, contact_id) for contact_id, contact in enumerate(contacts, first)
+                for word in ContactIndex.words(contact.name)))
+
+    def contact_keys(self):
+        return {(name_key, (birthday or '').lower()) for name_key, birthday in self.connection.execute(CONTACT_KEYS)}
+
+    def contact_id(self, name, birthday):
+        row = self.connection.execute(FIND_CONTACT_ID, (ContactIndex.key(name), birthday)).fetchone()
+        return row[0] if row else None
+
+    def delete_contact(self, name, birthday):
+        contact_id = self.contact_id(name, birthday)
+        if contact_id is not None:
+            with self.connection:
+                self.connection.execute(DELETE_CONTACT, (contact_id,))
+
+    def update_contact(self, old_name, old_birthday, name, address, phone, email, birthday):
+        contact_id = self.contact_id(old_name, old_birthday)
+        if contact_id is None:
+            return
+        with self.connection:
+            self.connection.execute(UPDATE_CONTACT, (
+                name, ContactIndex.key(name), address, phone, email, birthday, birthday_key(birthday), contact_id))
+            self.connection.execute(DELETE_WORDS, (contact_id,))
+            self.connection.executemany(INSERT_WORD, ((word, contact_id) for word in ContactIndex.words(name)))
+
+    def find_contacts(self, name):
+        return [self.contact(row) for row in self.connection.execute(FIND_CONTACTS, (ContactIndex.key(name),))]
+
+    def search_contacts(self, query):
+        prefix = ContactIndex.key(query)
+        rows = self.connection.execute(SEARCH_CONTACTS, (prefix, prefix + chr(0x10FFFF)))
+        return [self.contact(row) for row in rows]
+
+    def birthdays_between(self, low, high):
+        return [self.contact(row) for row in self.connection.execute(BIRTHDAYS_BETWEEN, (low, high))]
+
+    def iter_contacts(self):
+        for row in self.connection.execute(ALL_CONTACTS):
+            yield self.contact(row)
+
+    def count_contacts(self):
+        return self.connection.execute(COUNT_CONTACTS).fetchone()[0]
+
+    def has_note(self, name):
+        return self.connection.execute(HAS_NOTE, (name,)).fetchone() is not None
+
+    def get_note(self, name):
+        row = self.connection.execute(GET_NOTE, (name,)).fetchone()
+        if row is None:
+            return None
+        note = self.note_factory(row[0], [tag for tag, in self.connection.execute(GET_NOTE_TAGS, (name,))])
+        return note
+
+    def put_note(self, name, text):
+        with self.connection:
+            self.connection.execute(DELETE_NOTE, (name,))
+            self.connection.execute(PUT_NOTE, (name, text))
+
+    def put_notes(self, rows):
+        with self.connection:
+            for name, text, tags in rows:
+                self.connection.execute(PUT_NOTE, (name, text))
+                self._add_tags(name, tags)
+
+    def set_note_text(self, name, text):
+        with self.connection:
+            self.connection.execute(SET_NOTE_TEXT, (text, name))
+
+    def delete_note(self, name):
+        with self.connection:
+            self.connection.execute(DELETE_NOTE, (name,))
+
+    def search_notes_text(self, query, limit):
+        expression = fts_query(query)
+        if not expression:
+            return []
+        rows = self.connection.execute(SEARCH_NOTES_TEXT, (expression, limit)).fetchall()
+        return [(name, self.get_note(name)) for name, in rows]
+
+    def _add_tags(self, name, tags):
+        position = self.connection.execute(NEXT_TAG_POSITION, (name,)).fetchone()[0]
+        rows = ((tag, name, position + i, tag, name) for i, tag in enumerate(dict.fromkeys(tags)))
+        self.connection.executemany(INSERT_TAG, rows)
+
+    def add_tags(self, name, tags):
+        with self.connection:
+            self._add_tags(name, tags)
+
+    def note_names(self):
+        return [name for name, in self.connection.execute(ALL_NOTE_NAMES)]
+
+    def count_notes(self):
+        return self.connection.execute(COUNT_NOTES).fetchone()[0]
+
+    def notes_with_tags(self, all_tags, any_tags, exclude, offset, limit):
+        condition, parameters = tag_filter(all_tags, any_tags, exclude)
+        query = f"SELECT notes.name FROM notes WHERE {condition} ORDER BY notes.text LIMIT ? OFFSET ?"
+        rows = self.connection.execute(query, (*parameters, -1 if limit is None else limit, offset)).fetchall()
+        return [self.get_note(name) for name, in rows]
+
+    def tag_facets(self, all_tags, any_tags, exclude):
+        condition, parameters = tag_filter(all_tags, any_tags, exclude)
+        query = ("SELECT tag, COUNT(DISTINCT note_name) FROM note_tags "
+                 f"WHERE note_name IN (SELECT notes.name FROM notes WHERE {condition}) GROUP BY tag ORDER BY 2 DESC, tag")
+        return self.connection.execute(query, parameters).fetchall()
+
+    def tags(self):
+        tags = {}
+        for tag, note_name in self.connection.execute(ALL_TAGS):
+            tags.setdefault(tag, []).append(note_name)
+        return tags
+
+    def replace_all(self, contacts, notes):
+        with self.connection:
+            for table in ('contact_words', 'contacts', 'note_tags', 'notes'):
+                self.connection.execute(f"DELETE FROM {table}")
+            for contact in contacts:
+                self._insert_contact(contact)
+            for name, note in notes.items():
+                self.connection.execute(PUT_NOTE, (name, note.text))
+                self._add_tags(name, note.tags)
+
+    def close(self):
+        self.connection.close()
+
+
+class ContactTable:
+    # Представлення таблиці контактів як послідовності для методів BotAssist
+    def __init__(self, store):
+        self.store = store
+
+    def __iter__(self):
+        return self.store.iter_contacts()
+
+    def __len__(self):
+        return self.store.count_contacts()
+
+
+class NoteTable:
+    # Представлення таблиці нотаток як словника назва -> Note
+    def __init__(self, store):
+        self.store = store
+
+    def __contains__(self, name):
+        return self.store.has_note(name)
+
+    def __getitem__(self, name):
+        note = self.store.get_note(name)
+        if note is None:
+            raise KeyError(name)
+        return note
+
+    def __iter__(self):
+        return iter(self.store.note_names())
+
+    def __len__(self):
+        return self.store.count_notes()
+
+    def items(self):
+        for name in self.store.note_names():
+            yield name, self.store.get_note(name)
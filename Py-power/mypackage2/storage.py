@@ -0,0 +1,231 @@
+import os
+import pickle
+import struct
+import threading
+import zlib
+from pathlib import Path
+
+from metrics import METRICS, timed
+from packed import PackedFile, is_packed, write_packed
+
+HEADER = struct.Struct('>II')
+
+
+@timed('storage.read_snapshot')
+def read_snapshot(path):
+    # Знімок у форматі packed лише відкривається через mmap, записи з нього декодує restore на вимогу;
+    # старі знімки у форматі pickle читаються повністю
+    try:
+        if is_packed(path):
+            packed = PackedFile(path)
+            return {'packed': packed, 'seq': packed.seq}
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+    except FileNotFoundError:
+        return None
+
+
+@timed('storage.write_snapshot')
+def write_snapshot(path, data):
+    # Спочатку тимчасовий файл, потім атомарна заміна, щоб збій не зіпсував знімок.
+    # Файл, відкритий через mmap попереднім завантаженням, після заміни лишається доступним
+    # (у Windows знімок не відображається, див. packed.MAP_FILES)
+    path = Path(path)
+    temp_path = path.with_name(path.name + '.tmp')
+    with open(temp_path, 'wb') as file:
+        write_packed(file, data.get('contacts', []), data.get('notes', {}), data.get('seq', 0))
+        file.flush()
+        os.fsync(file.fileno())
+        if METRICS.enabled:
+            METRICS.add('snapshot_bytes_written_total', file.tell())
+    os.replace(temp_path, path)
+    sync_directory(path.parent)
+
+
+def sync_directory(folder):
+    try:
+        descriptor = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
+
+
+def read_log(path):
+    # Повертає записи та довжину цілої частини журналу; обірваний хвіст відкидається
+    records = []
+    valid_size = 0
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+    except FileNotFoundError:
+        return records, valid_size
+    while valid_size + HEADER.size <= len(data):
+        length, checksum = HEADER.unpack_from(data, valid_size)
+        start = valid_size + HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            break
+        records.append(pickle.loads(payload))
+        valid_size = start + length
+    return records, valid_size
+
+
+class Journal:
+    def __init__(self, filename="save.pickle", batch_size=100, compact_after=10000):
+        self.snapshot_path = Path(filename)
+        self.log_path = Path(f"{filename}.log")
+        self.old_log_path = Path(f"{filename}.log.old")
+        self.batch_size = batch_size
+        self.compact_after = compact_after
+        self.factory = None
+        self.file = None
+        self.seq = 0
+        self.pending = 0
+        self.records = 0
+        self.lock = threading.Lock()
+        self.compactor = None
+        self.held = 0
+
+    @timed('journal.replay')
+    def open(self, assistant):
+        # Відновлення стану: знімок, потім журнали; записи, вже включені у знімок, пропускаються
+        self.factory = type(assistant)
+        loaded = False
+        data = read_snapshot(self.snapshot_path)
+        if data is not None:
+            assistant.restore(data)
+            self.seq = data.get('seq', 0)
+            loaded = True
+        for path in (self.old_log_path, self.log_path):
+            records, valid_size = read_log(path)
+            for seq, record in records:
+                if seq > self.seq:
+                    assistant.apply_record(record)
+                    self.seq = seq
+                    loaded = True
+            if path == self.log_path:
+                self.records = len(records)
+                if path.exists() and path.stat().st_size != valid_size:
+                    os.truncate(path, valid_size)
+        self.file = open(self.log_path, 'ab')
+        if self.old_log_path.exists():
+            self.compact()
+        return loaded
+
+    def _write(self, seq, record):
+        payload = pickle.dumps((seq, record), protocol=pickle.HIGHEST_PROTOCOL)
+        self.file.write(HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        if METRICS.enabled:
+            METRICS.add('journal_bytes_written_total', HEADER.size + len(payload))
+
+    def append(self, record):
+        with self.lock:
+            self.seq += 1
+            self._write(self.seq, record)
+            # Запис одразу передається ОС і переживе падіння процесу; пакетним лишається лише fsync,
+            # тож після збою живлення можуть загубитися щонайбільше batch_size останніх змін
+            self.file.flush()
+            self.pending += 1
+            self.records += 1
+            if self.pending >= self.batch_size:
+                self._sync()
+            need_compaction = self.records >= self.compact_after
+        if need_compaction:
+            self.compact()
+
+    @timed('journal.fsync')
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+
+    def flush(self):
+        with self.lock:
+            self._sync()
+
+    def compact(self):
+        # Поточний журнал відкладається і згортається у новий знімок у фоновому потоці
+        with self.lock:
+            if self.held or self.compactor is not None and self.compactor.is_alive():
+                return
+            if not self.old_log_path.exists():
+                self._sync()
+                self.file.close()
+                os.replace(self.log_path, self.old_log_path)
+                self.file = open(self.log_path, 'ab')
+                self.records = 0
+            self.compactor = threading.Thread(target=self._compact, daemon=True)
+            self.compactor.start()
+
+    @timed('journal.compact')
+    def _compact(self):
+        state = self.factory()
+        seq = 0
+        data = read_snapshot(self.snapshot_path)
+        if data is not None:
+            state.restore(data)
+            seq = data.get('seq', 0)
+        records, valid_size = read_log(self.old_log_path)
+        for record_seq, record in records:
+            if record_seq > seq:
+                state.apply_record(record)
+                seq = record_seq
+        data = state.snapshot()
+        data['seq'] = seq
+        write_snapshot(self.snapshot_path, data)
+        self.old_log_path.unlink()
+
+    def reserve(self):
+        # Номер останнього запису для копії стану, яку збережуть пізніше через checkpoint(data, seq);
+        # до того нове згортання не починається, інакше старіша копія затерла б новіший знімок
+        with self.lock:
+            self.held += 1
+            return self.seq
+
+    @timed('journal.checkpoint')
+    def checkpoint(self, data, seq=None):
+        # Повний знімок стану, після якого журнали вже не потрібні. Якщо data - копія, зроблена раніше
+        # (фонове збереження), seq - номер з reserve; пізніші записи залишаються в журналі
+        try:
+            self._checkpoint(data, seq)
+        finally:
+            if seq is not None:
+                with self.lock:
+                    self.held -= 1
+
+    def _checkpoint(self, data, seq):
+        while True:
+            self.wait()
+            with self.lock:
+                if self.compactor is not None and self.compactor.is_alive():
+                    continue
+                self._sync()
+                data['seq'] = self.seq if seq is None else seq
+                write_snapshot(self.snapshot_path, data)
+                later = [] if seq is None else [item for item in read_log(self.log_path)[0] if item[0] > seq]
+                self.file.truncate(0)
+                for record_seq, record in later:
+                    self._write(record_seq, record)
+                self._sync()
+                self.records = len(later)
+                if self.old_log_path.exists():
+                    self.old_log_path.unlink()
+                return
+
+    def wait(self):
+        compactor = self.compactor
+        if compactor is not None:
+            compactor.join()
+
+    def close(self):
+        self.wait()
+        with self.lock:
+            if self.file is not None:
+                self._sync()
+                self.file.close()
+                self.file = None
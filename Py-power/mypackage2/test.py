@@ -1,10 +1,380 @@
+import errno
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
 import shutil
 from pathlib import Path
 import re
 import sys
+import tarfile
+import threading
+import time
+import unicodedata
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
+
+from metrics import METRICS, timed
+from watch import watch_folder
+
+
+class ArchiveLimitError(Exception):
+    pass
+
+
+class ArchiveExtractor:
+    # Потокове розпакування zip/tar/gz по одному файлу з обмеженнями проти zip-бомб.
+    # Екземпляр містить лише числа, тому його метод extract можна передати в пул процесів
+    CHUNK_SIZE = 1 << 20
+    # Ступінь стиснення перевіряється лише після цього обсягу, щоб не відкидати дрібні архіви з текстом
+    RATIO_THRESHOLD = 1 << 20
+
+    def __init__(self, max_total_size=10 << 30, max_files=100000, max_ratio=200):
+        self.max_total_size = max_total_size
+        self.max_files = max_files
+        self.max_ratio = max_ratio
+
+    def extract(self, file_name, folder_for_file):
+        # Повертає (успіх, повідомлення, розпаковано байтів); вміст спершу потрапляє в папку .part і переноситься лише цілим
+        archive, folder = Path(file_name), Path(folder_for_file)
+        partial = folder.with_name(folder.name + '.part')
+        shutil.rmtree(partial, ignore_errors=True)
+        partial.mkdir(parents=True)
+        used = {'size': 0, 'files': 0, 'limit': max(archive.stat().st_size * self.max_ratio, self.RATIO_THRESHOLD)}
+        try:
+            if zipfile.is_zipfile(archive):
+                self.extract_zip(archive, partial, used)
+            elif tarfile.is_tarfile(archive):
+                self.extract_tar(archive, partial, used)
+            elif archive.suffix.lower() == '.gz':
+                self.extract_gzip(archive, partial, used)
+            else:
+                raise ArchiveLimitError('unknown archive format')
+        except (ArchiveLimitError, OSError, EOFError, RuntimeError, zlib.error,
+                zipfile.BadZipFile, tarfile.TarError) as error:
+            shutil.rmtree(partial, ignore_errors=True)
+            return False, f'{archive.name}: {error}', 0
+        merge_folder(partial, folder)
+        return True, None, used['size']
+
+    def member_path(self, folder, name):
+        # Кожна частина шляху нормалізується; абсолютні шляхи та ".." відкидаються, тож вийти за папку неможливо
+        parts = [FileSorter.normalize(part) for part in re.split(r'[\\/]+', name) if part not in ('', '.', '..')]
+        if not parts:
+            return None
+        return folder.joinpath(*parts)
+
+    def extract_zip(self, archive, folder, used):
+        with zipfile.ZipFile(archive) as zip_file:
+            for info in zip_file.infolist():
+                target = self.member_path(folder, info.filename)
+                if target is None:
+                    continue
+                if info.is_dir():
+                    target.mkdir(parents=True, exist_ok=True)
+                    continue
+                # Заявлені розміри перевіряються наперед, фактичні - під час запису
+                if info.file_size > max(info.compress_size * self.max_ratio, self.RATIO_THRESHOLD):
+                    raise ArchiveLimitError(f'{info.filename} exceeds compression ratio {self.max_ratio}')
+                with zip_file.open(info) as source:
+                    self.write_member(source, target, used)
+
+    def extract_tar(self, archive, folder, used):
+        # Режим "r|*" читає архів послідовно, без пошуку по файлу і без списку всіх членів у пам'яті
+        with tarfile.open(archive, 'r|*') as tar_file:
+            for member in tar_file:
+                target = self.member_path(folder, member.name)
+                if target is None:
+                    continue
+                if member.isdir():
+                    target.mkdir(parents=True, exist_ok=True)
+                elif member.isfile():
+                    # Посилання та пристрої не розпаковуються
+                    self.write_member(tar_file.extractfile(member), target, used)
+
+    def extract_gzip(self, archive, folder, used):
+        target = self.member_path(folder, archive.stem)
+        if target is None:
+            raise ArchiveLimitError('empty file name')
+        with gzip.open(archive) as source:
+            self.write_member(source, target, used)
+
+    def write_member(self, source, target, used):
+        used['files'] += 1
+        if used['files'] > self.max_files:
+            raise ArchiveLimitError(f'more than {self.max_files} files')
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with open(target, 'wb') as output:
+            while True:
+                chunk = source.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                used['size'] += len(chunk)
+                if used['size'] > self.max_total_size:
+                    raise ArchiveLimitError(f'more than {self.max_total_size} bytes unpacked')
+                if used['size'] > used['limit']:
+                    raise ArchiveLimitError(f'exceeds compression ratio {self.max_ratio}')
+                output.write(chunk)
+
+
+def merge_folder(source, target):
+    # Перенесення вмісту source у target; наявні файли з тією ж назвою замінюються
+    if not target.exists():
+        os.replace(source, target)
+        return
+    with os.scandir(source) as entries:
+        for entry in entries:
+            destination = target / entry.name
+            if entry.is_dir() and destination.is_dir():
+                merge_folder(Path(entry.path), destination)
+            else:
+                os.replace(entry.path, destination)
+    source.rmdir()
+
+
+def file_hash(path, limit=None, chunk_size=1 << 20):
+    # Потокове хешування шматками; limit - скільки байтів з початку файлу читати
+    digest = hashlib.blake2b()
+    remaining = limit
+    with open(path, 'rb') as file:
+        while remaining is None or remaining > 0:
+            chunk = file.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest.digest()
+
+
+class Deduplicator:
+    # Кандидати в дублікати відбираються за розміром, потім за хешем початку файлу,
+    # і лише після цього файли читаються повністю
+    PARTIAL_SIZE = 64 * 1024
+
+    def __init__(self, mode='skip'):
+        self.mode = mode
+        self.by_size = {}
+        self.partial_hashes = {}
+        self.full_hashes = {}
+        self.loaded_folders = set()
+        self.duplicates = []
+        self.collisions = []
+        self.saved_bytes = 0
+        self.lock = threading.Lock()
+
+    def load(self, folder):
+        # Файли, що вже лежать у цільовій папці, індексуються один раз
+        if folder in self.loaded_folders or not folder.is_dir():
+            return
+        self.loaded_folders.add(folder)
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    self.add(folder / entry.name, entry.stat().st_size)
+
+    def add(self, path, size):
+        self.by_size.setdefault(size, []).append(path)
+
+    def forget(self):
+        # Вміст цільових папок індексується заново; знайдені дублікати та збережений обсяг лишаються для звіту
+        self.by_size.clear()
+        self.partial_hashes.clear()
+        self.full_hashes.clear()
+        self.loaded_folders.clear()
+
+    def moved(self, source, target):
+        for hashes in (self.partial_hashes, self.full_hashes):
+            if source in hashes:
+                hashes[target] = hashes.pop(source)
+
+    def partial_hash(self, path):
+        if path not in self.partial_hashes:
+            self.partial_hashes[path] = file_hash(path, self.PARTIAL_SIZE)
+        return self.partial_hashes[path]
+
+    def full_hash(self, path):
+        if path not in self.full_hashes:
+            self.full_hashes[path] = file_hash(path)
+        return self.full_hashes[path]
+
+    def find(self, path, size):
+        candidates = self.by_size.get(size)
+        if not candidates:
+            return None
+        partial = self.partial_hash(path)
+        for candidate in candidates:
+            if self.partial_hash(candidate) != partial:
+                continue
+            if size <= self.PARTIAL_SIZE or self.full_hash(candidate) == self.full_hash(path):
+                return candidate
+        return None
+
+
+def transfer(source, target):
+    # Перейменування в межах файлової системи; між пристроями - копіювання у тимчасовий файл і атомарна заміна
+    try:
+        os.replace(source, target)
+    except OSError as error:
+        if error.errno != errno.EXDEV:
+            raise
+        partial = target.with_name(target.name + '.part')
+        shutil.copy2(source, partial)
+        os.replace(partial, target)
+        os.unlink(source)
+
+
+class SortJournal:
+    # Журнал запуску: план кожної пачки записується до її виконання, потім позначки про виконання.
+    # Після збою за ним можна відкотити вже виконані переміщення
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def exists(self):
+        return self.path.exists()
+
+    def write(self, record):
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, 'a', encoding='utf-8')
+            self.file.write(json.dumps(record) + '\n')
+
+    def plan(self, kind, source, target):
+        with self.lock:
+            job_id = self.next_id
+            self.next_id += 1
+        self.write(['plan', job_id, kind, source, target])
+        return job_id
+
+    def done(self, job_id, destination, kept):
+        # Позначка одразу передається ОС, а на диск потрапляє разом з планом наступної пачки:
+        # після падіння процесу відкат знає, куди насправді подівся файл
+        self.write(['done', job_id, destination, kept])
+        with self.lock:
+            self.file.flush()
+
+    def sync(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+
+    def read(self):
+        planned, done = {}, {}
+        with open(self.path, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if record[0] == 'plan':
+                    planned[record[1]] = record[2:]
+                else:
+                    done[record[1]] = record[2:]
+        return planned, done
+
+    def remove(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+        self.path.unlink(missing_ok=True)
+
+
+class NameNormalizer:
+    # Одна таблиця транслітерації для кирилиці, грецької та латиниці з діакритикою будується один раз;
+    # результати кешуються, бо однакові назви (папки в архівах, типові імена файлів) часто повторюються
+    PATTERN = re.compile(r'[^a-zA-Z.0-9_]')
+    SPECIAL = {
+        'ß': 'ss', 'æ': 'ae', 'ø': 'o', 'ł': 'l', 'đ': 'd', 'þ': 'th', 'ð': 'd', 'œ': 'oe', 'ı': 'i', 'ŋ': 'ng',
+        'ў': 'u', 'ђ': 'dj', 'ј': 'j', 'љ': 'lj', 'њ': 'nj', 'ћ': 'c', 'џ': 'dz', 'ѓ': 'gj', 'ќ': 'kj', 'ѕ': 'dz',
+        'ә': 'a', 'ғ': 'g', 'қ': 'q', 'ң': 'ng', 'ө': 'o', 'ұ': 'u', 'ү': 'u', 'һ': 'h',
+        'α': 'a', 'β': 'v', 'γ': 'g', 'δ': 'd', 'ε': 'e', 'ζ': 'z', 'η': 'i', 'θ': 'th', 'ι': 'i', 'κ': 'k',
+        'λ': 'l', 'μ': 'm', 'ν': 'n', 'ξ': 'x', 'ο': 'o', 'π': 'p', 'ρ': 'r', 'σ': 's', 'ς': 's', 'τ': 't',
+        'υ': 'y', 'φ': 'f', 'χ': 'ch', 'ψ': 'ps', 'ω': 'o',
+    }
+    # Латиниця з діакритикою, грецька, кирилиця з доповненнями, розширені латиниця й грецька
+    RANGES = ((0x00C0, 0x0250), (0x0370, 0x0400), (0x0400, 0x0530), (0x1E00, 0x2000))
+
+    def __init__(self, base, cache_size=65536):
+        self.table = self.build_table(base)
+        self.normalize = lru_cache(maxsize=cache_size)(self._normalize)
+
+    @classmethod
+    def build_table(cls, base):
+        letters = dict(base)
+        for char, latin in cls.SPECIAL.items():
+            letters.setdefault(ord(char), latin)
+            if len(char.upper()) == 1 and not char.upper().isascii():
+                letters.setdefault(ord(char.upper()), latin.upper())
+        table = dict(letters)
+        # Літери з наголосами та діакритикою розкладаються на основу і знаки, основа транслітерується
+        for low, high in cls.RANGES:
+            for code in range(low, high):
+                if code in table:
+                    continue
+                decomposed = unicodedata.normalize('NFKD', chr(code)).translate(letters)
+                latin = ''.join(char for char in decomposed if char.isascii())
+                if latin:
+                    table[code] = latin
+        return table
+
+    def _normalize(self, name):
+        if not name.isascii():
+            name = name.translate(self.table)
+        return self.PATTERN.sub('_', name)
+
+
+class UniqueNames:
+    # Зайняті назви кожної цільової папки читаються один раз, далі вільна назва шукається в пам'яті;
+    # для кожної назви запам'ятовується наступний номер, тож серія однакових назв не перебирається спочатку
+    def __init__(self):
+        self.taken = {}
+        self.numbers = {}
+        self.lock = threading.Lock()
+
+    def reserve(self, target):
+        folder = target.parent
+        with self.lock:
+            taken = self.taken.get(folder)
+            if taken is None:
+                try:
+                    taken = self.taken[folder] = set(os.listdir(folder))
+                except FileNotFoundError:
+                    taken = self.taken[folder] = set()
+            name = target.name
+            if name in taken:
+                number = self.numbers.get((folder, name), 1)
+                while f'{target.stem}_{number}{target.suffix}' in taken:
+                    number += 1
+                self.numbers[(folder, name)] = number + 1
+                name = f'{target.stem}_{number}{target.suffix}'
+            taken.add(name)
+            return folder / name
 
 
 class FileSorter:
+    # Категорія -> розширення; категорія "archives" розпаковується, решта переміщуються у папку категорії
+    CATEGORIES = {
+        'images': ('JPEG', 'JPG', 'PNG', 'SVG', 'HEIC', 'WEBP'),
+        'audio': ('MP3', 'OGG', 'WAV', 'AMR'),
+        'video': ('AVI', 'MP4', 'MOV', 'MKV'),
+        'documents': ('DOC', 'DOCX', 'TXT', 'PDF', 'XLSX', 'PPTX'),
+        'archives': ('ZIP', 'GZ', 'TAR'),
+    }
+    ARCHIVES = 'archives'
+    OTHERS = 'others'
+    MANIFEST_NAME = '.sorter_manifest.json'
+    JOURNAL_NAME = '.sorter_journal.jsonl'
+    BATCH_SIZE = 256
+    MAX_NESTING = 3
     CYRILLIC_SYMBOLS = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюяєіїґ'
     TRANSLATION = ("a", "b", "v", "g", "d", "e", "e", "j", "z", "i", "j", "k", "l", "m", "n", "o", "p", "r", "s", "t", "u",
                "f", "h", "ts", "ch", "sh", "sch", "", "y", "", "e", "yu", "u", "ja", "je", "ji", "g")
@@ -14,168 +384,513 @@ class FileSorter:
     for cirilic, latin in zip(CYRILLIC_SYMBOLS, TRANSLATION):
         MAP[ord(cirilic)] = latin
         MAP[ord(cirilic.upper())] = latin.upper()
+
+    NORMALIZER = NameNormalizer(MAP)
+    normalize = staticmethod(NORMALIZER.normalize)
         
-    def __init__(self, source_folder):
+    def __init__(self, source_folder, workers=None, incremental=False, dedup=None, config=None,
+                 sort_archives=False, extractor=None):
         self.source_folder = source_folder
+        self.workers = workers
+        self.incremental = incremental
+        self.dedup = Deduplicator(dedup) if dedup else None
+        self.sort_archives = sort_archives
+        self.extractor = extractor or ArchiveExtractor()
+        self.journal = SortJournal(source_folder / self.JOURNAL_NAME)
+        self.unpacked_archives = []
+        self.extracted_folders = []
+        self.failed_archives = []
+        self.manifest = {'folders': {}, 'files': {}}
+        self.visited_folders = {}
+        self.skipped_folders = {}
+        self.processed = {}
+        self.created_folders = set()
+        self.names = UniqueNames()
+        self.lock = threading.Lock()
+        self.stats = {}
 
-        self.JPEG_IMAGES = []
-        self.JPG_IMAGES = []
-        self.PNG_IMAGES = []
-        self.SVG_IMAGES = []
-        self.MP3_AUDIO = []
-        self.OGG_AUDIO = []
-        self.WAV_AUDIO = []
-        self.AMR_AUDIO = []
-        self.AVI_VIDEO = []
-        self.MP4_VIDEO = []
-        self.MOV_VIDEO = []
-        self.MKV_VIDEO = []
-        self.DOC_DOCUMENTS = []
-        self.DOCX_DOCUMENTS = []
-        self.TXT_DOCUMENTS = []
-        self.PDF_DOCUMENTS = []
-        self.XLSX_DOCUMENTS = []
-        self.PPTX_DOCUMENTS = []
-        self.OTHERS = []
-        self.ZIP_ARCHIVES = []
-        self.GZ_ARCHIVES = []
-        self.TAR_ARCHIVES = []
+        self.files = {}
         self.FOLDERS = []
         self.EXTENSIONS = set()
         self.UNKNOWN = set()
 
-        self.REGISTER_EXTENSION = {
-            'JPEG': self.JPEG_IMAGES,
-            'JPG': self.JPG_IMAGES,
-            'PNG': self.PNG_IMAGES,
-            'SVG': self.SVG_IMAGES,
-            'MP3': self.MP3_AUDIO,
-            'OGG': self.OGG_AUDIO,
-            'WAV': self.WAV_AUDIO,
-            'AMR': self.AMR_AUDIO,
-            'AVI': self.AVI_VIDEO,
-            'MP4': self.MP4_VIDEO,
-            'MOV': self.MOV_VIDEO,
-            'MKV': self.MKV_VIDEO,
-            'DOC': self.DOC_DOCUMENTS,
-            'DOCX': self.DOCX_DOCUMENTS,
-            'TXT': self.TXT_DOCUMENTS,
-            'PDF': self.PDF_DOCUMENTS,
-            'XLSX': self.XLSX_DOCUMENTS,
-            'PPTX': self.PPTX_DOCUMENTS,
-            'ZIP': self.ZIP_ARCHIVES,
-            'GZ': self.GZ_ARCHIVES,
-            'TAR': self.TAR_ARCHIVES
-        }
+        categories = {category: list(extensions) for category, extensions in self.CATEGORIES.items()}
+        if config is not None:
+            for category, extensions in self.load_config(config).items():
+                categories.setdefault(category, []).extend(extensions)
+        # Один словник розширення -> категорія і готові шляхи та обробники для кожної категорії
+        self.registry = {}
+        for category, extensions in categories.items():
+            for ext in extensions:
+                self.registry[ext.upper().lstrip('.')] = category
+        self.targets = {category: source_folder / category for category in [*categories, self.OTHERS]}
+        self.handlers = {category: self.move_file for category in self.targets}
+        self.handlers[self.ARCHIVES] = self.handle_archive
+        self.category_folders = {*self.targets, 'OTHERS'}
+
+    @staticmethod
+    def load_config(path):
+        # JSON виду {"images": ["HEIC", "WEBP"], "books": ["EPUB"]}: розширення додаються до категорій.
+        # Помилка в конфігурації повідомляється одразу і з назвою ключа, а не під час сортування
+        try:
+            with open(path, encoding='utf-8') as file:
+                config = json.load(file)
+        except ValueError as error:
+            raise ValueError(f"{path}: invalid JSON: {error}") from error
+        if not isinstance(config, dict):
+            raise ValueError(f"{path}: expected an object of category -> list of extensions")
+        owners = {}
+        for category, extensions in config.items():
+            if not category or category.startswith('.') or re.search(r'[\\/<>:"|?*\x00-\x1f]', category):
+                raise ValueError(f"{path}: '{category}' is not a valid category folder name")
+            if not isinstance(extensions, list):
+                raise ValueError(f"{path}: '{category}' must be a list of extensions, not {type(extensions).__name__}")
+            for ext in extensions:
+                if not isinstance(ext, str) or not re.fullmatch(r'\.?[A-Za-z0-9_+-]+', ext):
+                    raise ValueError(f"{path}: '{category}' has an invalid extension {ext!r}")
+                owner = owners.setdefault(ext.upper().lstrip('.'), category)
+                if owner != category:
+                    raise ValueError(f"{path}: extension {ext!r} is listed in both '{owner}' and '{category}'")
+        return config
 
     def get_extension(self, name):
-        return Path(name).suffix[1:].upper()
+        return os.path.splitext(name)[1][1:].upper()
 
-    def scan(self, folder):
-        for item in folder.iterdir():
-            if item.is_dir():
-                if item.name not in ('archives', 'video', 'audio', 'documents', 'images', 'OTHERS'):
-                    self.FOLDERS.append(item)
-                    self.scan(item)
+    def relative(self, path):
+        return path.relative_to(self.source_folder).as_posix()
+
+    def walk(self, folder):
+        # Ітеративний обхід без рекурсії; тип запису береться з DirEntry без додаткового stat
+        stack = [folder]
+        while stack:
+            current = stack.pop()
+            if self.incremental and self.unchanged_folder(current, stack):
+                continue
+            subfolders = []
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        if entry.name not in self.category_folders:
+                            subfolders.append(entry.name)
+                            self.FOLDERS.append(current / entry.name)
+                            stack.append(current / entry.name)
+                        continue
+                    if entry.name in (self.MANIFEST_NAME, self.JOURNAL_NAME):
+                        continue
+                    if self.incremental and self.unchanged_file(current / entry.name, entry):
+                        continue
+                    yield current / entry.name, self.get_extension(entry.name)
+            if self.incremental:
+                self.visited_folders[self.relative(current)] = subfolders
+
+    def unchanged_folder(self, folder, stack):
+        # Папка не змінювалась з минулого запуску: її файли не читаються, але підпапки обходяться
+        relative = self.relative(folder)
+        known = self.manifest['folders'].get(relative)
+        if known is None or known['mtime'] != os.stat(folder).st_mtime_ns:
+            return False
+        self.skipped_folders[relative] = known
+        stack.extend(folder / name for name in known['subfolders'])
+        return True
+
+    def unchanged_file(self, path, entry):
+        # Файл, залишений на місці минулого разу (наприклад, пошкоджений архів), з тим самим розміром і часом зміни
+        relative = self.relative(path)
+        known = self.manifest['files'].get(relative)
+        if known is None or known[2] is not None:
+            return False
+        info = entry.stat()
+        if [info.st_size, info.st_mtime_ns] != known[:2]:
+            return False
+        self.processed[relative] = known
+        return True
+
+    def remember(self, path, info, destination):
+        if self.incremental:
+            with self.lock:
+                self.processed[self.relative(path)] = [info.st_size, info.st_mtime_ns, destination]
+
+    def load_manifest(self):
+        try:
+            with open(self.source_folder / self.MANIFEST_NAME, encoding='utf-8') as file:
+                self.manifest = json.load(file)
+        except (FileNotFoundError, ValueError):
+            self.manifest = {'folders': {}, 'files': {}}
+
+    def save_manifest(self):
+        # Час зміни записується лише для папок, у яких не залишилось необроблених файлів,
+        # інакше файл, що з'явився під час запуску, був би пропущений наступного разу
+        folders = dict(self.skipped_folders)
+        left = {relative for relative, known in self.processed.items() if known[2] is None}
+        for relative in self.visited_folders:
+            folder = self.source_folder / relative
+            try:
+                mtime = os.stat(folder).st_mtime_ns
+                entries = list(os.scandir(folder))
+            except FileNotFoundError:
                 continue
+            subfolders = [entry.name for entry in entries if entry.is_dir() and entry.name not in self.category_folders]
+            files = [entry.name for entry in entries
+                     if not entry.is_dir() and entry.name not in (self.MANIFEST_NAME, self.JOURNAL_NAME)]
+            if all(self.relative(folder / name) in left for name in files):
+                folders[relative] = {'mtime': mtime, 'subfolders': subfolders}
+        # Записи про файли, залишені в пропущених цього разу папках, переносяться з минулого маніфесту
+        files = dict(self.processed)
+        for relative, known in self.manifest['files'].items():
+            if known[2] is None and (relative.rpartition('/')[0] or '.') in self.skipped_folders:
+                files.setdefault(relative, known)
+        manifest = {'folders': folders, 'files': files}
+        path = self.source_folder / self.MANIFEST_NAME
+        temp_path = path.with_name(path.name + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file)
+        os.replace(temp_path, path)
+
+    def category(self, ext):
+        category = self.registry.get(ext)
+        if category is not None:
+            self.EXTENSIONS.add(ext)
+            return category
+        if ext:
+            self.UNKNOWN.add(ext)
+        return self.OTHERS
+
+    def scan(self, folder):
+        for full_name, ext in self.walk(folder):
+            self.files.setdefault(self.category(ext), []).append(full_name)
+
+    def stream_jobs(self, folder):
+        # Завдання видаються одразу під час обходу, без накопичення всіх шляхів у списках
+        for full_name, ext in self.walk(folder):
+            category = self.category(ext)
+            yield self.handlers[category], full_name, self.targets[category]
 
-            ext = self.get_extension(item.name)  
-            full_name = folder / item.name 
-            if not ext:
-                self.OTHERS.append(full_name)
+    def make_folder(self, folder):
+        # Кожна цільова папка створюється один раз; перевірка під блокуванням для паралельного режиму
+        if folder in self.created_folders:
+            return
+        with self.lock:
+            if folder not in self.created_folders:
+                folder.mkdir(exist_ok=True, parents=True)
+                self.created_folders.add(folder)
+
+    def record(self, category, size, started):
+        finished = time.perf_counter()
+        with self.lock:
+            files, total_size, first, last = self.stats.get(category, (0, 0, started, finished))
+            self.stats[category] = (files + 1, total_size + size, min(first, started), max(last, finished))
+        if METRICS.enabled:
+            METRICS.observe('filesorter_file_seconds', finished - started, category=category)
+
+    def move_file(self, file_name, target):
+        # target - вже зарезервована вільна назва (reserve_target)
+        started = time.perf_counter()
+        info = file_name.stat()
+        category = target.parent.name
+        self.make_folder(target.parent)
+        kept = False
+        if self.dedup is None:
+            transfer(file_name, target)
+        else:
+            with self.dedup.lock:
+                target, kept = self.place_unique(file_name, info.st_size, target)
+        self.remember(file_name, info, self.relative(target))
+        self.record(category, info.st_size, started)
+        if METRICS.enabled:
+            METRICS.add('filesorter_bytes_moved_total', info.st_size, category=category)
+        return target, kept
+
+    def place_unique(self, file_name, size, target):
+        # Однакові файли не зберігаються двічі, а файли з однаковою назвою не перезаписують один одного
+        dedup = self.dedup
+        dedup.load(target.parent)
+        existing = dedup.find(file_name, size)
+        if existing is not None:
+            dedup.duplicates.append((file_name, existing))
+            dedup.saved_bytes += size
+            if dedup.mode == 'hardlink':
+                os.link(existing, target)
+                kept = False
             else:
+                target = existing
+                kept = True
+            file_name.unlink()
+            return target, kept
+        requested = target.with_name(self.normalize(file_name.name))
+        if requested != target:
+            dedup.collisions.append((file_name, requested, target))
+        transfer(file_name, target)
+        dedup.moved(file_name, target)
+        dedup.add(target, size)
+        return target, False
+
+    def target_for(self, handler, file_name, target_folder):
+        # Бажаний шлях призначення, ще без перевірки на збіг з уже наявними назвами
+        if handler == self.handle_archive:
+            return target_folder / self.normalize(file_name.name.replace(file_name.suffix, ''))
+        return target_folder / self.normalize(file_name.name)
+
+    def reserve_target(self, handler, file_name, target_folder, names=None):
+        # Остаточний шлях: зайнята назва отримує номер ще до запису в журнал, тож план і відкат знають справжнє
+        # призначення, а архів завжди розпаковується в нову папку і не змішується з вмістом минулих запусків
+        return (names or self.names).reserve(self.target_for(handler, file_name, target_folder))
+
+    def finish_archive(self, file_name, folder_for_file, result, info, started):
+        unpacked, message, size = result
+        if not unpacked:
+            # Пошкоджений або завеликий архів залишається на місці
+            with self.lock:
+                self.failed_archives.append(message)
+            if METRICS.enabled:
+                METRICS.add('filesorter_archives_failed_total')
+            self.remember(file_name, info, None)
+            return None, False
+        # Архів видаляється лише після завершення запуску, щоб розпакування можна було відкотити
+        with self.lock:
+            self.unpacked_archives.append(file_name)
+        self.remember(file_name, info, self.relative(folder_for_file))
+        self.record(self.ARCHIVES, info.st_size, started)
+        if METRICS.enabled:
+            # Розпакування могло йти в іншому процесі, тому обсяг повертає сам extract
+            METRICS.add('filesorter_bytes_extracted_total', size)
+        return folder_for_file, False
+
+    def handle_archive(self, file_name, folder_for_file):
+        started = time.perf_counter()
+        info = file_name.stat()
+        self.make_folder(folder_for_file.parent)
+        result = self.extractor.extract(str(file_name.absolute()), str(folder_for_file.absolute()))
+        return self.finish_archive(file_name, folder_for_file, result, info, started)
+
+    def extracted(self, result, depth=0):
+        folder, kept = result
+        if self.sort_archives and folder is not None:
+            # Позначка про розпакування має бути на диску раніше, ніж вміст почне переміщуватись
+            self.journal.sync()
+            self.sort_extracted(folder, depth)
+
+    def sort_extracted(self, folder, depth):
+        # Розпакований вміст розкладається по папках категорій, вкладені архіви - до глибини MAX_NESTING.
+        # Кожна дія потрапляє в журнал, тому відкат повертає файли в розпаковану папку
+        self.extracted_folders.append(folder)
+        for root, folders, files in os.walk(folder):
+            for name in files:
+                file = Path(root) / name
+                category = self.category(self.get_extension(name))
+                handler, target_folder = self.handlers[category], self.targets[category]
+                if handler == self.handle_archive and depth >= self.MAX_NESTING:
+                    continue
+                kind = 'extract' if handler == self.handle_archive else 'move'
+                target = self.reserve_target(handler, file, target_folder)
+                job_id = self.journal.plan(kind, self.relative(file), self.relative(target))
+                self.journal.sync()
+                result = handler(file, target)
+                self.finished(job_id, result)
+                if handler == self.handle_archive:
+                    self.extracted(result, depth + 1)
+
+    def remove_empty(self, folder):
+        for root, folders, files in os.walk(folder, topdown=False):
+            try:
+                os.rmdir(root)
+            except OSError:
+                pass
+
+    def jobs(self):
+        # Завдання для шляхів, уже зібраних методом scan
+        for category, files in self.files.items():
+            for file in files:
+                yield self.handlers[category], file, self.targets[category]
+
+    def plan(self):
+        # Повний план запуску: (дія, файл, шлях призначення). Назви резервуються в окремому UniqueNames,
+        # тож план показує ті самі номери, що й справжній запуск, і не займає назви для нього
+        names = UniqueNames()
+        for handler, file, target_folder in self.stream_jobs(self.source_folder):
+            kind = 'extract' if handler == self.handle_archive else 'move'
+            yield kind, file, self.reserve_target(handler, file, target_folder, names)
+
+    def print_plan(self):
+        count = 0
+        for kind, file, target in self.plan():
+            print(f'{kind}: {self.relative(file)} -> {self.relative(target)}')
+            count += 1
+        print(f'{count} operations planned, nothing changed (dry run).')
+
+    def batches(self, jobs):
+        # Пачки завдань, згруповані за цільовою папкою; план пачки потрапляє в журнал до її виконання
+        jobs = iter(jobs)
+        while True:
+            batch = list(islice(jobs, self.BATCH_SIZE))
+            if not batch:
+                return
+            batch.sort(key=lambda job: str(job[2]))
+            planned = []
+            for handler, file, target_folder in batch:
+                kind = 'extract' if handler == self.handle_archive else 'move'
+                target = self.reserve_target(handler, file, target_folder)
+                job_id = self.journal.plan(kind, self.relative(file), self.relative(target))
+                planned.append((job_id, handler, file, target))
+            self.journal.sync()
+            yield planned
+
+    def finished(self, job_id, result):
+        destination, kept = result
+        if destination is not None:
+            self.journal.done(job_id, self.relative(destination), kept)
+
+    def run_job(self, job_id, handler, file, target):
+        result = handler(file, target)
+        self.finished(job_id, result)
+        if handler == self.handle_archive:
+            self.extracted(result)
+
+    def run_sequential(self, jobs):
+        for batch in self.batches(jobs):
+            for job_id, handler, file, target in batch:
+                self.run_job(job_id, handler, file, target)
+
+    @staticmethod
+    def process_context():
+        # fork з фонового потоку (спостереження за папкою, фонове сортування) копіює замки, захоплені
+        # іншими потоками, і дочірній процес може зависнути; поза головним потоком процеси запускаються з нуля
+        if threading.current_thread() is threading.main_thread():
+            return None
+        return multiprocessing.get_context('spawn')
+
+    def run_parallel(self, jobs):
+        # Переміщення - у пулі потоків, розпакування архівів - у пулі процесів;
+        # кількість незавершених переміщень обмежена, щоб обхід не випереджав пул
+        pending = threading.BoundedSemaphore(self.workers * 4)
+        errors = []
+
+        def moved(future):
+            pending.release()
+            if future.exception() is not None:
+                errors.append(future.exception())
+
+        context = self.process_context()
+        with ThreadPoolExecutor(self.workers) as threads, ProcessPoolExecutor(self.workers, mp_context=context) as processes:
+            archives = []
+            for batch in self.batches(jobs):
+                for job_id, handler, file, target in batch:
+                    if handler == self.handle_archive:
+                        started = time.perf_counter()
+                        info = file.stat()
+                        self.make_folder(target.parent)
+                        future = processes.submit(self.extractor.extract, str(file.absolute()), str(target.absolute()))
+                        archives.append((job_id, future, file, target, info, started))
+                    else:
+                        pending.acquire()
+                        threads.submit(self.run_job, job_id, handler, file, target).add_done_callback(moved)
+            for job_id, future, file, folder_for_file, info, started in archives:
+                result = self.finish_archive(file, folder_for_file, future.result(), info, started)
+                self.finished(job_id, result)
+                self.extracted(result)
+        if errors:
+            raise errors[0]
+
+    def rollback(self):
+        # Повернення виконаних дій з журналу перерваного запуску у зворотному порядку: спершу дії без позначки
+        # про виконання, потім решта у зворотному порядку завершення (вміст архівів планується посеред пачки)
+        planned, done = self.journal.read()
+        unfinished = [job_id for job_id in sorted(planned, reverse=True) if job_id not in done]
+        for job_id in unfinished + list(reversed(done)):
+            kind, source, target = planned[job_id]
+            destination, kept = done.get(job_id, (target, False))
+            source, destination = self.source_folder / source, self.source_folder / destination
+            if kind == 'extract':
+                # Папка розпакування щоразу нова (reserve_target), тож видаляється лише вміст цього запуску
+                self.remove_partial(target)
+                if source.exists() and destination.is_dir() and not destination.is_symlink():
+                    shutil.rmtree(destination)
+                continue
+            if source.exists() or not destination.exists():
+                continue
+            source.parent.mkdir(parents=True, exist_ok=True)
+            if kept:
+                shutil.copy2(destination, source)
+            else:
+                transfer(destination, source)
+        self.journal.remove()
+
+    def recover(self):
+        # Залишки перерваного копіювання між пристроями (файл .part) і розпакування архіву (папка .part)
+        # видаляються; незавершені дії виконає новий запуск
+        planned, done = self.journal.read()
+        for kind, source, target in planned.values():
+            self.remove_partial(target)
+        self.journal.remove()
+
+    def remove_partial(self, target):
+        partial = self.source_folder / (target + '.part')
+        if partial.is_dir() and not partial.is_symlink():
+            shutil.rmtree(partial)
+        else:
+            partial.unlink(missing_ok=True)
+
+    def run(self, jobs):
+        if self.workers and self.workers > 1:
+            self.run_parallel(jobs)
+        else:
+            self.run_sequential(jobs)
+        for file_name in self.unpacked_archives:
+            file_name.unlink(missing_ok=True)
+        for folder in self.extracted_folders:
+            self.remove_empty(folder)
+        self.unpacked_archives.clear()
+        self.extracted_folders.clear()
+        self.journal.remove()
+
+    @timed('filesorter.sort_paths')
+    def sort_paths(self, paths):
+        # Сортування лише вказаних файлів (режим спостереження) без обходу всього дерева;
+        # папки, що після цього стали порожніми, видаляються аж до кореневої
+        if self.journal.exists():
+            self.recover()
+        # Між пачками користувач міг додати файли в цільові папки або видалити їх, тому зайняті назви,
+        # створені папки та індекс дублікатів читаються заново
+        self.names = UniqueNames()
+        self.created_folders.clear()
+        if self.dedup is not None:
+            self.dedup.forget()
+        jobs = []
+        for path in paths:
+            if path.is_file():
+                category = self.category(self.get_extension(path.name))
+                jobs.append((self.handlers[category], path, self.targets[category]))
+        self.run(jobs)
+        for folder in sorted({path.parent for path in paths}, key=lambda folder: len(folder.parts), reverse=True):
+            while folder != self.source_folder and self.source_folder in folder.parents:
                 try:
-                    ext_register = self.REGISTER_EXTENSION[ext]
-                    ext_register.append(full_name)
-                    self.EXTENSIONS.add(ext)
-                except KeyError:
-                    self.UNKNOWN.add(ext) 
-                    self.OTHERS.append(full_name)
-
-    def normalize(self, name):
-        string = name.translate(self.MAP)
-        translated_name = re.sub(r'[^a-zA-Z.0-9_]', '_', string)
-        return translated_name
-
-    def handle_image(self, file_name, target_folder):
-        target_folder.mkdir(exist_ok=True, parents=True)
-        file_name.replace(target_folder / self.normalize(file_name.name))
-
-    def handle_audio(self, file_name, target_folder):
-        target_folder.mkdir(exist_ok=True, parents=True)
-        file_name.replace(target_folder / self.normalize(file_name.name))
-
-    def handle_video(self, file_name, target_folder):
-        target_folder.mkdir(exist_ok=True, parents=True)
-        file_name.replace(target_folder / self.normalize(file_name.name))
-
-    def handle_documents(self, file_name, target_folder):
-        target_folder.mkdir(exist_ok=True, parents=True)
-        file_name.replace(target_folder / self.normalize(file_name.name))
-
-    def handle_archive(self, file_name, target_folder):
-        target_folder.mkdir(exist_ok=True, parents=True)
-        folder_for_file = target_folder / self.normalize(file_name.name.replace(file_name.suffix, ''))
-        folder_for_file.mkdir(exist_ok=True, parents=True)
-        try:
-            shutil.unpack_archive(str(file_name.absolute()), str(folder_for_file.absolute()))
-        except shutil.ReadError:
-            folder_for_file.rmdir()
+                    folder.rmdir()
+                except OSError:
+                    break
+                folder = folder.parent
+
+    @timed('filesorter.core')
+    def core(self, dry_run=False, rollback=False):
+        started = time.perf_counter()
+        if self.journal.exists():
+            if dry_run:
+                # Сухий запуск нічого не змінює, тому журнал перерваного запуску лише згадується
+                print(f'An interrupted run left {self.JOURNAL_NAME}: run without --dry-run to finish it '
+                      f'or with --rollback to undo it.')
+            elif rollback:
+                self.rollback()
+                return
+            else:
+                self.recover()
+        if self.incremental:
+            self.load_manifest()
+        if dry_run:
+            self.print_plan()
             return
-        file_name.unlink()
-
-    def core(self):
-        self.scan(self.source_folder)
-
-        for file in self.JPEG_IMAGES:
-            self.handle_image(file, self.source_folder / 'images')
-        for file in self.JPG_IMAGES:
-            self.handle_image(file, self.source_folder / 'images')
-        for file in self.PNG_IMAGES:
-            self.handle_image(file, self.source_folder / 'images')
-        for file in self.SVG_IMAGES:
-            self.handle_image(file, self.source_folder / 'images')
-
-        for file in self.MP3_AUDIO:
-            self.handle_audio(file, self.source_folder / 'audio')
-        for file in self.OGG_AUDIO:
-            self.handle_audio(file, self.source_folder / 'audio')
-        for file in self.WAV_AUDIO:
-            self.handle_audio(file, self.source_folder / 'audio')
-        for file in self.AMR_AUDIO:
-            self.handle_audio(file, self.source_folder / 'audio')
-
-        for file in self.AVI_VIDEO:
-            self.handle_video(file, self.source_folder / 'video')
-        for file in self.MP4_VIDEO:
-            self.handle_video(file, self.source_folder / 'video')
-        for file in self.MOV_VIDEO:
-            self.handle_video(file, self.source_folder / 'video')
-        for file in self.MKV_VIDEO:
-            self.handle_video(file, self.source_folder / 'video')
-
-        for file in self.DOC_DOCUMENTS:
-            self.handle_documents(file, self.source_folder / 'documents')
-        for file in self.DOCX_DOCUMENTS:
-            self.handle_documents(file, self.source_folder / 'documents')
-        for file in self.TXT_DOCUMENTS:
-            self.handle_documents(file, self.source_folder / 'documents')
-        for file in self.PDF_DOCUMENTS:
-            self.handle_documents(file, self.source_folder / 'documents')
-        for file in self.XLSX_DOCUMENTS:
-            self.handle_documents(file, self.source_folder / 'documents')
-        for file in self.PPTX_DOCUMENTS:
-            self.handle_documents(file, self.source_folder / 'documents')
-
-        for file in self.OTHERS:
-            self.handle_image(file, self.source_folder / 'others')
-
-        for file in self.ZIP_ARCHIVES:
-            self.handle_archive(file, self.source_folder / 'archives')
-        for file in self.GZ_ARCHIVES:
-            self.handle_archive(file, self.source_folder / 'archives')
-        for file in self.TAR_ARCHIVES:
-            self.handle_archive(file, self.source_folder / 'archives')
+        jobs = self.stream_jobs(self.source_folder)
+
+        self.run(jobs)
+        if METRICS.enabled:
+            self.record_rates(time.perf_counter() - started)
 
         for folder in self.FOLDERS[::-1]:
             try:
@@ -183,11 +898,65 @@ class FileSorter:
             except OSError:
                 print(f'Error during remove folder {folder}')
 
-def start():
+        if self.incremental:
+            self.save_manifest()
+
+    def record_rates(self, seconds):
+        # Швидкість обходу і сортування останнього запуску та кількість переглянутих папок
+        files, size = self.progress()
+        seconds = max(seconds, 1e-9)
+        METRICS.add('filesorter_folders_scanned_total', len(self.FOLDERS) + 1)
+        METRICS.set('filesorter_scan_files_per_second', files / seconds)
+        METRICS.set('filesorter_scan_bytes_per_second', size / seconds)
+
+    def progress(self):
+        # Кількість і розмір уже оброблених файлів; безпечно викликати з іншого потоку під час сортування
+        with self.lock:
+            stats = list(self.stats.values())
+        return sum(item[0] for item in stats), sum(item[1] for item in stats)
+
+    def report(self):
+        lines = []
+        for category, (files, size, first, last) in sorted(self.stats.items()):
+            seconds = max(last - first, 1e-9)
+            lines.append(f'{category}: {files} files, {size / 1048576:.1f} MB, '
+                         f'{files / seconds:.1f} files/s, {size / 1048576 / seconds:.1f} MB/s')
+        if self.dedup is not None:
+            lines.append(f'duplicates: {len(self.dedup.duplicates)} files, {self.dedup.saved_bytes / 1048576:.1f} MB saved')
+            for source, target, renamed in self.dedup.collisions:
+                lines.append(f'name collision: {source} -> {renamed.name} ({target.name} already exists)')
+        for message in self.failed_archives:
+            lines.append(f'archive left unpacked: {message}')
+        return "\n".join(lines)
+
+def start(workers=None):
+    # python test.py <folder> [--workers N] [--incremental] [--dedup skip|hardlink] [--config categories.json]
+    #                         [--dry-run] [--rollback] [--sort-archives]
+    #                         [--max-archive-size MB] [--max-archive-files N] [--max-ratio N]
+    #                         [--watch [--debounce S] [--settle S]]
+    #                         [--metrics [--metrics-file FILE.json|FILE.prom]] [--profile cpu|memory]
+    def option(name, default=None):
+        return sys.argv[sys.argv.index(name) + 1] if name in sys.argv[2:-1] else default
+
     if len(sys.argv) > 1:
         folder_process = Path(sys.argv[1])
-        file_sorter = FileSorter(folder_process)
-        file_sorter.core()
+        if {'--metrics', '--metrics-file', '--profile'} & set(sys.argv[2:]):
+            METRICS.enable(option('--profile'))
+        workers = int(option('--workers', workers or 0)) or None
+        extractor = ArchiveExtractor(int(option('--max-archive-size', 10240)) << 20,
+                                     int(option('--max-archive-files', 100000)),
+                                     int(option('--max-ratio', 200)))
+        file_sorter = FileSorter(folder_process, workers, '--incremental' in sys.argv[2:], option('--dedup'),
+                                 option('--config'), '--sort-archives' in sys.argv[2:], extractor)
+        if '--watch' in sys.argv[2:]:
+            watch_folder(file_sorter, float(option('--debounce', 1.0)), float(option('--settle', 2.0)))
+        else:
+            file_sorter.core('--dry-run' in sys.argv[2:], '--rollback' in sys.argv[2:])
+        print(file_sorter.report())
+        if METRICS.enabled:
+            print(METRICS.summary())
+            if option('--metrics-file'):
+                METRICS.export(option('--metrics-file'))
 
 if __name__ == "__main__":
     start()
\ No newline at end of file
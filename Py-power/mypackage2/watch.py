@@ -0,0 +1,193 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from pathlib import Path
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    # Спостереження через inotify (лише Linux, через ctypes); кожна папка поза папками категорій має власний watch
+    def __init__(self, root, skip):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.add_watch = libc.inotify_add_watch
+        self.add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.root = root
+        self.skip = skip
+        self.folders = {}
+        self.watch_tree(root)
+
+    def watch(self, folder):
+        descriptor = self.add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if descriptor < 0:
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {folder}')
+        self.folders[descriptor] = folder
+
+    def watch_tree(self, folder):
+        # Повертає файли, які вже були в новій папці до того, як на неї поставлено watch
+        found = []
+        stack = [folder]
+        while stack:
+            current = stack.pop()
+            try:
+                self.watch(current)
+                entries = list(os.scandir(current))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            for entry in entries:
+                if entry.is_dir():
+                    if entry.name not in self.skip:
+                        stack.append(current / entry.name)
+                elif entry.name not in self.skip:
+                    found.append(current / entry.name)
+        return found
+
+    def changes(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        changed = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                descriptor, mask, cookie, length = EVENT.unpack_from(data, offset)
+                name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b'\0')
+                offset += EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    # Черга подій переповнилась: дерево переглядається заново
+                    changed.extend(self.watch_tree(self.root))
+                    continue
+                if mask & IN_IGNORED:
+                    self.folders.pop(descriptor, None)
+                    continue
+                folder = self.folders.get(descriptor)
+                name = os.fsdecode(name)
+                if folder is None or not name or name in self.skip:
+                    continue
+                if mask & IN_ISDIR:
+                    changed.extend(self.watch_tree(folder / name))
+                else:
+                    changed.append(folder / name)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    # Запасний варіант без inotify: перечитуються лише папки, час зміни яких змінився з минулого опитування
+    def __init__(self, root, skip, interval=2.0):
+        self.root = root
+        self.skip = skip
+        self.interval = interval
+        self.folders = {}
+        self.poll()
+
+    def poll(self):
+        changed = []
+        seen = set()
+        stack = [self.root]
+        while stack:
+            current = stack.pop()
+            try:
+                mtime = os.stat(current).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            seen.add(current)
+            known = self.folders.get(current)
+            if known is not None and known[0] == mtime:
+                stack.extend(current / name for name in known[1])
+                continue
+            subfolders, files = [], set()
+            try:
+                entries = list(os.scandir(current))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.name in self.skip:
+                    continue
+                if entry.is_dir():
+                    subfolders.append(entry.name)
+                    stack.append(current / entry.name)
+                else:
+                    files.add(entry.name)
+                    if known is None or entry.name not in known[2]:
+                        changed.append(current / entry.name)
+            self.folders[current] = (mtime, subfolders, files)
+        for folder in set(self.folders) - seen:
+            del self.folders[folder]
+        return changed
+
+    def changes(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        return self.poll()
+
+    def close(self):
+        pass
+
+
+def open_watcher(root, skip):
+    try:
+        return InotifyWatcher(root, skip)
+    except (OSError, AttributeError, TypeError):
+        return PollingWatcher(root, skip)
+
+
+def watch_folder(sorter, debounce=1.0, settle=2.0, report=print):
+    # Події збираються в словник очікування, тож серія подій для одного файлу дає одне переміщення.
+    # Файл переміщується, коли його розмір і час зміни не змінювались протягом settle секунд
+    skip = {*sorter.category_folders, sorter.MANIFEST_NAME, sorter.JOURNAL_NAME}
+    watcher = open_watcher(Path(sorter.source_folder), skip)
+    pending = {}
+    try:
+        # Спершу сортується те, що вже лежить у папці; файли, що з'являться під час цього, побачить watcher
+        sorter.core()
+        report(f'Watching {sorter.source_folder} ({type(watcher).__name__}), press Ctrl+C to stop.')
+        while True:
+            now = time.monotonic()
+            for path in watcher.changes(debounce):
+                pending[path] = (None, now)
+            now = time.monotonic()
+            ready = []
+            for path, (state, changed) in list(pending.items()):
+                if now - changed < debounce:
+                    continue
+                try:
+                    info = path.stat()
+                except FileNotFoundError:
+                    del pending[path]
+                    continue
+                current = (info.st_size, info.st_mtime_ns)
+                if current != state:
+                    pending[path] = (current, now)
+                elif now - changed >= settle:
+                    ready.append(path)
+                    del pending[path]
+            if ready:
+                # Помилка однієї пачки (файл зник, немає прав) не зупиняє спостереження
+                try:
+                    sorter.sort_paths(ready)
+                except OSError as error:
+                    report(f'Could not sort {len(ready)} new files: {error}')
+                else:
+                    report(f'Sorted {len(ready)} new files.')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
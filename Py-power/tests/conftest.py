@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Модулі mypackage2 імпортують один одного напряму (from index import ...), як під час запуску main.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'mypackage2'))
@@ -0,0 +1,87 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from test import ArchiveExtractor
+
+
+def make_zip(path, members):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(zipfile.ZipInfo(name), data, zipfile.ZIP_DEFLATED)
+    return path
+
+
+def make_tar(path, members):
+    with tarfile.open(path, 'w:gz') as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return path
+
+
+def extract(extractor, archive, tmp_path):
+    folder = tmp_path / 'out' / 'archive'
+    result = extractor.extract(str(archive), str(folder))
+    assert not folder.with_name('archive.part').exists()
+    return result, folder
+
+
+def assert_rejected(result, folder, message):
+    unpacked, error, size = result
+    assert not unpacked
+    assert message in error
+    assert not folder.exists()
+
+
+def test_total_size_limit(tmp_path):
+    archive = make_zip(tmp_path / 'big.zip', {'a.bin': bytes(range(256)) * 4})
+    result, folder = extract(ArchiveExtractor(max_total_size=1000), archive, tmp_path)
+    assert_rejected(result, folder, 'more than 1000 bytes unpacked')
+
+
+def test_file_count_limit(tmp_path):
+    archive = make_zip(tmp_path / 'many.zip', {f'{number}.txt': b'x' for number in range(3)})
+    result, folder = extract(ArchiveExtractor(max_files=2), archive, tmp_path)
+    assert_rejected(result, folder, 'more than 2 files')
+
+
+@pytest.mark.parametrize('make, name', [(make_zip, 'bomb.zip'), (make_tar, 'bomb.tar.gz')])
+def test_compression_ratio_limit(tmp_path, make, name):
+    # Нулі стискаються приблизно в тисячу разів; для zip спрацьовує заявлений розмір, для tar - фактичний
+    archive = make(tmp_path / name, {'zeros.bin': bytes(4 << 20)})
+    result, folder = extract(ArchiveExtractor(max_ratio=100), archive, tmp_path)
+    assert_rejected(result, folder, 'exceeds compression ratio 100')
+
+
+def test_small_archives_are_not_rejected_for_ratio(tmp_path):
+    archive = make_zip(tmp_path / 'text.zip', {'zeros.txt': bytes(100000)})
+    (unpacked, error, size), folder = extract(ArchiveExtractor(max_ratio=2), archive, tmp_path)
+    assert unpacked and size == 100000
+
+
+@pytest.mark.parametrize('make, name', [(make_zip, 'evil.zip'), (make_tar, 'evil.tar.gz')])
+def test_path_traversal_stays_inside_folder(tmp_path, make, name):
+    members = {'../escaped.txt': b'1', '/absolute.txt': b'2', 'inner/../../../up.txt': b'3', 'ok/file.txt': b'4'}
+    archive = make(tmp_path / name, members)
+    (unpacked, error, size), folder = extract(ArchiveExtractor(), archive, tmp_path)
+    assert unpacked, error
+    inside = sorted(path.relative_to(folder).as_posix() for path in folder.rglob('*') if path.is_file())
+    assert inside == ['absolute.txt', 'escaped.txt', 'inner/up.txt', 'ok/file.txt']
+    assert len(list(tmp_path.rglob('*.txt'))) == len(members)
+
+
+def test_tar_links_are_not_extracted(tmp_path):
+    archive = tmp_path / 'links.tar'
+    with tarfile.open(archive, 'w') as tar_file:
+        for kind, name in ((tarfile.SYMTYPE, 'outside'), (tarfile.LNKTYPE, 'hard')):
+            info = tarfile.TarInfo(name)
+            info.type = kind
+            info.linkname = '/etc/passwd'
+            tar_file.addfile(info)
+    (unpacked, error, size), folder = extract(ArchiveExtractor(), archive, tmp_path)
+    assert unpacked
+    assert list(folder.iterdir()) == []
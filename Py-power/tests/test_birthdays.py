@@ -0,0 +1,51 @@
+from datetime import date
+
+import pytest
+
+from index import birthday_window
+from main import BotAssist, SqliteBotAssist
+
+CONTACTS = [
+    ('Ivan', '1990-12-30'),
+    ('Olena', '1991-01-02'),
+    ('Bob', '2000-02-29'),
+    ('Taras', '1985-03-01'),
+    ('Maria', '1970-07-15'),
+]
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def assistant(request, tmp_path):
+    assistant = BotAssist() if request.param == 'memory' else SqliteBotAssist(tmp_path / 'assistant.db')
+    for name, birthday in CONTACTS:
+        assistant.add_contact(name, 'Kyiv', '0501234567', f'{name.lower()}@example.com', birthday)
+    yield assistant
+    assistant.close()
+
+
+def upcoming(assistant, days, today):
+    return [contact.name for contact in assistant.search_contacts_birthday(days, today)]
+
+
+def test_window_across_new_year(assistant):
+    assert upcoming(assistant, 7, date(2023, 12, 28)) == ['Ivan', 'Olena']
+    assert birthday_window(7, date(2023, 12, 28)) == [(1228, 1231), (101, 104)]
+
+
+def test_february_29_in_non_leap_year(assistant):
+    # У невисокосний рік такий день народження припадає на 28 лютого
+    assert upcoming(assistant, 0, date(2023, 2, 28)) == ['Bob']
+    assert upcoming(assistant, 1, date(2023, 2, 27)) == ['Bob']
+    assert upcoming(assistant, 0, date(2024, 2, 28)) == []
+    assert upcoming(assistant, 1, date(2024, 2, 28)) == ['Bob']
+    assert upcoming(assistant, 1, date(2023, 2, 28)) == ['Bob', 'Taras']
+
+
+def test_empty_range(assistant):
+    assert upcoming(assistant, -1, date(2023, 7, 15)) == []
+    assert upcoming(assistant, 10, date(2023, 4, 1)) == []
+    assert upcoming(assistant, 0, date(2023, 7, 15)) == ['Maria']
+
+
+def test_whole_year_starts_today(assistant):
+    assert upcoming(assistant, 365, date(2023, 3, 1)) == ['Taras', 'Maria', 'Ivan', 'Olena', 'Bob']
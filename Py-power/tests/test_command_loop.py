@@ -0,0 +1,54 @@
+import asyncio
+import threading
+
+import main
+from main import BotAssist, command_loop, running_sort
+
+
+def test_running_sort_finds_same_and_nested_folders(tmp_path):
+    tasks = {f'sort {tmp_path / "a"}': None, 'save': None}
+    assert running_sort(tasks, tmp_path / 'a') == tmp_path / 'a'
+    assert running_sort(tasks, tmp_path / 'a' / 'b') == tmp_path / 'a'
+    assert running_sort(tasks, tmp_path) == tmp_path / 'a'
+    assert running_sort(tasks, tmp_path / 'ab') is None
+
+
+def test_second_sort_of_the_same_folder_is_refused(tmp_path, monkeypatch, capsys):
+    folder = tmp_path.resolve() / 'downloads'
+    folder.mkdir()
+    (tmp_path / 'link').symlink_to(folder)
+    release = threading.Event()
+    started = []
+
+    class BlockingSorter:
+        # Сортування триває, доки користувач не введе exit
+        def __init__(self, folder):
+            self.folder = folder
+
+        def core(self):
+            started.append(self.folder)
+            release.wait(10)
+
+        def progress(self):
+            return 0, 0
+
+        def report(self):
+            return ''
+
+    answers = iter(['sort', str(folder), '', 'sort', str(tmp_path / 'link'), 'sort', str(folder / 'sub'),
+                    'sort', str(tmp_path / 'other'), '', 'exit'])
+
+    async def ask(prompt):
+        await asyncio.sleep(0)
+        answer = next(answers)
+        if answer == 'exit':
+            release.set()
+        return answer
+
+    assistant = BotAssist()
+    monkeypatch.setattr(assistant, 'file_sorter', lambda path, workers=None: BlockingSorter(path))
+    monkeypatch.setattr(main, 'ask', ask)
+    asyncio.run(command_loop(assistant))
+
+    assert started == [folder, tmp_path.resolve() / 'other']
+    assert capsys.readouterr().out.count(f'{folder} is still being sorted') == 2
@@ -0,0 +1,252 @@
+import os
+import re
+import threading
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from test import ArchiveExtractor, Deduplicator, FileSorter, NameNormalizer, SortJournal, UniqueNames
+
+
+def test_recover_removes_partial_extract_folder_and_copy(tmp_path):
+    (tmp_path / 'archives' / 'a.part' / 'inner').mkdir(parents=True)
+    (tmp_path / 'archives' / 'a.part' / 'inner' / 'file.txt').write_text('half extracted')
+    (tmp_path / 'documents').mkdir()
+    (tmp_path / 'documents' / 'b.txt.part').write_text('half copied')
+    journal = SortJournal(tmp_path / FileSorter.JOURNAL_NAME)
+    journal.plan('extract', 'a.zip', 'archives/a')
+    journal.plan('move', 'b.txt', 'documents/b.txt')
+    journal.sync()
+
+    FileSorter(tmp_path).core()
+
+    assert not (tmp_path / 'archives' / 'a.part').exists()
+    assert not (tmp_path / 'documents' / 'b.txt.part').exists()
+    assert not (tmp_path / FileSorter.JOURNAL_NAME).exists()
+
+
+def test_parallel_sort_from_background_thread(tmp_path):
+    with zipfile.ZipFile(tmp_path / 'photos.zip', 'w') as archive:
+        archive.writestr('photo.txt', 'inside')
+    (tmp_path / 'notes.txt').write_text('outside')
+    sorter = FileSorter(tmp_path, workers=2)
+    contexts = []
+    thread = threading.Thread(target=lambda: (contexts.append(sorter.process_context()), sorter.core()))
+    thread.start()
+    thread.join(60)
+
+    assert not thread.is_alive()
+    assert contexts[0].get_start_method() == 'spawn'
+    assert FileSorter.process_context() is None
+    assert (tmp_path / 'archives' / 'photos' / 'photo.txt').read_text() == 'inside'
+
+
+class CrashingSorter(FileSorter):
+    # Сортування обривається на файлі crash.xyz (категорія others - остання в пачці)
+    def move_file(self, file_name, target):
+        if file_name.name == 'crash.xyz':
+            raise OSError('disk unplugged')
+        return super().move_file(file_name, target)
+
+
+def interrupted_sort(tmp_path):
+    (tmp_path / 'images').mkdir()
+    (tmp_path / 'images' / 'a.jpg').write_text('older')
+    (tmp_path / 'archives' / 'photos').mkdir(parents=True)
+    (tmp_path / 'archives' / 'photos' / 'old_from_last_run.jpg').write_text('last run')
+    with zipfile.ZipFile(tmp_path / 'photos.zip', 'w') as archive:
+        archive.writestr('new.jpg', 'from zip')
+    (tmp_path / 'a.jpg').write_text('newer')
+    (tmp_path / 'crash.xyz').write_text('')
+    with pytest.raises(OSError):
+        CrashingSorter(tmp_path).core()
+    assert (tmp_path / 'images' / 'a_1.jpg').read_text() == 'newer'
+    assert (tmp_path / 'archives' / 'photos_1' / 'new.jpg').read_text() == 'from zip'
+
+
+def assert_rolled_back(tmp_path):
+    assert (tmp_path / 'a.jpg').read_text() == 'newer'
+    assert (tmp_path / 'images' / 'a.jpg').read_text() == 'older'
+    assert not (tmp_path / 'images' / 'a_1.jpg').exists()
+    assert (tmp_path / 'archives' / 'photos' / 'old_from_last_run.jpg').read_text() == 'last run'
+    assert not (tmp_path / 'archives' / 'photos_1').exists()
+    assert (tmp_path / 'photos.zip').exists()
+    assert not (tmp_path / FileSorter.JOURNAL_NAME).exists()
+
+
+def test_rollback_of_interrupted_sort_keeps_older_files(tmp_path):
+    interrupted_sort(tmp_path)
+    FileSorter(tmp_path).core(rollback=True)
+    assert_rolled_back(tmp_path)
+
+
+def test_rollback_without_done_records(tmp_path):
+    # Позначки про виконання загубились (збій живлення): відкат покладається на заплановані шляхи
+    interrupted_sort(tmp_path)
+    journal = tmp_path / FileSorter.JOURNAL_NAME
+    lines = journal.read_text(encoding='utf-8').splitlines(keepends=True)
+    journal.write_text(''.join(line for line in lines if line.startswith('["plan"')), encoding='utf-8')
+    FileSorter(tmp_path).core(rollback=True)
+    assert_rolled_back(tmp_path)
+
+
+def test_dry_run_leaves_interrupted_run_and_shows_final_names(tmp_path, capsys):
+    (tmp_path / 'images').mkdir()
+    (tmp_path / 'images' / 'a.jpg').write_text('older')
+    (tmp_path / 'a.jpg').write_text('newer')
+    (tmp_path / 'images' / 'b.jpg.part').write_text('half copied')
+    journal = SortJournal(tmp_path / FileSorter.JOURNAL_NAME)
+    journal.plan('move', 'b.jpg', 'images/b.jpg')
+    journal.sync()
+
+    FileSorter(tmp_path).core(dry_run=True)
+
+    output = capsys.readouterr().out
+    assert FileSorter.JOURNAL_NAME in output
+    assert 'move: a.jpg -> images/a_1.jpg' in output
+    assert (tmp_path / 'images' / 'b.jpg.part').exists()
+    assert (tmp_path / FileSorter.JOURNAL_NAME).exists()
+    assert (tmp_path / 'a.jpg').read_text() == 'newer'
+
+
+class CountingExtractor(ArchiveExtractor):
+    def __init__(self):
+        super().__init__()
+        self.archives = []
+
+    def extract(self, file_name, folder_for_file):
+        self.archives.append(Path(file_name).name)
+        return super().extract(file_name, folder_for_file)
+
+
+def incremental_run(folder):
+    extractor = CountingExtractor()
+    sorter = FileSorter(folder, incremental=True, extractor=extractor)
+    sorter.core()
+    return sorter, extractor.archives
+
+
+def test_incremental_run_skips_unchanged_folders_and_files(tmp_path):
+    (tmp_path / 'downloads' / 'old').mkdir(parents=True)
+    (tmp_path / 'downloads' / 'old' / 'broken.zip').write_bytes(b'not a zip')
+    (tmp_path / 'downloads' / 'photo.jpg').write_text('photo')
+
+    sorter, archives = incremental_run(tmp_path)
+    assert archives == ['broken.zip']
+    assert (tmp_path / 'images' / 'photo.jpg').exists()
+    assert (tmp_path / FileSorter.MANIFEST_NAME).exists()
+
+    # Нічого не змінилось: папка з пошкодженим архівом не читається, архів не розпаковується знову
+    sorter, archives = incremental_run(tmp_path)
+    assert archives == []
+    assert 'downloads/old' in sorter.skipped_folders
+
+    # Новий файл у тій самій папці обробляється, а незмінений архів поруч - ні
+    (tmp_path / 'downloads' / 'old' / 'song.mp3').write_text('song')
+    sorter, archives = incremental_run(tmp_path)
+    assert archives == []
+    assert (tmp_path / 'audio' / 'song.mp3').exists()
+
+    # Архів, замінений новою версією (завантаження зазвичай перейменовує готовий файл), пробується знову
+    (tmp_path / 'downloads' / 'old' / 'broken.zip.download').write_bytes(b'still not a zip, but longer')
+    os.replace(tmp_path / 'downloads' / 'old' / 'broken.zip.download', tmp_path / 'downloads' / 'old' / 'broken.zip')
+    sorter, archives = incremental_run(tmp_path)
+    assert archives == ['broken.zip']
+    assert (tmp_path / 'downloads' / 'old' / 'broken.zip').exists()
+
+
+def dedup_folder(tmp_path):
+    (tmp_path / 'images').mkdir()
+    (tmp_path / 'images' / 'a.jpg').write_bytes(b'photo')
+    (tmp_path / 'copy.jpg').write_bytes(b'photo')
+    (tmp_path / 'a.jpg').write_bytes(b'other photo')
+    # Однаковий початок (часткові хеші збігаються), різний кінець
+    head = b'x' * (Deduplicator.PARTIAL_SIZE + 10)
+    (tmp_path / 'big_1.png').write_bytes(head + b'1')
+    (tmp_path / 'big_2.png').write_bytes(head + b'2')
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'big_copy.png').write_bytes(head + b'1')
+
+
+@pytest.mark.parametrize('mode', ['skip', 'hardlink'])
+def test_dedup_keeps_one_copy_and_reports_collisions(tmp_path, mode):
+    dedup_folder(tmp_path)
+    sorter = FileSorter(tmp_path, dedup=mode)
+    sorter.core()
+
+    images = tmp_path / 'images'
+    assert (images / 'a.jpg').read_bytes() == b'photo'
+    assert (images / 'a_1.jpg').read_bytes() == b'other photo'
+    assert (images / 'big_1.png').read_bytes() != (images / 'big_2.png').read_bytes()
+    assert len(sorter.dedup.duplicates) == 2
+    assert sorter.dedup.saved_bytes == len(b'photo') + Deduplicator.PARTIAL_SIZE + 11
+    assert 'name collision' in sorter.report() and 'a_1.jpg (a.jpg already exists)' in sorter.report()
+    assert not (tmp_path / 'copy.jpg').exists() and not (tmp_path / 'sub').exists()
+    names = sorted(path.name for path in images.iterdir())
+    if mode == 'skip':
+        assert names == ['a.jpg', 'a_1.jpg', 'big_1.png', 'big_2.png']
+    else:
+        assert names == ['a.jpg', 'a_1.jpg', 'big_1.png', 'big_2.png', 'big_copy.png', 'copy.jpg']
+        assert (images / 'copy.jpg').samefile(images / 'a.jpg')
+        assert (images / 'big_copy.png').samefile(images / 'big_1.png')
+
+
+@pytest.mark.parametrize('name, normalized', [
+    ('Київ фото.jpg', 'Kijiv_foto.jpg'),
+    ('José Ñúñez.png', 'Jose_Nunez.png'),
+    ('Straße.txt', 'Strasse.txt'),
+    ('Αθήνα.pdf', 'Athina.pdf'),
+    ('Łódź.doc', 'Lodz.doc'),
+    ('weird name!.tar.gz', 'weird_name_.tar.gz'),
+    ('日本.txt', '__.txt'),
+    ('plain_name-1.txt', 'plain_name_1.txt'),
+])
+def test_normalize(name, normalized):
+    assert FileSorter.normalize(name) == normalized
+
+
+def test_normalize_caches_repeated_names():
+    normalizer = NameNormalizer(FileSorter.MAP, cache_size=2)
+    for _ in range(3):
+        assert normalizer.normalize('Фото.jpg') == 'Foto.jpg'
+    info = normalizer.normalize.cache_info()
+    assert (info.hits, info.misses, info.maxsize) == (2, 1, 2)
+
+
+def test_unique_names_skip_existing_and_reserved_names(tmp_path):
+    (tmp_path / 'a.jpg').write_text('')
+    (tmp_path / 'a_2.jpg').write_text('')
+    names = UniqueNames()
+    assert [names.reserve(tmp_path / 'a.jpg').name for _ in range(3)] == ['a_1.jpg', 'a_3.jpg', 'a_4.jpg']
+    assert names.reserve(tmp_path / 'b.jpg').name == 'b.jpg'
+    assert names.reserve(tmp_path / 'new' / 'a.jpg').name == 'a.jpg'
+
+
+def test_config_adds_categories_and_extensions(tmp_path):
+    config = tmp_path / 'categories.json'
+    config.write_text('{"books": ["EPUB", ".fb2"], "images": ["raw"]}', encoding='utf-8')
+    (tmp_path / 'novel.epub').write_text('')
+    (tmp_path / 'story.FB2').write_text('')
+    (tmp_path / 'shot.RAW').write_text('')
+    FileSorter(tmp_path, config=config).core()
+    assert sorted(path.name for path in (tmp_path / 'books').iterdir()) == ['novel.epub', 'story.FB2']
+    assert (tmp_path / 'images' / 'shot.RAW').exists()
+
+
+@pytest.mark.parametrize('text, message', [
+    ('{"books": "EPUB"}', "'books' must be a list of extensions, not str"),
+    ('{"books": ["EPUB", 3]}', "'books' has an invalid extension 3"),
+    ('{"books": ["EP UB"]}', "'books' has an invalid extension 'EP UB'"),
+    ('{"../books": ["EPUB"]}', "'../books' is not a valid category folder name"),
+    ('{".hidden": ["EPUB"]}', "'.hidden' is not a valid category folder name"),
+    ('{"": ["EPUB"]}', "'' is not a valid category folder name"),
+    ('{"books": ["EPUB"], "ebooks": [".epub"]}', "'.epub' is listed in both 'books' and 'ebooks'"),
+    ('["EPUB"]', 'expected an object'),
+    ('{"books": [', 'invalid JSON'),
+])
+def test_invalid_config_is_rejected_with_the_bad_key(tmp_path, text, message):
+    config = tmp_path / 'categories.json'
+    config.write_text(text, encoding='utf-8')
+    with pytest.raises(ValueError, match=re.escape(message)):
+        FileSorter(tmp_path, config=config)
@@ -0,0 +1,76 @@
+import pytest
+
+from main import BotAssist, SqliteBotAssist
+
+CONTACTS = [
+    ('Ivan Petrenko', 'Kyiv, Khreshchatyk 1', '0501234567', 'ivan@example.com', '1990-01-01'),
+    ('Олена Шевченко', 'Lviv, Rynok 5', '0507654321', 'olena@example.com', '1991-02-02'),
+    ('Bob Smith', 'London', '0931112233', 'bob@mail.com', '1985-03-03'),
+    ('Taras Kovalenko', 'Odesa', '0671234567', 'taras@ukr.net', '1970-04-04'),
+]
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def assistant(request, tmp_path):
+    assistant = BotAssist() if request.param == 'memory' else SqliteBotAssist(tmp_path / 'assistant.db')
+    for contact in CONTACTS:
+        assistant.add_contact(*contact)
+    yield assistant
+    assistant.close()
+
+
+def best_match(assistant, query):
+    results = assistant.fuzzy_search_contacts(query)
+    return results[0][0].name if results else None
+
+
+@pytest.mark.parametrize('query, name', [
+    ('ivna', 'Ivan Petrenko'),
+    ('Bbo', 'Bob Smith'),
+    ('Tras', 'Taras Kovalenko'),
+    ('Olna', 'Олена Шевченко'),
+])
+def test_typo_in_first_name(assistant, query, name):
+    assert best_match(assistant, query) == name
+
+
+@pytest.mark.parametrize('query, name', [
+    ('Petrneko', 'Ivan Petrenko'),
+    ('Shevcenko', 'Олена Шевченко'),
+    ('Kovlaenko', 'Taras Kovalenko'),
+    ('Smiht', 'Bob Smith'),
+])
+def test_typo_in_surname(assistant, query, name):
+    assert best_match(assistant, query) == name
+
+
+def test_typos_in_full_name_and_transliteration(assistant):
+    assert best_match(assistant, 'olna shevchneko') == 'Олена Шевченко'
+    assert best_match(assistant, 'Ivan Petrneko') == 'Ivan Petrenko'
+    assert best_match(assistant, 'Шевченко') == 'Олена Шевченко'
+
+
+def test_did_you_mean_when_prefix_search_finds_nothing(assistant):
+    # Команда 5 пропонує нечіткі збіги, коли пошук за початком імені порожній
+    assert assistant.search_contacts('ivnn') == []
+    assert best_match(assistant, 'ivnn') == 'Ivan Petrenko'
+
+
+def test_edited_and_deleted_contacts(assistant):
+    assistant.fuzzy_search_contacts('ivan')
+    assistant.edit_contact('Ivan Petrenko', 'Ivan Sydorenko', 'Kyiv', '0501234567', 'ivan@example.com', '1990-01-01')
+    assert best_match(assistant, 'Sydornko') == 'Ivan Sydorenko'
+    assert best_match(assistant, 'Petrneko') != 'Ivan Petrenko'
+    assistant.delete_contact('Bob Smith')
+    assert best_match(assistant, 'Bbo') is None
+
+
+def test_accented_names_match_plain_spelling(assistant):
+    # Літери з діакритикою згортаються так само, як у назвах файлів, тож збіг точний, а не лише схожий
+    assistant.add_contact('José Álvarez', 'Madrid', '0991234567', 'jose@example.es', '1980-05-05')
+    assistant.add_contact('Zoë Müller', 'Berlin', '0997654321', 'zoe@example.de', '1982-06-06')
+    for query, name in [('Jose Alvarez', 'José Álvarez'), ('alvarez', 'José Álvarez'), ('Zoe Muller', 'Zoë Müller')]:
+        contact, score = assistant.fuzzy_search_contacts(query)[0]
+        assert (contact.name, score) == (name, pytest.approx(1.0))
+    contact, score = assistant.fuzzy_search_contacts('Ivån')[0]
+    assert (contact.name, score) == ('Ivan Petrenko', pytest.approx(1.0))
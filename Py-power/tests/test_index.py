@@ -0,0 +1,87 @@
+import pytest
+
+from index import ContactIndex, ItemList, NoteTextIndex
+from main import BotAssist, SqliteBotAssist
+
+
+class Contact:
+    def __init__(self, name, birthday='2000-01-01'):
+        self.name = name
+        self.birthday = birthday
+
+
+def test_sorted_index_reclaims_removed_items():
+    index = ContactIndex()
+    kept = [Contact(f'Kept {number}') for number in range(1500)]
+    index.add_many(kept)
+    for round_number in range(5):
+        churn = [Contact(f'Churn {round_number} {number}') for number in range(1500)]
+        index.add_many(churn)
+        for contact in churn:
+            index.remove(contact)
+    prefixes = index.prefixes
+    assert len(prefixes.items) <= 2 * len(kept) + 1000
+    assert prefixes.removed == len(prefixes.items) - len(kept)
+    assert index.search('kept 149') == [kept[149]] + kept[1490:1500]
+    assert index.search('churn') == []
+
+
+def test_item_list_keeps_order_after_removal():
+    contacts = [Contact(name) for name in ('a', 'b', 'c', 'd')]
+    items = ItemList(contacts[:2])
+    items.extend(contacts[2:])
+    items.remove(contacts[1])
+    items.append(contacts[1])
+    assert list(items) == [contacts[0], contacts[2], contacts[3], contacts[1]]
+    assert len(items) == 4
+
+
+def note_index():
+    index = NoteTextIndex()
+    index.add_many([
+        ('once', 'buy milk and bread before the weekend trip to the mountains'),
+        ('twice', 'milk the cow, then sell the milk at the market'),
+        ('short', 'milk'),
+        ('other', 'call the plumber about the kitchen sink'),
+    ])
+    return index
+
+
+def test_bm25_ranks_frequent_term_in_short_note_first():
+    index = note_index()
+    assert [name for name, score in index.search('milk')] == ['short', 'twice', 'once']
+    assert [name for name, score in index.search('milk bread')] == ['once']
+    assert index.search('milk plumber') == []
+
+
+def test_or_and_prefix_queries():
+    index = note_index()
+    assert {name for name, score in index.search('plumber OR bread')} == {'other', 'once'}
+    assert {name for name, score in index.search('moun*')} == {'once'}
+    assert {name for name, score in index.search('m*')} == {'once', 'twice', 'short'}
+    assert index.search('moun') == []
+    assert [name for name, score in index.search('milk', limit=1)] == ['short']
+
+
+def test_reindex_after_edit_and_delete():
+    index = note_index()
+    index.add('short', 'plumber phone number')
+    index.remove('twice')
+    assert [name for name, score in index.search('milk')] == ['once']
+    assert {name for name, score in index.search('plumber')} == {'other', 'short'}
+    assert index.search('cow') == []
+    assert index.search('mark*') == []
+    assert 'market' not in index.terms and 'cow' not in index.postings
+
+
+@pytest.mark.parametrize('storage', ['memory', 'sqlite'])
+def test_assistant_text_search_follows_edits(storage, tmp_path):
+    assistant = BotAssist() if storage == 'memory' else SqliteBotAssist(tmp_path / 'assistant.db')
+    assistant.add_note('shopping', 'buy milk')
+    assistant.add_note('repairs', 'call the plumber')
+    assistant.edit_note('shopping', 'buy bread')
+    assistant.delete_note('repairs')
+    assert [name for name, note in assistant.search_notes_text('bread')] == ['shopping']
+    assert assistant.search_notes_text('milk') == []
+    assert assistant.search_notes_text('plumb*') == []
+    assistant.close()
@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from metrics import METRICS, Metrics, timed
+from test import FileSorter
+
+
+@pytest.fixture
+def metrics():
+    METRICS.reset()
+    yield METRICS
+    METRICS.disable()
+    METRICS.reset()
+
+
+@timed('test.operation')
+def operation(fail=False):
+    if fail:
+        raise ValueError('failed')
+    return 'done'
+
+
+def counter(metrics, name, **labels):
+    return metrics.counters.get(Metrics.key(name, labels))
+
+
+def test_disabled_metrics_record_nothing(metrics):
+    assert operation() == 'done'
+    assert metrics.snapshot()['histograms'] == []
+
+
+def test_latency_counts_and_errors(metrics):
+    metrics.enable()
+    operation()
+    with pytest.raises(ValueError):
+        operation(fail=True)
+    histogram = metrics.histograms[Metrics.key('operation_seconds', {'operation': 'test.operation'})]
+    assert histogram.count == 2
+    assert counter(metrics, 'operation_errors_total', operation='test.operation') == 1
+    assert 'test.operation' in metrics.summary()
+
+
+def test_histogram_quantiles():
+    metrics = Metrics()
+    for value in [0.001] * 90 + [0.2] * 10:
+        metrics.observe('latency', value)
+    histogram = metrics.histograms[Metrics.key('latency', {})]
+    assert histogram.quantile(0.5) == 0.001
+    assert histogram.quantile(0.95) == 0.2
+    assert histogram.max == 0.2
+
+
+def test_prometheus_and_json_export(tmp_path):
+    metrics = Metrics()
+    metrics.observe('operation_seconds', 0.003, operation='save')
+    metrics.observe('operation_seconds', 0.7, operation='save')
+    metrics.add('bytes_total', 10, category='say "hi"')
+    metrics.set('rate', 2.5)
+    text = metrics.to_prometheus()
+    assert '# TYPE pypower_operation_seconds histogram' in text
+    assert 'pypower_operation_seconds_bucket{operation="save",le="0.005"} 1' in text
+    assert 'pypower_operation_seconds_bucket{operation="save",le="+Inf"} 2' in text
+    assert 'pypower_operation_seconds_count{operation="save"} 2' in text
+    assert 'pypower_bytes_total{category="say \\"hi\\""} 10' in text
+    assert '# TYPE pypower_rate gauge\npypower_rate 2.5' in text
+
+    metrics.export(tmp_path / 'metrics.json')
+    data = json.loads((tmp_path / 'metrics.json').read_text(encoding='utf-8'))
+    assert data['histograms'][0]['count'] == 2
+    assert data['counters'] == [{'name': 'bytes_total', 'labels': {'category': 'say "hi"'}, 'value': 10}]
+
+
+@pytest.mark.parametrize('mode, header', [('cpu', 'cpu profile'), ('memory', 'memory profile')])
+def test_profile_hook(metrics, mode, header):
+    metrics.enable(mode)
+    operation()
+    assert metrics.profiles['test.operation'].startswith(header)
+
+
+def test_unknown_profile_mode(metrics):
+    with pytest.raises(ValueError):
+        metrics.enable('disk')
+
+
+def test_file_sorter_metrics(metrics, tmp_path):
+    (tmp_path / 'photo.jpg').write_bytes(b'x' * 100)
+    (tmp_path / 'notes.txt').write_bytes(b'y' * 50)
+    metrics.enable()
+    FileSorter(tmp_path).core()
+    assert counter(metrics, 'filesorter_bytes_moved_total', category='images') == 100
+    assert counter(metrics, 'filesorter_bytes_moved_total', category='documents') == 50
+    assert counter(metrics, 'filesorter_folders_scanned_total') == 1
+    assert metrics.gauges[Metrics.key('filesorter_scan_files_per_second', {})] > 0
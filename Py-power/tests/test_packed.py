@@ -0,0 +1,65 @@
+import packed
+from main import BotAssist
+from packed import PackedNotes
+
+
+def saved_assistant(path, *notes):
+    assistant = BotAssist()
+    for name in notes:
+        assistant.add_note(name, f'text of {name}')
+    assistant.save_data(path)
+    loaded = BotAssist()
+    loaded.load_data(path)
+    return loaded
+
+
+def test_note_from_file_deleted_and_added_again(tmp_path):
+    path = tmp_path / 'save.pickle'
+    assistant = saved_assistant(path, 'n', 'm')
+    assert isinstance(assistant.notes, PackedNotes)
+    assistant.delete_note('n')
+    assistant.add_note('n', 'new text')
+    assert len(assistant.notes) == 2
+    assert list(assistant.notes) == ['n', 'm']
+    assert assistant.notes['n'].text == 'new text'
+
+    assistant.save_data(path)
+    reloaded = BotAssist()
+    reloaded.load_data(path)
+    assert len(reloaded.notes) == 2
+    assert sorted(reloaded.notes) == ['m', 'n']
+    assert reloaded.notes['n'].text == 'new text'
+
+
+def test_note_from_file_deleted_added_and_deleted_again(tmp_path):
+    path = tmp_path / 'save.pickle'
+    assistant = saved_assistant(path, 'n')
+    assistant.delete_note('n')
+    assistant.add_note('n', 'new text')
+    assistant.delete_note('n')
+    assert len(assistant.notes) == 0
+    assert list(assistant.notes) == []
+    assert 'n' not in assistant.notes
+
+    assistant.save_data(path)
+    reloaded = BotAssist()
+    reloaded.load_data(path)
+    assert len(reloaded.notes) == 0
+    assert list(reloaded.notes) == []
+
+
+def test_snapshot_read_into_memory_can_be_replaced(tmp_path, monkeypatch):
+    # Так знімок читається у Windows, де відображений у пам'ять файл не можна замінити
+    monkeypatch.setattr(packed, 'MAP_FILES', False)
+    path = tmp_path / 'save.pickle'
+    assistant = BotAssist()
+    assistant.add_contact('Ivan Petrenko', 'Kyiv', '0501234567', 'ivan@example.com', '1990-05-17')
+    assistant.save_data(path)
+    loaded = BotAssist()
+    loaded.load_data(path)
+    assert isinstance(loaded.contacts.packed.map, bytes)
+    loaded.add_contact('Olena Shevchenko', 'Lviv', '0507654321', 'olena@example.com', '1991-02-02')
+    loaded.save_data(path)
+    reloaded = BotAssist()
+    reloaded.load_data(path)
+    assert sorted(contact.name for contact in reloaded.contacts) == ['Ivan Petrenko', 'Olena Shevchenko']
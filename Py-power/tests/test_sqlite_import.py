@@ -0,0 +1,46 @@
+import pytest
+
+from main import SqliteBotAssist
+from sqlite_store import CONTACT_INDEXES
+
+HEADER = 'name,address,phone,email,birthday\n'
+
+
+def index_names(assistant):
+    rows = assistant.store.connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+    return {name for name, in rows}
+
+
+@pytest.fixture
+def assistant(tmp_path):
+    assistant = SqliteBotAssist(tmp_path / 'assistant.db')
+    yield assistant
+    assistant.close()
+
+
+def test_import_rebuilds_indexes(assistant, tmp_path):
+    path = tmp_path / 'contacts.csv'
+    path.write_text(HEADER + ''.join(f'Name{i} Surname,City,050{i:07d},user{i}@mail.com,1990-01-01\n'
+                                     for i in range(500)), encoding='utf-8')
+    assert assistant.import_contacts(path) == (500, [])
+    assert set(CONTACT_INDEXES) <= index_names(assistant)
+    assert [contact.name for contact in assistant.search_contacts('Name499')] == ['Name499 Surname']
+
+
+def test_failed_import_rolls_back(assistant, tmp_path, monkeypatch):
+    assistant.add_contact('Ivan Petrenko', 'Kyiv', '0501234567', 'ivan@example.com', '1990-01-01')
+    assert assistant.fuzzy_search_contacts('ivna')
+    path = tmp_path / 'contacts.csv'
+    path.write_text(HEADER + 'Bob Smith,London,0931112233,bob@mail.com,1985-03-03\n', encoding='utf-8')
+    insert = assistant.store.insert_contacts
+
+    def failing_insert(contacts):
+        insert(contacts)
+        raise OSError('disk full')
+
+    monkeypatch.setattr(assistant.store, 'insert_contacts', failing_insert)
+    with pytest.raises(OSError):
+        assistant.import_contacts(path)
+    assert [contact.name for contact in assistant.contacts] == ['Ivan Petrenko']
+    assert set(CONTACT_INDEXES) <= index_names(assistant)
+    assert [contact.name for contact, score in assistant.fuzzy_search_contacts('Bbo')] != ['Bob Smith']
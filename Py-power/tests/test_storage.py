@@ -0,0 +1,16 @@
+from main import BotAssist
+
+
+def test_journal_record_reaches_file_before_batch_sync(tmp_path):
+    path = tmp_path / 'save.pickle'
+    assistant = BotAssist()
+    assistant.open_journal(path)
+    try:
+        assistant.add_contact('Ivan Petrenko', 'Kyiv', '0501234567', 'ivan@example.com', '1990-05-17')
+        # Журнал ще не закрито і пакет fsync не набрано, проте інший процес уже бачить запис
+        recovered = BotAssist()
+        recovered.open_journal(path)
+        recovered.close()
+        assert [contact.name for contact in recovered.contacts] == ['Ivan Petrenko']
+    finally:
+        assistant.close()
@@ -0,0 +1,58 @@
+import pytest
+
+from main import BotAssist, SqliteBotAssist
+from packed import PackedTagIndex
+
+NOTES = [
+    ('a', 'alpha', ['work', 'urgent']),
+    ('b', 'beta', ['work']),
+    ('c', 'gamma', ['home']),
+]
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'packed'])
+def assistant(request, tmp_path):
+    assistant = SqliteBotAssist(tmp_path / 'assistant.db') if request.param == 'sqlite' else BotAssist()
+    for name, text, tags in NOTES:
+        assistant.add_note(name, text)
+        assistant.add_tags_to_note(name, tags)
+    if request.param == 'packed':
+        # Теги нотаток із знімка читаються з файлу, а зміни після завантаження - з пам'яті
+        assistant.save_data(tmp_path / 'save.pickle')
+        assistant = BotAssist()
+        assistant.load_data(tmp_path / 'save.pickle')
+        assert isinstance(assistant.tag_index, PackedTagIndex)
+    yield assistant
+    assistant.close()
+
+
+def texts(assistant, tags, any_tags=(), exclude=()):
+    return [note.text for note in assistant.search_notes_by_tags(tags, any_tags, exclude)]
+
+
+def test_deleted_note_leaves_tag_queries(assistant):
+    assistant.delete_note('a')
+    assert texts(assistant, ['work']) == ['beta']
+    assert texts(assistant, ['urgent']) == []
+    assert texts(assistant, [], ['urgent', 'home']) == ['gamma']
+    assert texts(assistant, [], exclude=['home']) == ['beta']
+    assert dict(assistant.tag_facets(['work'])) == {'work': 1}
+
+
+def test_replaced_note_gets_only_new_tags(assistant):
+    # Повторний запис нотатки з тією ж назвою (як під час відтворення журналу) скидає її теги
+    assistant.apply_record(('add_note', 'b', 'delta'))
+    assistant.add_tags_to_note('b', ['home'])
+    assert texts(assistant, ['work']) == ['alpha']
+    assert texts(assistant, ['home']) == ['delta', 'gamma']
+    assert texts(assistant, ['home'], exclude=['work']) == ['delta', 'gamma']
+    assert dict(assistant.tag_facets(['home'])) == {'home': 2}
+
+
+def test_deleted_and_recreated_note(assistant):
+    assistant.delete_note('a')
+    assistant.add_note('a', 'epsilon')
+    assert texts(assistant, ['urgent']) == []
+    assert texts(assistant, [], ['work', 'home']) == ['beta', 'gamma']
+    assistant.add_tags_to_note('a', ['urgent'])
+    assert texts(assistant, ['urgent']) == ['epsilon']
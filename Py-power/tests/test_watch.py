@@ -0,0 +1,50 @@
+import shutil
+import threading
+
+from test import FileSorter
+from watch import watch_folder
+
+
+class FlakySorter(FileSorter):
+    # Файл bad.jpg не вдається перемістити
+    def move_file(self, file_name, target):
+        if file_name.name == 'bad.jpg':
+            raise PermissionError(13, 'Permission denied', str(file_name))
+        return super().move_file(file_name, target)
+
+
+def test_watch_follows_changes_in_target_folders(tmp_path):
+    images = tmp_path / 'images'
+    messages = []
+    before_removal = {}
+
+    def step(message):
+        # Кожне повідомлення демона запускає наступну дію користувача
+        messages.append(message)
+        if len(messages) == 1:
+            (tmp_path / 'x.jpg').write_text('x')
+        elif len(messages) == 2:
+            (images / 'y.jpg').write_text('put there by the user')
+            (tmp_path / 'y.jpg').write_text('sorted')
+        elif len(messages) == 3:
+            before_removal.update((path.name, path.read_text()) for path in images.iterdir())
+            shutil.rmtree(images)
+            (tmp_path / 'z.jpg').write_text('z')
+        elif len(messages) == 4:
+            (tmp_path / 'bad.jpg').write_text('bad')
+        elif len(messages) == 5:
+            (tmp_path / 'last.jpg').write_text('last')
+        else:
+            raise KeyboardInterrupt
+
+    thread = threading.Thread(target=watch_folder, args=(FlakySorter(tmp_path), 0.05, 0.1, step), daemon=True)
+    thread.start()
+    thread.join(30)
+
+    assert not thread.is_alive()
+    assert messages[1:] == ['Sorted 1 new files.'] * 3 + [messages[4], 'Sorted 1 new files.']
+    assert messages[4].startswith('Could not sort 1 new files:')
+    assert before_removal == {'x.jpg': 'x', 'y.jpg': 'put there by the user', 'y_1.jpg': 'sorted'}
+    assert sorted(path.name for path in images.iterdir()) == ['last.jpg', 'z.jpg']
+    assert (tmp_path / 'bad.jpg').exists()
+    assert not (tmp_path / FileSorter.JOURNAL_NAME).exists()